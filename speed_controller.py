@@ -1,9 +1,27 @@
 import argparse
+import asyncio
+import atexit
+import bisect
+import contextvars
+import fnmatch
+import functools
+import glob
+import hashlib
 import json
+import math
+import mmap
 import os
 import re
+import shutil
+import signal
+import sqlite3
+import struct
 import subprocess
+import threading
 import time
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
 from pathlib import Path
 from datetime import datetime
 
@@ -26,6 +44,8 @@ DEFAULT_MAX_BITRATE = "24000k"      # 最大码率限制 (应对复杂画面)
 DEFAULT_BUFSIZE = "48000k"          # 缓冲区大小 (建议设为 max_bitrate 的 2 倍)
 DEFAULT_PROFILE = "high"            # H.264 Profile (baseline / main / high)
 DEFAULT_LEVEL = "4.0"               # H.264 Level (影响设备兼容性，4.0兼容性较好)
+DEFAULT_PRESET = "medium"           # x264 preset (ultrafast ... veryslow)。越慢同码率画质越好，编码越久
+DEFAULT_DEADLINE = None             # 截止时间，如 "10:00"：按本机实测速度自动选 preset 与编码遍数，尽量按时完成。None = 不限
 
 # --- [3. 分辨率与画面适配] ---
 # 分辨率可选：
@@ -48,7 +68,14 @@ DEFAULT_RECURSE = False         # True = 批量时自动搜索所有子文件夹
 DEFAULT_SKIP_EXISTING = False   # True = 如果输出文件已存在，则跳过不处理 (防重复)
 DEFAULT_MERGE = False           # True = 合并模式：拼接所有视频后再加速; False = 每个视频单独处理
 DEFAULT_MERGE_ONLY = False      # True = 只合并不加速：仅拼接视频，不做速度处理
+DEFAULT_MERGE_APPEND = False    # True = 只合并模式输出分片 MP4，之后新增的文件直接追加到末尾（原地写入，
+                                #        追加中断时文件损坏，直到下次整体重新合并）; False = 普通 MP4，有变化就整体重新合并
 DEFAULT_DURATION_ONLY = False   # True = 只输出总时长：统计所有视频时长，不做任何处理
+DEFAULT_RESUME = False          # True = 批量/合并模式按文件夹里的任务日志断点续跑（跳过已完成的项）
+DEFAULT_WATCH_INTERVAL = 10.0   # 监视模式：每隔多少秒检查一次文件夹
+DEFAULT_WATCH_SETTLE = 30.0     # 监视模式：文件大小/修改时间连续多少秒不变才视为录制结束
+DEFAULT_LIVE_STEP = 0.2         # 实时模式：录制期间每隔多少秒源时间取一帧（录得越久自动越稀疏）
+DEFAULT_LIVE_IDLE = 15.0        # 实时模式：录制文件连续多少秒没有新数据视为录制结束（也可直接 Ctrl+C 结束）
 
 # --- [5. 日志与杂项] ---
 # 日志设置：
@@ -58,11 +85,66 @@ DEFAULT_DURATION_ONLY = False   # True = 只输出总时长：统计所有视频
 DEFAULT_LOG = "AUTO"
 
 DEFAULT_QUIET = False           # True = 安静模式 (运行时少说话，只报错误)
+DEFAULT_PROGRESS_INTERVAL = 5.0 # 控制台进度/预计剩余时间的刷新间隔（秒）。0 = 不显示
+
+# 进度事件流（JSON-lines，每行一个事件，供看板/脚本实时读取）：
+#   None        : 关闭
+#   "D:\\p.jsonl" : 追加写入该文件
+#   "fd:3"      : 写入已打开的文件描述符 3（由父进程提供的管道）
+DEFAULT_PROGRESS_JSON = None
 
 # --- [6. 自动关机设置] ---
 DEFAULT_SHUTDOWN_ENABLE = False # True = 任务完成后自动关机 (仅Windows有效，慎用！)
 DEFAULT_SHUTDOWN_DELAY = 60     # 自动关机倒计时 (秒)
 
+# --- [7. 采样引擎] ---
+# 采样方式可选：
+#   "auto"     : 加速倍率 >= DEFAULT_KEYFRAME_SPEED 且关键帧够密时只解码关键帧；
+#                >= DEFAULT_SEEK_SPEED 时自动使用关键帧跳读，否则用滤镜链
+#   "filter"   : setpts/fps 滤镜链（逐帧解码全部源视频）
+#   "seek"     : 关键帧索引跳读（只解码包含所需时间点的 GOP，适合超高倍率）
+#   "keyframe" : 只解码关键帧（-skip_frame nokey），每个输出帧取最近的关键帧，适合 GOP 很长的录屏
+DEFAULT_SAMPLER = "auto"
+DEFAULT_SEEK_SPEED = 200.0      # auto 模式下启用跳读的倍率阈值。0 = 永不自动启用
+DEFAULT_KEYFRAME_SPEED = 0      # auto 模式下改为只解码关键帧的倍率阈值（如 500）。0 = 永不自动启用
+DEFAULT_INTERMEDIATE = True     # True = 采样结果先写入无损中间文件，两遍编码都读它（源视频只解码一次）
+
+# --- [8. 并行处理] ---
+DEFAULT_JOBS = 1                # 并行数。单文件/合并模式：把输出切成 N 段并行渲染后无损拼接
+                                #         批量模式：同时处理 N 个文件（CPU 线程平均分配）
+DEFAULT_PROBE_JOBS = 8          # 同时进行的探测数（读取时长等）。网络盘/NAS 上调大可明显加快
+DEFAULT_ASYNC_JOBS = 4          # 异步 API（含任务服务）同时运行的处理任务数，更多的任务排队等待
+DEFAULT_CHUNK_SECONDS = 0       # 分块渲染：每块输出秒数（按 GOP 对齐），完成的块保存在临时目录，
+                                # 中断后再运行只重做缺失的块。0 = 不分块
+CHUNK_GOP_FRAMES = 250          # 分块对齐的 GOP 长度（libx264 默认 keyint）
+
+# 合并模式的处理方式：
+#   "concat"   : 把所有文件当作一段连续视频整体加速（concat 直接读取）
+#   "parallel" : 按时长比例给每个文件分配输出帧数，各文件独立加速（--jobs 个同时进行），最后无损拼接
+DEFAULT_MERGE_STRATEGY = "concat"
+
+# --- [9. 缓存] ---
+# 缓存目录：Windows 为 %LOCALAPPDATA%\HumanLapse，其它系统为 ~/.cache/humanlapse
+# （可用环境变量 HUMANLAPSE_CACHE_DIR 指定）
+DEFAULT_PROBE_CACHE = True          # True = 缓存 ffprobe 结果（按 路径+大小+修改时间 自动失效）
+PROBE_CACHE_MAX_ENTRIES = 200000    # 探测缓存最多保留的条目数，超出按最近使用时间淘汰
+DEFAULT_RENDER_CACHE = True         # True = 渲染结果按“输入内容 + 参数”缓存，同样的素材同样的参数直接复用
+                                    #        （只登记与缓存目录在同一文件系统、能硬链接的输出，不额外占空间）
+RENDER_CACHE_MAX_BYTES = 20 * 1024 ** 3  # 渲染缓存容量上限（字节），超出按最近使用时间淘汰
+DEFAULT_SAMPLE_CACHE = False        # True = 采样结果（无损中间文件）按“输入内容 + 目标时长 + 帧率”缓存，
+                                    #        只改码率/分辨率/适配再渲染时不必重新解码源视频。
+                                    #        缓存的是源分辨率的 FFV1（很占空间），缩放改在每一遍编码里做，
+                                    #        未命中时比不缓存更慢，所以默认关闭（--sample-cache 开启）
+SAMPLE_CACHE_MAX_BYTES = 50 * 1024 ** 3  # 采样缓存容量上限（字节），超出按最近使用时间淘汰
+
+# --- [10. 资源控制（与录制/绘画软件共用一台电脑时）] ---
+DEFAULT_PRIORITY = "normal"     # ffmpeg/ffprobe 的优先级：normal / low（低于正常）/ idle（其它程序空闲时才运行）
+DEFAULT_CPUS = None             # 只用这些 CPU，如 "0-5" 或 "2,3,6-7"。None = 不限
+DEFAULT_THREADS = None          # 每个 ffmpeg 的线程上限："4"（解码/滤镜/编码都不超过 4）或 "2:1:4"（分别指定）。None = 自动
+DEFAULT_ADAPTIVE_LOAD = 0       # 自适应暂停：其它程序的 CPU 占用（占整机比例）超过该值时暂停渲染，
+                                # 降到一半以下时继续。如 0.5。0 = 不启用（仅 Linux）
+ADAPTIVE_INTERVAL = 1.0         # 自适应暂停：检查间隔（秒）
+
 
 FFMPEG = "ffmpeg"
 FFPROBE = "ffprobe"
@@ -86,10 +168,32 @@ def format_hms(seconds: float) -> str:
 
 
 def run_capture(cmd: list[str]) -> str:
-    return subprocess.check_output(cmd, text=True, encoding="utf-8", errors="ignore").strip()
+    """运行命令并返回标准输出（失败抛 CalledProcessError，与 subprocess.check_output 一致）"""
+    proc = spawn_process(cmd, stdout=subprocess.PIPE, text=True, encoding="utf-8", errors="ignore")
+    try:
+        out, _ = proc.communicate()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.returncode != 0:
+        check_cancelled()
+        raise subprocess.CalledProcessError(proc.returncode, cmd, out)
+    return out.strip()
 
 
 def probe_duration_seconds(video_path: str) -> float:
+    # 缓存键带版本：早期版本把开头的空编辑也算进了时长
+    cached = probe_cache_get(video_path, "duration2")
+    if cached is not None:
+        return cached
+
+    # MP4/MOV：直接读 moov 里的时长，不启动 ffprobe（编辑列表读不准时回退）
+    native = read_mp4_info(video_path)
+    if native is not None and native["start_time"] is not None and native["duration"] > 0:
+        probe_cache_put(video_path, "duration2", native["duration"])
+        return native["duration"]
+
     cmd = [
         FFPROBE, "-v", "error",
         "-show_entries", "format=duration",
@@ -101,9 +205,115 @@ def probe_duration_seconds(video_path: str) -> float:
     dur = float(data["format"]["duration"])
     if dur <= 0:
         raise RuntimeError("无法获取视频时长（duration<=0）。")
+    probe_cache_put(video_path, "duration2", dur)
     return dur
 
 
+def probe_video_stream(video_path: str) -> dict:
+    """
+    读取首个视频流的画面信息
+    返回 {"width", "height", "rotation", "start_time", "fps"}
+    width/height 已按旋转角修正（与 ffmpeg 自动旋转后的输出尺寸一致）；fps 读不到时为 None
+    """
+    # 缓存键带版本：早期版本对编辑列表一律记 start_time=0，换键名让这些条目自然淘汰
+    cached = probe_cache_get(video_path, "stream2")
+    if cached is not None:
+        return cached
+
+    native = read_mp4_info(video_path)
+    if native is not None and native["width"] and native["start_time"] is not None:
+        info = {key: native[key] for key in ("width", "height", "rotation", "start_time", "fps")}
+        probe_cache_put(video_path, "stream2", info)
+        return info
+
+    cmd = [
+        FFPROBE, "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,avg_frame_rate:stream_tags=rotate:stream_side_data=rotation:format=start_time",
+        "-of", "json",
+        video_path
+    ]
+    data = json.loads(run_capture(cmd))
+    streams = data.get("streams") or []
+    if not streams:
+        raise RuntimeError("未找到视频流。")
+    st = streams[0]
+    w, h = int(st["width"]), int(st["height"])
+
+    rotation = 0
+    if "rotate" in (st.get("tags") or {}):
+        rotation = int(float(st["tags"]["rotate"]))
+    for side_data in st.get("side_data_list") or []:
+        if "rotation" in side_data:
+            rotation = int(float(side_data["rotation"]))
+    if rotation % 180 != 0:
+        w, h = h, w
+
+    try:
+        start_time = float((data.get("format") or {}).get("start_time", 0.0))
+    except ValueError:
+        start_time = 0.0
+
+    fps = None
+    num, _, den = str(st.get("avg_frame_rate", "")).partition("/")
+    try:
+        if float(num) > 0 and float(den or 1) > 0:
+            fps = float(num) / float(den or 1)
+    except ValueError:
+        pass
+
+    info = {"width": w, "height": h, "rotation": rotation, "start_time": start_time, "fps": fps}
+    probe_cache_put(video_path, "stream2", info)
+    return info
+
+
+def build_keyframe_index(video_path: str, start_time: float = 0.0) -> list[float]:
+    """
+    读取首个视频流所有关键帧的时间点（只解复用，不解码）
+    返回相对文件起点（减去 start_time）的升序秒数列表
+    """
+    cached = probe_cache_get(video_path, "keyframes")
+    if cached is not None:
+        return [t - start_time for t in cached]
+
+    cmd = [
+        FFPROBE, "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_path
+    ]
+    keyframes = []
+    for line in run_capture(cmd).splitlines():
+        # 每行形如 "12.345000,K__"
+        pts, _, flags = line.partition(",")
+        if "K" not in flags:
+            continue
+        try:
+            keyframes.append(float(pts))
+        except ValueError:
+            continue  # pts_time 为 N/A
+    keyframes.sort()
+    probe_cache_put(video_path, "keyframes", keyframes)
+    return [t - start_time for t in keyframes]
+
+
+def probe_frame_count(video_path: str) -> int:
+    """首个视频流的帧数：MP4/MOV 直接读 stsz 的样本数，其它格式用 ffprobe 数包（只解复用，不解码）"""
+    native = read_mp4_frame_count(video_path)
+    if native is not None:
+        return native
+    cmd = [
+        FFPROBE, "-v", "error",
+        "-select_streams", "v:0",
+        "-count_packets",
+        "-show_entries", "stream=nb_read_packets",
+        "-of", "csv=p=0",
+        video_path
+    ]
+    return int(run_capture(cmd).strip().rstrip(","))
+
+
 def parse_duration(s: str) -> float:
     """
     支持：
@@ -166,6 +376,29 @@ def resolve_target_size(res: str | None, size: str | None) -> tuple[int, int] |
     raise ValueError("res 只支持 source/1080p/720p/4k")
 
 
+def parse_rendition(spec: str, default_res: str, default_fit: str) -> dict:
+    """
+    解析一个输出版本：时长[@分辨率][/适配]
+      "30"               -> 30 秒，分辨率/适配用默认值
+      "30@1080p"         -> 30 秒 1080p
+      "1:30@1280x720/crop" -> 90 秒 1280x720 裁剪
+    返回 {"target_seconds", "res", "size", "fit"}
+    """
+    rest, _, fit = spec.partition("/")
+    target, _, res = rest.partition("@")
+    res = res.strip() or default_res
+    size = res if re.fullmatch(r"\d+\s*[xX*]\s*\d+", res) else None
+    rendition = {
+        "target_seconds": parse_duration(target.strip()),
+        "res": "source" if size else res,
+        "size": size,
+        "fit": (fit.strip() or default_fit).lower(),
+    }
+    # 提前校验，避免解码到一半才报错
+    build_scale_filter(resolve_target_size(rendition["res"], rendition["size"]), rendition["fit"])
+    return rendition
+
+
 def build_scale_filter(target_wh: tuple[int, int] | None, fit: str) -> str | None:
     """
     返回 ffmpeg 滤镜片段（不含 setpts/fps）
@@ -373,14 +606,15 @@ def shutdown_windows(delay_seconds: int = 60):
     subprocess.check_call(["shutdown", "/s", "/t", str(delay_seconds)])
 
 
-def make_logger(log_path: Path | None):
+def make_logger(log_path: Path | None, echo: bool = True):
     """
     返回 log(msg) 和 close()
-    log 同时输出到控制台与 txt
+    log 同时输出到控制台与 txt（echo=False 时只写 txt）
     """
     if log_path is None:
         def _log(msg: str):
-            print(msg)
+            if echo:
+                print(msg)
         def _close():
             return
         return _log, _close
@@ -389,7 +623,8 @@ def make_logger(log_path: Path | None):
     f = open(log_path, "w", encoding="utf-8", newline="\n")
 
     def _log(msg: str):
-        print(msg)
+        if echo:
+            print(msg)
         f.write(msg + "\n")
         f.flush()
 
@@ -413,6 +648,11 @@ def compute_output_path(
     return input_path.with_name(f"{input_path.stem}_timelapse_{out_tag}_{res_tag}_PR.mp4")
 
 
+def partial_output_path(output_path: Path) -> Path:
+    """输出先写到这个临时名，完成后再改名为 output_path（中断时不会留下看似完整的半成品）"""
+    return output_path.with_name(f"_temp_out_{output_path.name}")
+
+
 def derive_log_path(log_spec: str | None, output_path: Path) -> Path | None:
     """
     log_spec:
@@ -438,300 +678,3372 @@ def derive_log_path(log_spec: str | None, output_path: Path) -> Path | None:
     return p.parent / (output_path.stem + ".log.txt")
 
 
-# ----------------- 单文件处理（含细分统计+可写日志） -----------------
-def timelapse_one(
-    input_path: Path,
-    target_seconds: float,
-    out_fps: int,
-    target_bitrate: str,
-    max_bitrate: str,
-    bufsize: str,
-    profile: str,
-    level: str,
-    res: str,
-    size: str | None,
-    fit: str,
-    quiet: bool,
-    log_spec: str | None,
-    skip_existing: bool,
-) -> tuple[Path, dict]:
-    """
-    返回 (output_path, stats)
-    stats: probe/filterprep/pass1/pass2/cleanup/total/realtime/speed/dur
-    """
-    if not input_path.exists():
-        raise FileNotFoundError(f"找不到文件：{input_path}")
-
-    t_total0 = now_perf()
-
-    # probe 阶段
-    t0 = now_perf()
-    dur = probe_duration_seconds(str(input_path))
-    t_probe = now_perf() - t0
+# ----------------- MP4/MOV 原生解析 -----------------
+# 普通 MP4/MOV 的时长、分辨率、帧率都在 moov 盒子里，直接读比启动 ffprobe 快得多
+MP4_EXTENSIONS = {".mp4", ".mov", ".m4v"}
 
-    speed = dur / target_seconds  # 自动加速/减速
 
-    # 分辨率滤镜准备阶段
-    t0 = now_perf()
-    target_wh = resolve_target_size(res=res, size=size)
-    scale_part = build_scale_filter(target_wh, fit)  # 可能为 None
-    t_filterprep = now_perf() - t0
+def _iter_boxes(buf, start: int, end: int):
+    """遍历 [start, end) 内的同级 box，产出 (类型, 内容起点, box 终点)"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            (size,) = struct.unpack_from(">Q", buf, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos  # 延伸到文件末尾
+        if size < header or pos + size > end:
+            return  # 截断或损坏
+        yield box_type, pos + header, pos + size
+        pos += size
 
-    output_path = compute_output_path(input_path, target_seconds, target_wh, fit)
 
-    if skip_existing and output_path.exists():
-        # 仍返回 stats，标记 skip
-        return output_path, {
-            "skipped": True,
-            "reason": "output exists",
-            "dur": dur,
-            "speed": speed,
-            "total": 0.0,
-            "realtime": 0.0,
-        }
+def _find_box(buf, start: int, end: int, box_type: bytes) -> tuple[int, int] | None:
+    for t, body, box_end in _iter_boxes(buf, start, end):
+        if t == box_type:
+            return body, box_end
+    return None
 
-    log_path = derive_log_path(log_spec, output_path)
-    log, log_close = make_logger(log_path)
 
-    try:
-        log(f"[信息] 开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        if log_path:
-            log(f"[信息] 日志文件：{log_path}")
+def _read_time_header(buf, body: int) -> tuple[int, int]:
+    """解析 mvhd/mdhd 的 (timescale, duration)"""
+    version = buf[body]
+    if version == 1:
+        return struct.unpack_from(">IQ", buf, body + 4 + 16)
+    return struct.unpack_from(">II", buf, body + 4 + 8)
 
-        # 组滤镜链：setpts + fps + (可选 scale/pad/crop)
-        vf_parts = [f"setpts=PTS/{speed}", f"fps={out_fps}"]
-        if scale_part:
-            vf_parts.append(scale_part)
-        vf = ",".join(vf_parts)
 
-        passlog = str(output_path.with_suffix("")) + "_passlog"
-        null_sink = "NUL" if is_windows() else "/dev/null"
+def _parse_video_trak(buf, start: int, end: int) -> dict | None:
+    """解析视频 trak：编码尺寸、旋转角、平均帧率；不是视频轨返回 None"""
+    mdia = _find_box(buf, start, end, b"mdia")
+    if mdia is None:
+        return None
+    hdlr = _find_box(buf, *mdia, b"hdlr")
+    if hdlr is None or bytes(buf[hdlr[0] + 8:hdlr[0] + 12]) != b"vide":
+        return None
 
-        log(f"[信息] 输入：{input_path}")
-        log(f"[信息] 输入时长：{dur:.2f}s")
-        log(f"[信息] 目标：{target_seconds:.2f}s | 加速倍率：{speed:.2f}x（>1加速，<1减速）")
-        if target_wh is None:
-            log(f"[信息] 分辨率：保持源分辨率")
-        else:
-            log(f"[信息] 分辨率：{target_wh[0]}x{target_wh[1]} | 适配：{fit} | 缩放：lanczos")
-        log(f"[信息] 导出：{out_fps}fps | VBR 2次 | 目标 {target_bitrate} / 最大 {max_bitrate} | {profile}@{level}")
-        log(f"[信息] 输出：{output_path}")
+    info = {"width": 0, "height": 0, "rotation": 0, "fps": None}
 
-        ffmpeg_prefix = [FFMPEG, "-hide_banner"]
-        if quiet:
-            ffmpeg_prefix += ["-loglevel", "error"]
+    # tkhd 的显示矩阵 → 旋转角
+    tkhd = _find_box(buf, start, end, b"tkhd")
+    if tkhd is not None:
+        matrix_at = tkhd[0] + (4 + 32 if buf[tkhd[0]] == 1 else 4 + 20) + 8 + 8
+        a, b = struct.unpack_from(">ii", buf, matrix_at)
+        angle = round(math.degrees(math.atan2(b, a)))
+        info["rotation"] = -angle if angle else 0
 
-        common = [
-            "-vf", vf,
-            "-an",
-            "-map_metadata", "-1",
-            "-map_chapters", "-1",
-            "-c:v", "libx264",
-            "-profile:v", profile,
-            "-level:v", level,
-            "-pix_fmt", "yuv420p",
-            "-b:v", target_bitrate,
-            "-maxrate", max_bitrate,
-            "-bufsize", bufsize,
-            "-passlogfile", passlog
-        ]
+    mdhd = _find_box(buf, *mdia, b"mdhd")
+    minf = _find_box(buf, *mdia, b"minf")
+    stbl = _find_box(buf, *minf, b"stbl") if minf else None
+    if stbl is None:
+        return info
 
-        # Pass 1
-        t0 = now_perf()
-        log("[信息] Pass 1 开始…")
-        cmd1 = ffmpeg_prefix + ["-y", "-i", str(input_path)] + common + [
-            "-pass", "1",
-            "-f", "null", null_sink
-        ]
-        subprocess.check_call(cmd1)
-        t_pass1 = now_perf() - t0
-        log("[信息] Pass 1 完成。")
+    # stsd 第一个视觉样本条目里的编码宽高（即解码输出尺寸）
+    stsd = _find_box(buf, *stbl, b"stsd")
+    if stsd is not None and stsd[1] - stsd[0] >= 8 + 36:
+        entry = stsd[0] + 8
+        info["width"], info["height"] = struct.unpack_from(">HH", buf, entry + 32)
 
-        # Pass 2
-        t0 = now_perf()
-        log("[信息] Pass 2 开始…")
-        cmd2 = ffmpeg_prefix + ["-y", "-i", str(input_path)] + common + [
-            "-pass", "2",
-            "-movflags", "+faststart",
-            str(output_path)
-        ]
-        subprocess.check_call(cmd2)
-        t_pass2 = now_perf() - t0
-        log("[信息] Pass 2 完成。")
+    # stts：总帧数 / 总时长 = 平均帧率
+    stts = _find_box(buf, *stbl, b"stts")
+    if stts is not None and mdhd is not None:
+        timescale, _ = _read_time_header(buf, mdhd[0])
+        (count,) = struct.unpack_from(">I", buf, stts[0] + 4)
+        if count and stts[0] + 8 + count * 8 <= stts[1]:
+            frames = 0
+            ticks = 0
+            for i in range(count):
+                n, delta = struct.unpack_from(">II", buf, stts[0] + 8 + i * 8)
+                frames += n
+                ticks += n * delta
+            if frames and ticks and timescale:
+                info["fps"] = frames * timescale / ticks
 
-        # cleanup
-        t0 = now_perf()
-        for suffix in ["", ".mbtree"]:
-            p = Path(passlog + suffix)
-            if p.exists():
-                try:
-                    p.unlink()
-                except Exception:
-                    pass
-        t_cleanup = now_perf() - t0
+    if info["rotation"] % 180 != 0:
+        info["width"], info["height"] = info["height"], info["width"]
+    return info
 
-        t_total = now_perf() - t_total0
-        realtime = dur / t_total if t_total > 0 else 0.0
 
-        log(f"[统计] probe(读取时长): {format_hms(t_probe)}（{t_probe:.2f}s）")
-        log(f"[统计] filterprep(准备滤镜): {format_hms(t_filterprep)}（{t_filterprep:.2f}s）")
-        log(f"[统计] pass1(第一遍): {format_hms(t_pass1)}（{t_pass1:.2f}s）")
-        log(f"[统计] pass2(第二遍): {format_hms(t_pass2)}（{t_pass2:.2f}s）")
-        log(f"[统计] cleanup(清理log): {format_hms(t_cleanup)}（{t_cleanup:.2f}s）")
-        log(f"[统计] total(总耗时): {format_hms(t_total)}（{t_total:.2f}s）")
-        log(f"[统计] 处理速度：{realtime:.2f}x realtime（输入时长/总耗时）")
+def _track_start_time(buf, start: int, end: int, movie_timescale: int) -> tuple[float, float] | None:
+    """
+    音视频轨的 (空编辑延迟, 起点) 秒数。起点与 ffmpeg 读取时给出的 start_time 一致：
+    编辑列表开头的空编辑（延迟）+ 首个样本的显示时间（ctts 偏移）超出编辑起点 media_time 的部分；
+    早于 media_time 的部分（B 帧重排、AAC 预滚）会被裁掉，不计入
+    不是音视频轨返回 None；编辑列表里有多段、变速等读不准的情况抛 ValueError（由调用方回退到 ffprobe）
+    """
+    mdia = _find_box(buf, start, end, b"mdia")
+    hdlr = _find_box(buf, *mdia, b"hdlr") if mdia else None
+    if hdlr is None or bytes(buf[hdlr[0] + 8:hdlr[0] + 12]) not in (b"vide", b"soun"):
+        return None
+    mdhd = _find_box(buf, *mdia, b"mdhd")
+    timescale, _ = _read_time_header(buf, mdhd[0]) if mdhd else (0, 0)
+    if not timescale:
+        raise ValueError("mdhd 缺失")
 
-        log(f"[完成] 输出：{output_path}")
+    delay = 0  # 空编辑的总时长（影片时间刻度）
+    media_time = 0
+    edts = _find_box(buf, start, end, b"edts")
+    elst = _find_box(buf, *edts, b"elst") if edts else None
+    if elst is not None:
+        version = buf[elst[0]]
+        (count,) = struct.unpack_from(">I", buf, elst[0] + 4)
+        entry_size = 20 if version == 1 else 12
+        edits = []
+        for i in range(count):
+            at = elst[0] + 8 + i * entry_size
+            duration, media = struct.unpack_from(">Qq" if version == 1 else ">Ii", buf, at)
+            rate = struct.unpack_from(">hh", buf, at + entry_size - 4)
+            edits.append((duration, media, rate))
+        while edits and edits[0][1] == -1:
+            delay += edits.pop(0)[0]
+        if len(edits) > 1 or (edits and edits[0][2] != (1, 0)):
+            raise ValueError("编辑列表有多段或变速")
+        if edits:
+            media_time = edits[0][1]
 
-        return output_path, {
-            "skipped": False,
-            "dur": dur,
-            "speed": speed,
-            "probe": t_probe,
-            "filterprep": t_filterprep,
-            "pass1": t_pass1,
-            "pass2": t_pass2,
-            "cleanup": t_cleanup,
-            "total": t_total,
-            "realtime": realtime,
-        }
+    first_pts = 0
+    minf = _find_box(buf, *mdia, b"minf")
+    stbl = _find_box(buf, *minf, b"stbl") if minf else None
+    ctts = _find_box(buf, *stbl, b"ctts") if stbl else None
+    if ctts is not None and struct.unpack_from(">I", buf, ctts[0] + 4)[0]:
+        (first_pts,) = struct.unpack_from(">i" if buf[ctts[0]] == 1 else ">I", buf, ctts[0] + 12)
 
-    finally:
-        log_close()
+    delay_seconds = round(delay * timescale / movie_timescale) / timescale
+    return delay_seconds, delay_seconds + max(0, first_pts - media_time) / timescale
 
 
-# ----------------- 合并模式 -----------------
-def merge_videos(files: list[Path], output_path: Path, quiet: bool, is_temp: bool = True) -> Path:
+def read_mp4_info(video_path: str) -> dict | None:
     """
-    使用 FFmpeg concat 将多个视频拼接成一个文件
-    
-    Args:
-        files: 要合并的视频文件列表
-        output_path: 输出路径（用于确定输出目录和命名）
-        quiet: 是否安静模式
-        is_temp: True=创建临时文件; False=创建最终输出文件
-    
-    Returns:
-        合并后的文件路径
+    纯 Python（mmap）读取 MP4/MOV 的容器信息，不启动 ffprobe
+    返回 {"duration", "width", "height", "rotation", "start_time", "fps"}；
+    非 MP4/MOV、moov 缺失（如录制中断）、分片 MP4 等解析不了的情况返回 None，由调用方回退到 ffprobe
+    start_time 为各音视频轨起点的最小值（同 ffprobe 的 format=start_time）；duration 不含开头的空编辑
+    （同 ffprobe 的 format=duration）。编辑列表读不准时 start_time 为 None，时长也应改用 ffprobe
     """
-    if not files:
-        raise ValueError("没有文件可供合并")
-    
-    # 创建 concat 列表文件
-    concat_list = output_path.parent / f"_concat_list_{int(time.time())}.txt"
+    if Path(video_path).suffix.lower() not in MP4_EXTENSIONS:
+        return None
     try:
-        with open(concat_list, "w", encoding="utf-8") as f:
-            for video in files:
-                # FFmpeg concat 格式：file 'path'
-                # 路径中的单引号需要转义
-                safe_path = str(video.absolute()).replace("'", "'\\''")
-                f.write(f"file '{safe_path}'\n")
-        
-        # 根据 is_temp 决定输出文件名
-        if is_temp:
-            merged_file = output_path.parent / f"_temp_merged_{int(time.time())}.mp4"
-        else:
-            merged_file = output_path
-        
-        print(f"[信息] 正在合并 {len(files)} 个视频...")
-        
-        cmd = [FFMPEG, "-f", "concat", "-safe", "0", "-i", str(concat_list)]
-        if quiet:
-            cmd += ["-loglevel", "error"]
-        cmd += ["-c", "copy", "-y", str(merged_file)]
-        
-        subprocess.check_call(cmd)
-        
-        print(f"[信息] 合并完成：{merged_file}")
-        return merged_file
-        
-    finally:
-        # 清理 concat 列表文件
-        if concat_list.exists():
-            try:
-                concat_list.unlink()
-            except Exception:
-                pass
+        with open(video_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return _parse_mp4(buf)
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
 
 
-def merge_only(
-    folder: Path,
-    pattern: str,
-    recurse: bool,
-    quiet: bool,
-    auto_yes: bool = False,
-) -> Path | None:
+def read_mp4_frame_count(video_path: str) -> int | None:
+    """MP4/MOV 首个视频轨的样本数（stsz）；解析不了返回 None"""
+    if Path(video_path).suffix.lower() not in MP4_EXTENSIONS:
+        return None
+    try:
+        with open(video_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                moov = _find_box(buf, 0, len(buf), b"moov")
+                if moov is None or _find_box(buf, *moov, b"mvex") is not None:
+                    return None
+                for t, body, box_end in _iter_boxes(buf, *moov):
+                    if t != b"trak":
+                        continue
+                    mdia = _find_box(buf, body, box_end, b"mdia")
+                    hdlr = _find_box(buf, *mdia, b"hdlr") if mdia else None
+                    if hdlr is None or bytes(buf[hdlr[0] + 8:hdlr[0] + 12]) != b"vide":
+                        continue
+                    minf = _find_box(buf, *mdia, b"minf")
+                    stbl = _find_box(buf, *minf, b"stbl") if minf else None
+                    stsz = _find_box(buf, *stbl, b"stsz") if stbl else None
+                    if stsz is None:
+                        return None
+                    return struct.unpack_from(">I", buf, stsz[0] + 8)[0]
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
+    return None
+
+
+def _parse_mp4(buf) -> dict | None:
+    moov = _find_box(buf, 0, len(buf), b"moov")
+    if moov is None:
+        return None
+
+    mvhd = _find_box(buf, *moov, b"mvhd")
+    if mvhd is None:
+        return None
+    timescale, duration = _read_time_header(buf, mvhd[0])
+    if not timescale or not duration or _find_box(buf, *moov, b"mvex") is not None:
+        return None  # 分片 MP4：时长在各个 moof 里，交给 ffprobe
+
+    info = {
+        "duration": duration / timescale,
+        "width": 0,
+        "height": 0,
+        "rotation": 0,
+        "start_time": None,
+        "fps": None,
+    }
+    tracks = []
+    has_video = False
+    try:
+        for t, body, box_end in _iter_boxes(buf, *moov):
+            if t != b"trak":
+                continue
+            if not has_video:
+                video = _parse_video_trak(buf, body, box_end)
+                if video is not None:
+                    info.update(video)
+                    has_video = True
+            track = _track_start_time(buf, body, box_end, timescale)
+            if track is not None:
+                tracks.append(track)
+        if tracks:
+            info["duration"] -= min(delay for delay, _ in tracks)
+            info["start_time"] = min(start for _, start in tracks)
+    except ValueError:
+        info["start_time"] = None
+    return info
+
+
+def _parse_traf(buf, start: int, end: int, default_durations: dict[int, int]) -> dict | None:
     """
-    只合并模式：收集所有视频 -> 拼接成一个文件（不做速度处理）
-    
-    Returns:
-        输出文件路径，如果用户取消则返回 None
+    解析 traf：{"track", "base", "duration", "tfdt", "tfdt_version"}
+    tfdt 为 baseMediaDecodeTime 字段的位置；用绝对文件偏移（base_data_offset）的返回 None（不能挪位置）
     """
-    files = collect_files(folder, pattern, recurse)
-    if not files:
-        raise RuntimeError(f"[错误] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
-    
-    print(f"[信息] 只合并模式：找到 {len(files)} 个文件")
-    
-    # 确认文件顺序
-    confirmed_files = confirm_file_order(files, auto_yes)
-    if confirmed_files is None:
+    tfhd = _find_box(buf, start, end, b"tfhd")
+    tfdt = _find_box(buf, start, end, b"tfdt")
+    if tfhd is None or tfdt is None:
         return None
-    
-    # 输出文件名
-    output_name = f"{folder.name}_merged.mp4"
-    output_path = folder / output_name
-    
-    # 合并所有视频（直接输出最终文件）
-    t0 = now_perf()
-    final_output = merge_videos(confirmed_files, output_path, quiet, is_temp=False)
-    t_total = now_perf() - t0
-    
-    print(f"\n[统计] 合并耗时：{format_hms(t_total)}（{t_total:.2f}s）")
-    print(f"[完成] 只合并模式输出：{final_output}")
-    
-    return final_output
+    flags = int.from_bytes(buf[tfhd[0] + 1:tfhd[0] + 4], "big")
+    if flags & 0x1:
+        return None
+    (track_id,) = struct.unpack_from(">I", buf, tfhd[0] + 4)
+    default = default_durations.get(track_id, 0)
+    if flags & 0x8:
+        (default,) = struct.unpack_from(">I", buf, tfhd[0] + 8 + (4 if flags & 0x2 else 0))
+    version = buf[tfdt[0]]
+    (base,) = struct.unpack_from(">Q" if version == 1 else ">I", buf, tfdt[0] + 4)
+
+    duration = 0
+    for t, body, _ in _iter_boxes(buf, start, end):
+        if t != b"trun":
+            continue
+        tflags = int.from_bytes(buf[body + 1:body + 4], "big")
+        (count,) = struct.unpack_from(">I", buf, body + 4)
+        if not tflags & 0x100:
+            duration += count * default
+            continue
+        # 每个样本依次是 duration/size/flags/cto（各自按标志位出现）
+        pos = body + 8 + (4 if tflags & 0x1 else 0) + (4 if tflags & 0x4 else 0)
+        stride = 4 * bin(tflags & 0xF00).count("1")
+        duration += sum(struct.unpack_from(">I", buf, pos + i * stride)[0] for i in range(count))
+    return {"track": track_id, "base": base, "duration": duration, "tfdt": tfdt[0] + 4, "tfdt_version": version}
 
 
-def duration_only(
-    folder: Path,
-    pattern: str,
-    recurse: bool,
-) -> tuple[float, int]:
+def _stsd_digest(buf, stsd: tuple[int, int], handler: bytes) -> str:
     """
-    只输出总时长模式：统计所有视频的总时长（不做任何处理）
-    
-    Returns:
-        (总时长秒数, 文件数量)
+    样本描述（编码参数）的摘要，用来判断两个文件能否直接拼接
+    跳过 btrt（码率统计，每个文件都不一样，与解码无关），其余字节（avcC 等）都要一致
     """
-    files = collect_files(folder, pattern, recurse)
-    if not files:
-        print(f"[信息] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
-        return 0.0, 0
-    
-    print(f"[信息] 只输出总时长模式：找到 {len(files)} 个文件")
-    print(f"[信息] 正在读取视频时长...\n")
-    
-    total_duration = 0.0
-    success_count = 0
-    fail_count = 0
-    
-    for i, f in enumerate(files, start=1):
-        try:
-            dur = probe_duration_seconds(str(f))
-            total_duration += dur
-            success_count += 1
-            print(f"  [{i}/{len(files)}] {f.name}")
-            print(f"           时长: {format_hms(dur)} ({dur:.2f}s)")
-        except Exception as e:
-            fail_count += 1
-            print(f"  [{i}/{len(files)}] {f.name}")
-            print(f"           [失败] {e}")
-    
-    print(f"\n========== 统计结果 ==========")
-    print(f"[统计] 成功读取：{success_count} 个")
-    if fail_count > 0:
-        print(f"[统计] 失败：{fail_count} 个")
+    digest = hashlib.sha256()
+    # 样本条目的固定字段长度：视频 78 字节、音频 28 字节，之后是子 box
+    fixed = {b"vide": 78, b"soun": 28}.get(handler)
+    for _, body, box_end in _iter_boxes(buf, stsd[0] + 8, stsd[1]):
+        digest.update(bytes(buf[body - 4:body]))  # 条目类型（avc1/hvc1/mp4a…）
+        if fixed is None:
+            digest.update(bytes(buf[body:box_end]))
+            continue
+        digest.update(bytes(buf[body:body + fixed]))
+        box_start = body + fixed
+        for t, _, child_end in _iter_boxes(buf, body + fixed, box_end):
+            if t != b"btrt":
+                digest.update(bytes(buf[box_start:child_end]))
+            box_start = child_end
+    return digest.hexdigest()
+
+
+def _parse_fmp4(buf) -> dict | None:
+    """
+    解析分片 MP4（-movflags frag_keyframe+empty_moov+default_base_moof 的输出），供只合并模式追加新分段：
+    {
+        "tracks": {轨道号: {"timescale", "stsd"（编码参数摘要）, "end"（最后一个样本的结束时间）}},
+        "sequence": 最大分片序号,
+        "fragments": (第一个 moof 起点, 最后一个 mdat 终点),
+        "moofs": {moof 起点: [("mfhd"/轨道号, 字段位置, tfdt 版本)]},
+    }
+    不是这种布局返回 None
+    """
+    moov = _find_box(buf, 0, len(buf), b"moov")
+    mvex = _find_box(buf, *moov, b"mvex") if moov is not None else None
+    if mvex is None:
+        return None
+
+    tracks: dict[int, dict] = {}
+    for t, body, box_end in _iter_boxes(buf, *moov):
+        if t != b"trak":
+            continue
+        tkhd = _find_box(buf, body, box_end, b"tkhd")
+        mdia = _find_box(buf, body, box_end, b"mdia")
+        mdhd = _find_box(buf, *mdia, b"mdhd") if mdia else None
+        minf = _find_box(buf, *mdia, b"minf") if mdia else None
+        stbl = _find_box(buf, *minf, b"stbl") if minf else None
+        stsd = _find_box(buf, *stbl, b"stsd") if stbl else None
+        hdlr = _find_box(buf, *mdia, b"hdlr") if mdia else None
+        if tkhd is None or mdhd is None or stsd is None or hdlr is None:
+            return None
+        (track_id,) = struct.unpack_from(">I", buf, tkhd[0] + (20 if buf[tkhd[0]] == 1 else 12))
+        tracks[track_id] = {
+            "timescale": _read_time_header(buf, mdhd[0])[0],
+            "stsd": _stsd_digest(buf, stsd, bytes(buf[hdlr[0] + 8:hdlr[0] + 12])),
+            "end": 0,
+        }
+    default_durations = {}
+    for t, body, _ in _iter_boxes(buf, *mvex):
+        if t == b"trex":
+            track_id, _, duration = struct.unpack_from(">III", buf, body + 4)
+            default_durations[track_id] = duration
+
+    sequence = 0
+    first = last = None
+    moofs: dict[int, list] = {}
+    box_start = moov[1]
+    for t, body, box_end in _iter_boxes(buf, moov[1], len(buf)):
+        start, box_start = box_start, box_end
+        if t == b"mfra":
+            break  # 分片随机访问索引，总在最后
+        if t == b"mdat" and first is not None:
+            last = box_end
+        if t != b"moof":
+            continue
+        mfhd = _find_box(buf, body, box_end, b"mfhd")
+        if mfhd is None:
+            return None
+        fields = [("mfhd", mfhd[0] + 4, None)]
+        sequence = max(sequence, struct.unpack_from(">I", buf, mfhd[0] + 4)[0])
+        for tt, traf_body, traf_end in _iter_boxes(buf, body, box_end):
+            if tt != b"traf":
+                continue
+            traf = _parse_traf(buf, traf_body, traf_end, default_durations)
+            if traf is None or traf["track"] not in tracks:
+                return None
+            track = tracks[traf["track"]]
+            track["end"] = max(track["end"], traf["base"] + traf["duration"])
+            fields.append((traf["track"], traf["tfdt"], traf["tfdt_version"]))
+        moofs[start] = fields
+        if first is None:
+            first = start
+        last = box_end
+    if first is None:
+        return None
+    return {"tracks": tracks, "sequence": sequence, "fragments": (first, last), "moofs": moofs}
+
+
+def read_fmp4_layout(video_path: Path) -> dict | None:
+    """mmap 读取分片 MP4 的布局（见 _parse_fmp4），读不了返回 None"""
+    try:
+        with open(video_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                return _parse_fmp4(buf)
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
+
+
+# ----------------- 探测缓存 -----------------
+# ffprobe 结果的持久化缓存（SQLite）。条目以 (绝对路径, 类型) 为键，
+# 同时记录文件大小与修改时间，读取时不一致即视为过期。
+PROBE_CACHE_ENABLED = DEFAULT_PROBE_CACHE
+_probe_cache_conn: sqlite3.Connection | None = None
+_probe_cache_lock = threading.Lock()
+_probe_cache_dirty = 0
+
+
+def cache_dir() -> Path:
+    """用户缓存目录（不存在时自动创建）"""
+    env = os.environ.get("HUMANLAPSE_CACHE_DIR")
+    if env:
+        base = Path(env)
+    elif is_windows():
+        base = Path(os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local") / "HumanLapse"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "humanlapse"
+    base.mkdir(parents=True, exist_ok=True)
+    return base
+
+
+def set_probe_cache_enabled(enabled: bool) -> None:
+    global PROBE_CACHE_ENABLED
+    PROBE_CACHE_ENABLED = enabled
+
+
+def _probe_cache() -> sqlite3.Connection | None:
+    """懒加载缓存数据库；打不开时（如只读磁盘）自动关闭缓存，不影响正常处理"""
+    if not PROBE_CACHE_ENABLED:
+        return None
+    if _probe_cache_conn is not None:
+        return _probe_cache_conn
+    # 并发探测时可能有多个线程同时走到这里：加锁，保证只打开一次
+    with _probe_cache_lock:
+        if _probe_cache_conn is None and PROBE_CACHE_ENABLED:
+            _open_probe_cache()
+    return _probe_cache_conn
+
+
+def _open_probe_cache() -> None:
+    """打开（必要时创建）缓存数据库；调用方需持有锁"""
+    global _probe_cache_conn
+    try:
+        conn = sqlite3.connect(str(cache_dir() / "probe_cache.sqlite3"), timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS probe ("
+            " path TEXT NOT NULL, kind TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " value TEXT NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (path, kind))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS probe_last_used ON probe(last_used)")
+        _evict_probe_cache(conn)
+        conn.commit()
+    except (sqlite3.Error, OSError) as e:
+        print(f"[警告] 探测缓存不可用，已关闭：{e}")
+        set_probe_cache_enabled(False)
+        return
+    _probe_cache_conn = conn
+    atexit.register(close_probe_cache)
+
+
+def _evict_probe_cache(conn: sqlite3.Connection) -> None:
+    """超出条目上限时，删除最久未使用的条目"""
+    (count,) = conn.execute("SELECT COUNT(*) FROM probe").fetchone()
+    excess = count - PROBE_CACHE_MAX_ENTRIES
+    if excess > 0:
+        conn.execute(
+            "DELETE FROM probe WHERE rowid IN (SELECT rowid FROM probe ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+
+def _probe_cache_key(video_path: str) -> tuple[str, int, int] | None:
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    return os.path.abspath(video_path), st.st_size, st.st_mtime_ns
+
+
+def _probe_cache_touch() -> None:
+    """累计写入，定期提交（逐条提交太慢）；调用方需持有锁"""
+    global _probe_cache_dirty
+    _probe_cache_dirty += 1
+    if _probe_cache_dirty >= 500:
+        _probe_cache_conn.commit()
+        _probe_cache_dirty = 0
+
+
+def probe_cache_get(video_path: str, kind: str):
+    """命中返回缓存值；未命中或已过期返回 None"""
+    conn = _probe_cache()
+    if conn is None:
+        return None
+    key = _probe_cache_key(video_path)
+    if key is None:
+        return None
+    path, size, mtime_ns = key
+    # 缓存出错（如被其它进程长时间锁住）时当作未命中，不影响正常探测
+    try:
+        with _probe_cache_lock:
+            row = conn.execute(
+                "SELECT size, mtime_ns, value FROM probe WHERE path=? AND kind=?",
+                (path, kind),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != size or row[1] != mtime_ns:
+                # 文件已变化：删除过期条目
+                conn.execute("DELETE FROM probe WHERE path=? AND kind=?", (path, kind))
+                _probe_cache_touch()
+                return None
+            conn.execute(
+                "UPDATE probe SET last_used=? WHERE path=? AND kind=?",
+                (time.time(), path, kind),
+            )
+            _probe_cache_touch()
+    except sqlite3.Error:
+        return None
+    return json.loads(row[2])
+
+
+def probe_cache_put(video_path: str, kind: str, value) -> None:
+    conn = _probe_cache()
+    if conn is None:
+        return
+    key = _probe_cache_key(video_path)
+    if key is None:
+        return
+    path, size, mtime_ns = key
+    try:
+        with _probe_cache_lock:
+            conn.execute(
+                "INSERT OR REPLACE INTO probe (path, kind, size, mtime_ns, value, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, kind, size, mtime_ns, json.dumps(value), time.time()),
+            )
+            _probe_cache_touch()
+    except sqlite3.Error:
+        pass
+
+
+def close_probe_cache() -> None:
+    """提交未保存的写入并关闭数据库（程序退出时自动调用）"""
+    global _probe_cache_conn, _probe_cache_dirty
+    with _probe_cache_lock:
+        if _probe_cache_conn is None:
+            return
+        try:
+            _evict_probe_cache(_probe_cache_conn)
+            _probe_cache_conn.commit()
+            _probe_cache_conn.close()
+        except sqlite3.Error:
+            pass
+        _probe_cache_conn = None
+        _probe_cache_dirty = 0
+
+
+# ----------------- 渲染与采样缓存 -----------------
+# 以“输入内容指纹 + 参数”为键，在缓存目录下保存两类结果：
+#   render : 最终输出（renders/）。同样的素材（哪怕移动了目录）同样的参数再渲染时，
+#            直接硬链接（不同磁盘时复制）已有结果。只登记能硬链接进缓存的输出：
+#            输出在别的磁盘上时不进缓存，免得每次渲染都把整份输出再复制一遍
+#   sample : 采样得到的无损中间文件（samples/，不含缩放）。只改码率/分辨率/适配再渲染时，
+#            跳过解码源视频，直接从缓存的采样结果开始两遍编码
+# 索引保存在 SQLite：每类一张表记录条目（超出容量上限时按最近使用时间淘汰）；
+# render_output 表记录每个输出文件由哪个键生成，用于 --skip-existing 判断输出是否已与输入不一致。
+RENDER_CACHE_ENABLED = DEFAULT_RENDER_CACHE
+SAMPLE_CACHE_ENABLED = DEFAULT_SAMPLE_CACHE
+RENDER_CACHE_VERSION = 1
+_CACHE_KINDS = {"render": ("renders", ".mp4"), "sample": ("samples", ".mkv")}
+_render_cache_conn: sqlite3.Connection | None = None
+_render_cache_failed = False
+_render_cache_lock = threading.Lock()
+
+# 指纹：文件大小 + 均匀分布的若干数据块的哈希（不读全文件，几 GB 的文件也只读 1 MB）
+FINGERPRINT_BLOCK = 64 * 1024
+FINGERPRINT_BLOCKS = 16
+
+
+def set_render_cache_enabled(enabled: bool) -> None:
+    global RENDER_CACHE_ENABLED
+    RENDER_CACHE_ENABLED = enabled
+
+
+def set_sample_cache_enabled(enabled: bool) -> None:
+    global SAMPLE_CACHE_ENABLED
+    SAMPLE_CACHE_ENABLED = enabled
+
+
+def _cache_enabled(kind: str) -> bool:
+    return RENDER_CACHE_ENABLED if kind == "render" else SAMPLE_CACHE_ENABLED
+
+
+def _cache_max_bytes(kind: str) -> int:
+    return RENDER_CACHE_MAX_BYTES if kind == "render" else SAMPLE_CACHE_MAX_BYTES
+
+
+def _render_cache(kind: str = "render") -> sqlite3.Connection | None:
+    """懒加载缓存索引（render/sample 共用一个数据库）；该类缓存关闭或索引打不开时返回 None"""
+    global _render_cache_conn, _render_cache_failed
+    if not _cache_enabled(kind):
+        return None
+    with _render_cache_lock:
+        if _render_cache_conn is not None or _render_cache_failed:
+            return _render_cache_conn
+        try:
+            for sub, _ in _CACHE_KINDS.values():
+                (cache_dir() / sub).mkdir(exist_ok=True)
+                # 被强行中断的进程留下的临时文件（超过一天的才删，避免误删别的进程正在写的）
+                for p in (cache_dir() / sub).glob("*.part*"):
+                    try:
+                        if time.time() - p.stat().st_mtime > 86400:
+                            p.unlink()
+                    except OSError:
+                        pass
+            conn = sqlite3.connect(str(cache_dir() / "render_cache.sqlite3"), timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for table in _CACHE_KINDS:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    " key TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+                    " created REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS render_output ("
+                " output TEXT PRIMARY KEY, key TEXT NOT NULL)"
+            )
+            conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            print(f"[警告] 渲染缓存不可用，已关闭：{e}")
+            _render_cache_failed = True
+            return None
+        _render_cache_conn = conn
+        atexit.register(close_render_cache)
+        return conn
+
+
+def close_render_cache() -> None:
+    global _render_cache_conn
+    with _render_cache_lock:
+        if _render_cache_conn is None:
+            return
+        try:
+            _render_cache_conn.close()
+        except sqlite3.Error:
+            pass
+        _render_cache_conn = None
+
+
+def file_fingerprint(video_path: str) -> str:
+    """快速内容指纹：大小 + 抽样数据块哈希（结果按 路径+大小+修改时间 缓存）"""
+    cached = probe_cache_get(video_path, "fingerprint")
+    if cached is not None:
+        return cached
+
+    size = os.path.getsize(video_path)
+    h = hashlib.blake2b(digest_size=16)
+    with open(video_path, "rb") as f:
+        if size <= FINGERPRINT_BLOCK * FINGERPRINT_BLOCKS:
+            h.update(f.read())
+        else:
+            for k in range(FINGERPRINT_BLOCKS):
+                f.seek((size - FINGERPRINT_BLOCK) * k // (FINGERPRINT_BLOCKS - 1))
+                h.update(f.read(FINGERPRINT_BLOCK))
+    fingerprint = f"{size}-{h.hexdigest()}"
+    probe_cache_put(video_path, "fingerprint", fingerprint)
+    return fingerprint
+
+
+def render_cache_key(kind: str, fingerprints: list[str], **params) -> str:
+    """缓存键：类别 + 各输入的内容指纹（按顺序）+ 全部影响结果的参数"""
+    payload = {
+        "version": RENDER_CACHE_VERSION,
+        "kind": kind,
+        "inputs": fingerprints,
+        **params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _render_cache_file(kind: str, key: str) -> Path:
+    sub, suffix = _CACHE_KINDS[kind]
+    return cache_dir() / sub / f"{key}{suffix}"
+
+
+def link_or_copy(src: Path, dst: Path, allow_copy: bool = True) -> bool:
+    """
+    把 src 放到 dst：优先硬链接（不占额外空间），跨磁盘时复制；先写临时名再替换
+    allow_copy=False：不能硬链接（跨磁盘、文件系统不支持）时什么也不做，返回 False
+    """
+    if dst.exists() and os.path.samefile(src, dst):
+        # 已是同一个文件（之前就链接过）；此时 rename 什么也不做，会留下临时文件
+        return True
+    tmp = dst.with_name(dst.name + ".part")
+    if tmp.exists():
+        tmp.unlink()
+    try:
+        os.link(src, tmp)
+    except OSError:
+        if not allow_copy:
+            return False
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return True
+
+
+def _cache_lookup(kind: str, key: str) -> Path | None:
+    """查找缓存条目：文件存在且大小/修改时间与登记时一致才算命中（同时刷新最近使用时间）"""
+    conn = _render_cache(kind)
+    if conn is None:
+        return None
+    cache_file = _render_cache_file(kind, key)
+    try:
+        with _render_cache_lock:
+            row = conn.execute(f"SELECT size, mtime_ns FROM {kind} WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                st = cache_file.stat()
+            except OSError:
+                st = None
+            if st is None or st.st_size != row[0] or st.st_mtime_ns != row[1]:
+                # 缓存文件丢失或被改动过：作废
+                conn.execute(f"DELETE FROM {kind} WHERE key=?", (key,))
+                conn.commit()
+                return None
+            conn.execute(f"UPDATE {kind} SET last_used=? WHERE key=?", (time.time(), key))
+            conn.commit()
+    except sqlite3.Error:
+        return None
+    return cache_file
+
+
+def _cache_register(kind: str, key: str, conn: sqlite3.Connection) -> None:
+    """登记已放入缓存目录的条目，并按容量上限淘汰；调用方需持有锁"""
+    st = _render_cache_file(kind, key).stat()
+    now = time.time()
+    conn.execute(
+        f"INSERT OR REPLACE INTO {kind} (key, size, mtime_ns, created, last_used) VALUES (?, ?, ?, ?, ?)",
+        (key, st.st_size, st.st_mtime_ns, now, now),
+    )
+    _evict_render_cache(conn, kind, keep=key)
+
+
+def _evict_render_cache(conn: sqlite3.Connection, kind: str, keep: str | None = None) -> None:
+    """
+    总大小超出上限时，从最久未使用的条目开始删除；调用方需持有锁
+    keep：刚登记、马上要用的条目，不淘汰；文件删不掉（例如正被别的进程读取）的条目保留到下次
+    """
+    (total,) = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {kind}").fetchone()
+    if total <= _cache_max_bytes(kind):
+        return
+    for key, size in conn.execute(f"SELECT key, size FROM {kind} ORDER BY last_used").fetchall():
+        if total <= _cache_max_bytes(kind):
+            break
+        if key == keep:
+            continue
+        try:
+            _render_cache_file(kind, key).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        conn.execute(f"DELETE FROM {kind} WHERE key=?", (key,))
+        total -= size
+
+
+def render_cache_fetch(key: str, output_path: Path) -> bool:
+    """命中时把缓存的输出放到 output_path 并返回 True"""
+    cache_file = _cache_lookup("render", key)
+    if cache_file is None:
+        return False
+    link_or_copy(cache_file, output_path)
+    try:
+        with _render_cache_lock:
+            _render_cache_conn.execute("INSERT OR REPLACE INTO render_output (output, key) VALUES (?, ?)",
+                                       (os.path.abspath(output_path), key))
+            _render_cache_conn.commit()
+    except sqlite3.Error:
+        pass
+    return True
+
+
+def render_cache_store(key: str, output_path: Path) -> None:
+    """
+    把刚渲染好的输出登记进缓存：只硬链接，不能链接（输出在别的磁盘上）时不进缓存，
+    但仍记下该输出由哪个键生成（供 render_output_is_stale 判断）
+    """
+    conn = _render_cache("render")
+    if conn is None:
+        return
+    try:
+        linked = link_or_copy(output_path, _render_cache_file("render", key), allow_copy=False)
+        with _render_cache_lock:
+            if linked:
+                _cache_register("render", key, conn)
+            conn.execute("INSERT OR REPLACE INTO render_output (output, key) VALUES (?, ?)",
+                         (os.path.abspath(output_path), key))
+            conn.commit()
+    except (OSError, sqlite3.Error) as e:
+        print(f"[警告] 写入渲染缓存失败：{e}")
+
+
+def render_output_is_stale(output_path: Path, key: str) -> bool:
+    """已存在的输出文件是否由别的输入内容/参数生成（没有记录时视为不过期）"""
+    conn = _render_cache("render")
+    if conn is None:
+        return False
+    try:
+        with _render_cache_lock:
+            row = conn.execute("SELECT key FROM render_output WHERE output=?",
+                               (os.path.abspath(output_path),)).fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None and row[0] != key
+
+
+def sample_cache_lookup(key: str) -> Path | None:
+    """已缓存的采样结果（无损中间文件）路径；未命中返回 None"""
+    return _cache_lookup("sample", key)
+
+
+def sample_cache_temp(key: str) -> Path:
+    """采样直接写进缓存目录下的临时文件，完成后原地改名登记，不必跨磁盘搬运"""
+    return _render_cache_file("sample", key).with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.part.mkv")
+
+
+def sample_cache_commit(key: str, temp_path: Path) -> Path:
+    """把采样好的临时文件登记进缓存，返回之后应读取的路径（登记失败时仍返回临时文件）"""
+    conn = _render_cache("sample")
+    if conn is None:
+        return temp_path
+    cache_file = _render_cache_file("sample", key)
+    try:
+        os.replace(temp_path, cache_file)
+        with _render_cache_lock:
+            _cache_register("sample", key, conn)
+            conn.commit()
+    except OSError as e:
+        print(f"[警告] 写入采样缓存失败：{e}")
+        return temp_path
+    except sqlite3.Error as e:
+        print(f"[警告] 写入采样缓存失败：{e}")
+    return cache_file
+
+
+# ----------------- 并发探测 -----------------
+def probe_many(files, probe=probe_duration_seconds, workers: int = DEFAULT_PROBE_JOBS):
+    """
+    有界线程池并发探测：同时最多有 workers*2 个探测在进行（其余尚未提交），
+    按输入顺序逐个产出 (下标, 文件, 结果, 异常)——前面的都完成后立即产出，不必等全部结束。
+
+    files 可以是任意可迭代对象（包括边扫描边产出的生成器）。
+    """
+    workers = max(1, workers)
+    source = enumerate(files)
+    pending = deque()
+
+    with job_pool(workers) as pool:
+        def _submit() -> bool:
+            nxt = next(source, None)
+            if nxt is None:
+                return False
+            i, f = nxt
+            pending.append((i, f, pool.submit(probe, str(f))))
+            return True
+
+        for _ in range(workers * 2):
+            if not _submit():
+                break
+
+        while pending:
+            i, f, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            _submit()
+            yield i, f, result, error
+
+
+def probe_sorted(files, probe=probe_duration_seconds, workers: int = DEFAULT_PROBE_JOBS):
+    """
+    边扫描边探测、按智能排序输出：files（通常是 iter_files 的扫描生成器）每扫到一个就提交探测，
+    扫描结束后按 smart_sort_files 排序，再按排序后的顺序逐个产出 (下标, 总数, 文件, 结果, 异常)——
+    排在前面的都完成后立即产出，不必等全部结束。探测与目录遍历重叠进行。
+    """
+    with job_pool(max(1, workers)) as pool:
+        futures = {f: pool.submit(probe, str(f)) for f in files}
+        ordered = smart_sort_files(list(futures))
+        for i, f in enumerate(ordered):
+            try:
+                result, error = futures[f].result(), None
+            except Exception as e:
+                result, error = None, e
+            yield i, len(ordered), f, result, error
+
+
+def probe_durations(files, workers: int = DEFAULT_PROBE_JOBS) -> tuple[dict[Path, float], list[tuple[Path, str]]]:
+    """
+    并发读取一组文件的时长（合并/批量模式的预先规划用）
+
+    Returns:
+        ({文件: 时长}, [(读取失败的文件, 错误信息), ...])
+    """
+    durations: dict[Path, float] = {}
+    failed: list[tuple[Path, str]] = []
+    for _, f, dur, error in probe_many(files, workers=workers):
+        if error is None:
+            durations[f] = dur
+        else:
+            failed.append((f, str(error)))
+    return durations, failed
+
+
+# ----------------- 资源控制 -----------------
+# 与录制/绘画软件共用一台电脑时，限制本工具启动的 ffmpeg/ffprobe 对前台程序的影响：
+#   优先级/CPU 亲和性：设置在本进程上，之后启动的子进程全部继承
+#                      （不必逐个设置，也避开了多线程下 preexec_fn 不安全的问题）
+#   线程上限：解码/滤镜/编码各自的 -threads，由 thread_args 统一加上
+#   自适应暂停：后台线程定时统计其它程序的 CPU 占用，超过阈值时暂停（SIGSTOP）全部子进程，
+#               回落后继续（SIGCONT）。需要 /proc，目前只支持 Linux，其它系统提示后照常处理
+PRIORITY_NICE = {"normal": 0, "low": 10, "idle": 19}
+PRIORITY_WINDOWS_CLASS = {"normal": 0x20, "low": 0x4000, "idle": 0x40}  # NORMAL/BELOW_NORMAL/IDLE_PRIORITY_CLASS
+ADAPTIVE_RESUME_RATIO = 0.5     # 其它程序占用降到 暂停阈值 × 该比例 以下时继续
+ADAPTIVE_CONFIRM = 2            # 连续几次超过阈值才暂停（子进程刚退出时那一小段 CPU 统计不到，单次可能偏高）
+THREAD_CAPS = {"decode": 0, "filter": 0, "encode": 0}
+_governed: list[subprocess.Popen] = []
+_governed_lock = threading.Lock()
+_governor_pauses = 0            # 自适应暂停的累计次数（暂停过的任务耗时不能代表本机速度）
+
+
+def parse_cpu_list(spec: str) -> set[int]:
+    """"0-3,6" → {0, 1, 2, 3, 6}"""
+    cpus: set[int] = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not first.isdigit() or (sep and not last.isdigit()):
+            raise ValueError(f"无法识别的 CPU 编号：{part}（例：0-3,6）")
+        lo, hi = int(first), int(last) if sep else int(first)
+        if hi < lo:
+            raise ValueError(f"CPU 范围写反了：{part}")
+        cpus.update(range(lo, hi + 1))
+    if not cpus:
+        raise ValueError("没有指定任何 CPU")
+    return cpus
+
+
+def parse_thread_caps(spec: str) -> dict[str, int]:
+    """"4" → 解码/滤镜/编码都是 4；"2:1:4" → 解码 2、滤镜 1、编码 4（0 = 该项自动）"""
+    parts = spec.split(":")
+    if len(parts) == 1:
+        parts = parts * 3
+    if len(parts) != 3 or not all(p.strip().isdigit() for p in parts):
+        raise ValueError("格式为 N 或 解码:滤镜:编码，如 4 或 2:1:4")
+    return dict(zip(("decode", "filter", "encode"), (int(p) for p in parts)))
+
+
+def available_cpus() -> int:
+    """本进程可用的 CPU 数（已限定亲和性时只算允许的核）"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def set_process_priority(priority: str) -> bool:
+    """调整本进程（及之后启动的子进程）的优先级；不支持时返回 False"""
+    if priority == "normal":
+        return True
+    if is_windows():
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PRIORITY_WINDOWS_CLASS[priority]))
+        except (ImportError, AttributeError, OSError):
+            return False
+    try:
+        # 只往低调（普通用户不能调高优先级）
+        if os.getpriority(os.PRIO_PROCESS, 0) < PRIORITY_NICE[priority]:
+            os.setpriority(os.PRIO_PROCESS, 0, PRIORITY_NICE[priority])
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def set_process_affinity(cpus: set[int]) -> bool:
+    """限定本进程（及之后启动的子进程）可用的 CPU；不支持时返回 False，CPU 编号不存在时抛 ValueError"""
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            raise ValueError(f"无法限定到 CPU {sorted(cpus)}：{e}")
+        return True
+    if is_windows():
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            mask = sum(1 << c for c in cpus)
+            if not kernel32.SetProcessAffinityMask(kernel32.GetCurrentProcess(), ctypes.c_size_t(mask)):
+                raise ValueError(f"无法限定到 CPU {sorted(cpus)}（编号超出本机范围？）")
+            return True
+        except (ImportError, AttributeError, OSError):
+            return False
+    return False
+
+
+def spawn_process(cmd: list[str], **kwargs) -> subprocess.Popen:
+    """
+    启动 ffmpeg/ffprobe 子进程并登记：自适应暂停时一并暂停/继续；
+    在取消范围内启动的（见 new_cancel_scope）取消时一并结束
+    """
+    check_cancelled()
+    proc = subprocess.Popen(cmd, **kwargs)
+    with _governed_lock:
+        _governed[:] = [p for p in _governed if p.returncode is None]
+        _governed.append(proc)
+    scope = _cancel_scope.get()
+    cancelled = False
+    while scope is not None:  # 登记到所在范围及其上级范围，取消任一层都能结束它
+        with scope["lock"]:
+            scope["procs"] = [p for p in scope["procs"] if p.returncode is None] + [proc]
+            cancelled = cancelled or scope["cancelled"]
+        scope = scope["parent"]
+    if cancelled:  # 启动的同时被取消了
+        proc.kill()
+    return proc
+
+
+# 取消范围：异步 API 的每个任务一个。任务内（含它的工作线程）启动的子进程都登记在范围里，
+# 取消时全部结束，之后再启动子进程或等到子进程失败时抛 asyncio.CancelledError。
+# CancelledError 不是 Exception 的子类，批量模式逐个文件的 except Exception 不会把它当成单个文件失败。
+# 范围可以嵌套（如一个任务的各分段）：取消上级时下级一并取消，取消下级不影响上级。
+_cancel_scope: contextvars.ContextVar = contextvars.ContextVar("humanlapse_cancel_scope", default=None)
+
+
+def new_cancel_scope(parent: dict | None = None) -> dict:
+    return {"cancelled": False, "procs": [], "lock": threading.Lock(), "parent": parent}
+
+
+def cancel_scope(scope: dict) -> None:
+    """取消：标记范围并结束其中仍在运行的子进程（暂停中的也能直接结束）"""
+    with scope["lock"]:
+        scope["cancelled"] = True
+        procs = list(scope["procs"])
+    for proc in procs:
+        if proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+
+def check_cancelled() -> None:
+    """当前任务（或其上级范围）已取消时抛 asyncio.CancelledError"""
+    scope = _cancel_scope.get()
+    while scope is not None:
+        if scope["cancelled"]:
+            raise asyncio.CancelledError()
+        scope = scope["parent"]
+
+
+def _enter_cancel_scope(scope: dict | None) -> None:
+    _cancel_scope.set(scope)
+
+
+def job_pool(max_workers: int) -> ThreadPoolExecutor:
+    """任务内部用的线程池：工作线程沿用创建者的取消范围"""
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=_enter_cancel_scope, initargs=(_cancel_scope.get(),))
+
+
+def run_all_or_cancel(fn, items: list, workers: int) -> list:
+    """
+    同时用 workers 个线程对 items 逐个执行 fn，按 items 顺序返回结果。
+    任一项失败时立即撤下还没开始的项、结束其余正在运行的项启动的 ffmpeg（各项在同一个下级取消范围里），
+    等它们收尾后抛出失败项的异常——不必等其它分段白白编码完
+    """
+    scope = new_cancel_scope(parent=_cancel_scope.get())
+    token = _cancel_scope.set(scope)
+    try:
+        pool = job_pool(workers)
+    finally:
+        _cancel_scope.reset(token)
+    with pool:
+        futures = [pool.submit(fn, item) for item in items]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [f for f in done if f.exception() is not None]
+        if failed:
+            for f in pending:
+                f.cancel()
+            cancel_scope(scope)
+    if failed:
+        raise failed[0].exception()
+    return [f.result() for f in futures]
+
+
+def _system_cpu_ticks() -> tuple[int, int]:
+    """/proc/stat 汇总行 → (忙碌时钟数, 总时钟数)"""
+    with open("/proc/stat", encoding="ascii") as f:
+        values = [int(v) for v in f.readline().split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return sum(values[:8]) - idle, sum(values[:8])
+
+
+def _process_cpu_ticks(pid: int) -> int | None:
+    """/proc/<pid>/stat 的 utime + stime（进程已退出时返回 None）"""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii", errors="replace") as f:
+            fields = f.read().rpartition(")")[2].split()
+        return int(fields[11]) + int(fields[12])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _signal_governed(procs: list[subprocess.Popen], sig) -> None:
+    for proc in procs:
+        try:
+            os.kill(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def _resume_all_governed() -> None:
+    """退出时确保没有子进程停在暂停状态"""
+    with _governed_lock:
+        procs = [p for p in _governed if p.poll() is None]
+    _signal_governed(procs, signal.SIGCONT)
+
+
+def governor_pause_count() -> int:
+    return _governor_pauses
+
+
+def _adaptive_loop(pause_load: float, interval: float) -> None:
+    """自适应暂停的后台线程：其它程序占用 = 整机忙碌时间 - 本进程及子进程占用"""
+    global _governor_pauses
+    resume_load = pause_load * ADAPTIVE_RESUME_RATIO
+    busy0, total0 = _system_cpu_ticks()
+    last_ticks = {os.getpid(): _process_cpu_ticks(os.getpid()) or 0}
+    stopped: set[int] = set()
+    paused_at = None
+    high = 0
+    while True:
+        time.sleep(interval)
+        with _governed_lock:
+            _governed[:] = [p for p in _governed if p.poll() is None]
+            procs = list(_governed)
+        busy, total = _system_cpu_ticks()
+        ticks = {os.getpid(): _process_cpu_ticks(os.getpid())}
+        ticks.update((p.pid, _process_cpu_ticks(p.pid)) for p in procs)
+        ticks = {pid: t for pid, t in ticks.items() if t is not None}
+        ours = sum(t - last_ticks.get(pid, 0) for pid, t in ticks.items())
+        others = max(0.0, (busy - busy0 - ours) / (total - total0)) if total > total0 else 0.0
+        busy0, total0, last_ticks = busy, total, ticks
+
+        if paused_at is None:
+            high = high + 1 if others > pause_load else 0
+            if high >= ADAPTIVE_CONFIRM and procs:
+                paused_at = now_perf()
+                _governor_pauses += 1
+                print(f"[信息] 其它程序 CPU 占用 {others:.0%}，暂停渲染（降到 {resume_load:.0%} 以下后继续）")
+                emit_event("governor_pause", load=round(others, 3))
+        elif others < resume_load:
+            _signal_governed(procs, signal.SIGCONT)
+            stopped.clear()
+            print(f"[信息] 其它程序 CPU 占用降到 {others:.0%}，继续渲染（暂停了 {format_hms(now_perf() - paused_at)}）")
+            emit_event("governor_resume", load=round(others, 3), paused=round(now_perf() - paused_at, 2))
+            paused_at = None
+            high = 0
+        if paused_at is not None:
+            # 暂停期间新启动的子进程也一并暂停
+            fresh = [p for p in procs if p.pid not in stopped]
+            _signal_governed(fresh, signal.SIGSTOP)
+            stopped.update(p.pid for p in fresh)
+
+
+def configure_governor(
+    priority: str = DEFAULT_PRIORITY,
+    cpus: str | None = DEFAULT_CPUS,
+    threads: str | None = DEFAULT_THREADS,
+    adaptive_load: float = DEFAULT_ADAPTIVE_LOAD,
+) -> None:
+    """
+    启用资源控制（在启动任何子进程之前调用一次）
+    不支持的项给出 [警告] 后忽略；参数本身不合法时抛 ValueError
+    """
+    notes = []
+    if threads:
+        THREAD_CAPS.update(parse_thread_caps(threads))
+        notes.append("线程 解码 {decode} / 滤镜 {filter} / 编码 {encode}".format(
+            **{k: v or "自动" for k, v in THREAD_CAPS.items()}))
+    if priority != "normal":
+        if set_process_priority(priority):
+            notes.append(f"优先级 {priority}")
+        else:
+            print(f"[警告] 本系统不支持调整进程优先级，忽略 --priority {priority}")
+    if cpus:
+        cpu_set = parse_cpu_list(cpus)
+        if set_process_affinity(cpu_set):
+            notes.append(f"CPU {cpus}（{len(cpu_set)} 核）")
+        else:
+            print(f"[警告] 本系统不支持限定 CPU，忽略 --cpus {cpus}")
+    if adaptive_load > 0:
+        if hasattr(signal, "SIGSTOP") and os.path.exists("/proc/stat"):
+            notes.append(f"其它程序 CPU 占用超过 {adaptive_load:.0%} 时暂停")
+            atexit.register(_resume_all_governed)
+            threading.Thread(target=_adaptive_loop, args=(adaptive_load, ADAPTIVE_INTERVAL), daemon=True).start()
+        else:
+            print("[警告] 自适应暂停目前只支持 Linux，本次不启用")
+    if notes:
+        print(f"[信息] 资源控制：{' | '.join(notes)}")
+
+
+# ----------------- 进度 -----------------
+PROGRESS_INTERVAL = DEFAULT_PROGRESS_INTERVAL
+_progress_stream = None
+_progress_lock = threading.Lock()
+
+# 单段渲染内各阶段占的工作量比例（用于合成整体进度与预计剩余时间）
+STAGE_WEIGHTS = {
+    "intermediate": {"sample": 0.5, "pass1": 0.2, "pass2": 0.3},
+    "direct": {"pass1": 0.5, "pass2": 0.5},
+}
+
+
+def set_progress_interval(seconds: float) -> None:
+    global PROGRESS_INTERVAL
+    PROGRESS_INTERVAL = seconds
+
+
+def open_progress_stream(spec: str | None) -> None:
+    """打开 JSON-lines 进度事件流：文件路径（追加写入）或 "fd:N"（已打开的文件描述符）"""
+    global _progress_stream
+    if not spec:
+        return
+    if spec.startswith("fd:"):
+        _progress_stream = os.fdopen(int(spec[3:]), "w", encoding="utf-8", buffering=1)
+    else:
+        _progress_stream = open(spec, "a", encoding="utf-8", buffering=1)
+    atexit.register(close_progress_stream)
+
+
+def close_progress_stream() -> None:
+    global _progress_stream
+    with _progress_lock:
+        if _progress_stream is None:
+            return
+        try:
+            _progress_stream.close()
+        except OSError:
+            pass
+        _progress_stream = None
+
+
+def emit_event(event: str, **fields) -> None:
+    """向进度事件流写一行 JSON（未开启时什么都不做）；写入失败不影响处理"""
+    if _progress_stream is None:
+        return
+    line = json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, ensure_ascii=False, default=str)
+    with _progress_lock:
+        try:
+            _progress_stream.write(line + "\n")
+        except (OSError, ValueError, AttributeError):
+            pass
+
+
+def estimate_eta(elapsed: float, fraction: float) -> float | None:
+    """按已用时间与完成比例估算剩余时间（秒）"""
+    if fraction <= 0:
+        return None
+    return elapsed * (1.0 - fraction) / fraction
+
+
+def make_progress(scope: str, label: str, on_update=None, console: bool = True, **ident):
+    """
+    进度汇总器：各工作单元按权重（合计为 1）报告自己的完成比例，合成整体进度与预计剩余时间
+
+    返回 report(unit, weight, fraction, **info)
+    - 每次更新都写一条 progress 事件（scope + ident 标识是哪个任务）
+    - console=True 时按 PROGRESS_INTERVAL 在控制台打印一行进度
+    - on_update(fraction, info)：整体进度变化时回调，用于上一级（批量/合并）汇总
+    """
+    lock = threading.Lock()
+    done: dict = {}
+    t0 = now_perf()
+    last_print = t0
+
+    def report(unit, weight: float, fraction: float, **info):
+        nonlocal last_print
+        with lock:
+            done[unit] = weight * max(0.0, min(1.0, fraction))
+            total = min(1.0, sum(done.values()))
+            now = now_perf()
+            elapsed = now - t0
+            eta = estimate_eta(elapsed, total)
+            show = console and PROGRESS_INTERVAL > 0 and now - last_print >= PROGRESS_INTERVAL
+            if show:
+                last_print = now
+
+        emit_event("progress", scope=scope, **ident, fraction=round(total, 4),
+                   elapsed=round(elapsed, 2), eta=None if eta is None else round(eta, 1), **info)
+        if show:
+            parts = [f"[进度] {label}{total * 100:5.1f}%"]
+            if info.get("stage"):
+                parts.append(str(info["stage"]))
+            if info.get("speed"):
+                parts.append(f"{info['speed']:.2f}x")
+            parts.append(f"已用 {format_hms(elapsed)}")
+            if eta is not None:
+                parts.append(f"预计剩余 {format_hms(eta)}")
+            print(" | ".join(parts), flush=True)
+        if on_update is not None:
+            on_update(total, info)
+
+    return report
+
+
+def _parse_progress_block(block: dict[str, str]) -> dict:
+    """把 ffmpeg -progress 的一组 key=value 转成 {"frame", "out_time", "speed"}（读不到的字段省略）"""
+    info = {}
+    try:
+        info["frame"] = int(block["frame"])
+    except (KeyError, ValueError):
+        pass
+    # out_time_ms 实际也是微秒（ffmpeg 的历史遗留）
+    for key in ("out_time_us", "out_time_ms"):
+        try:
+            info["out_time"] = int(block[key]) / 1_000_000
+            break
+        except (KeyError, ValueError):
+            continue
+    try:
+        info["speed"] = float(block.get("speed", "").strip().rstrip("x"))
+    except ValueError:
+        pass
+    return info
+
+
+def run_ffmpeg(cmd: list[str], on_progress=None) -> None:
+    """
+    运行 ffmpeg（失败抛 CalledProcessError，与 subprocess.check_call 一致）
+    on_progress(info)：附加 -progress pipe:1 -nostats，每收到一组进度就回调一次
+    info 为 {"frame", "out_time", "speed"}
+    """
+    if on_progress is None:
+        proc = spawn_process(cmd)
+        try:
+            rc = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        if rc != 0:
+            check_cancelled()
+            raise subprocess.CalledProcessError(rc, cmd)
+        return
+
+    full_cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    proc = spawn_process(full_cmd, stdout=subprocess.PIPE, text=True, encoding="utf-8", errors="replace")
+    block: dict[str, str] = {}
+    try:
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "progress":
+                on_progress(_parse_progress_block(block))
+                block = {}
+            elif key:
+                block[key] = value
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        rc = proc.wait()
+    if rc != 0:
+        check_cancelled()
+        raise subprocess.CalledProcessError(rc, cmd)
+
+
+# ----------------- 采样引擎 -----------------
+# 无损中间文件的编码参数（FFV1 全 I 帧，供后续两遍编码反复读取）
+INTERMEDIATE_CODEC_ARGS = ["-c:v", "ffv1", "-level", "3", "-g", "1", "-pix_fmt", "yuv420p"]
+
+
+def choose_sampler(
+    sampler: str,
+    speed: float,
+    seek_speed: float,
+    keyframe_speed: float = DEFAULT_KEYFRAME_SPEED,
+) -> str:
+    """
+    根据 --sampler 与加速倍率决定实际使用的采样方式：filter / seek / keyframe
+    （auto 选中 keyframe 后，调用方还要确认关键帧够密，否则以 keyframe_speed=0 重新选择）
+    """
+    sampler = sampler.lower()
+    if sampler == "auto":
+        if keyframe_speed > 0 and speed >= keyframe_speed:
+            return "keyframe"
+        return "seek" if seek_speed > 0 and speed >= seek_speed else "filter"
+    if sampler in ("filter", "seek", "keyframe"):
+        return sampler
+    raise ValueError("sampler 只支持 auto/filter/seek/keyframe")
+
+
+def resolve_sampler(
+    sampler: str,
+    speed: float,
+    seek_speed: float,
+    frame_count: int,
+    count_keyframes,
+) -> tuple[str, int | None]:
+    """
+    实际使用的采样方式（timelapse_one 与截止时间规划共用，两边选得一样）：
+    选中 keyframe 时用 count_keyframes() 数一下关键帧，auto 下关键帧不够输出帧数时改用 seek/filter
+    返回 (采样方式, 关键帧数；没数时为 None)
+    """
+    used = choose_sampler(sampler, speed, seek_speed)
+    keyframe_count = None
+    if used == "keyframe":
+        keyframe_count = count_keyframes()
+        if keyframe_count < frame_count and sampler.lower() == "auto":
+            used = choose_sampler(sampler, speed, seek_speed, keyframe_speed=0)
+    return used, keyframe_count
+
+
+def output_frame_count(target_seconds: float, out_fps: int) -> int:
+    """输出视频的总帧数（与 fps 滤镜按目标时长产出的帧数一致）"""
+    return max(1, int(round(target_seconds * out_fps)))
+
+
+def build_timelapse_vf(
+    speed: float,
+    out_fps: int,
+    scale_part: str | None = None,
+    keyframes_only: bool = False,
+    pad_end: bool = False,
+    first_frame: int | None = None,
+) -> str:
+    """
+    滤镜链：setpts + fps + (可选 scale/pad/crop)
+    keyframes_only：输入只有关键帧（-skip_frame nokey）。fps 从 0 起算、最后一个关键帧之后重复补帧，
+                    配合 -frames:v 得到与逐帧解码完全相同的帧数（每帧为不晚于该时刻的最近关键帧）
+    pad_end：末尾重复最后一帧（配合 -frames:v 保证帧数一个不差，见 timelapse_one 的 frame_budget）
+    first_frame：分段渲染时本段首个输出帧的序号。输入须用 -copyts 读取（见 source_input_args），
+                 fps 的输出网格从 first_frame / out_fps 开始、与整段渲染的网格重合；最后把时间戳移回从 0 开始。
+                 fps 设了 start_time 后按“相对 start_time”取整时间戳，先把时间基细分 out_fps 倍，
+                 让 start_time 在输入/输出时间基上都是整数，取帧结果才与整段渲染（按绝对时间戳取整）逐帧相同
+    """
+    fps = f"fps={out_fps}"
+    if first_frame is not None:
+        fps += f":start_time={first_frame}/{out_fps}"
+    elif keyframes_only:
+        fps += ":start_time=0"
+    if keyframes_only:
+        fps += ":eof_action=pass"
+    vf_parts = [f"setpts=PTS/{speed}"]
+    if first_frame is not None:
+        vf_parts.append(f"settb=intb/{out_fps}")
+    vf_parts.append(fps)
+    if scale_part:
+        vf_parts.append(scale_part)
+    if keyframes_only or pad_end:
+        vf_parts.append("tpad=stop=-1:stop_mode=clone")
+    if first_frame is not None:
+        vf_parts.append("setpts=PTS-STARTPTS")
+    return ",".join(vf_parts)
+
+
+def plan_seek_runs(sample_times: list[float], keyframes: list[float]) -> list[tuple[int, int]]:
+    """
+    把采样时间点分组成若干段“连续解码”：
+    相邻两个时间点之间若出现了新的关键帧，则从该关键帧重新跳读（解码量更少），
+    否则沿用上一段继续往后解码。
+
+    Returns:
+        [(起始采样下标, 帧数), ...]
+    """
+    if not sample_times:
+        return []
+
+    runs = []
+    run_start = 0
+    for i in range(1, len(sample_times)):
+        k = bisect.bisect_right(keyframes, sample_times[i])
+        # 第 i 个时间点之前最近的关键帧位于上一个时间点之后 → 重新跳读
+        if k > 0 and keyframes[k - 1] > sample_times[i - 1]:
+            runs.append((run_start, i - run_start))
+            run_start = i
+    runs.append((run_start, len(sample_times) - run_start))
+    return runs
+
+
+def plan_segments(frame_count: int, jobs: int, out_fps: int) -> list[tuple[int, int]]:
+    """
+    把输出帧 [0, frame_count) 尽量均分成 jobs 段（每段至少 1 秒输出）
+
+    Returns:
+        [(起始帧, 帧数), ...]
+    """
+    n = max(1, min(jobs, frame_count // max(1, out_fps)))
+    base, extra = divmod(frame_count, n)
+    segments = []
+    first = 0
+    for i in range(n):
+        count = base + (1 if i < extra else 0)
+        segments.append((first, count))
+        first += count
+    return segments
+
+
+def plan_chunks(frame_count: int, out_fps: int, chunk_seconds: float) -> list[tuple[int, int]]:
+    """
+    把输出帧 [0, frame_count) 切成每块约 chunk_seconds 秒的块
+    块长取 CHUNK_GOP_FRAMES 的整数倍，拼接后的关键帧间隔与不分块时一致；
+    不足一个 GOP 时按原长度切（每块开头本来就是关键帧）
+
+    Returns:
+        [(起始帧, 帧数), ...]
+    """
+    size = max(1, round(chunk_seconds * out_fps))
+    if size >= CHUNK_GOP_FRAMES:
+        size = round(size / CHUNK_GOP_FRAMES) * CHUNK_GOP_FRAMES
+    return [(first, min(size, frame_count - first)) for first in range(0, frame_count, size)]
+
+
+def plan_frame_budgets(durations: list[float], frame_count: int) -> list[int]:
+    """
+    按时长比例把 frame_count 个输出帧分给各文件（最大余数法）
+    各份之和恰好等于 frame_count，最终成片与 -t 目标时长一致
+    """
+    total = sum(durations)
+    if total <= 0:
+        raise ValueError("总时长必须大于 0")
+    quotas = [d / total * frame_count for d in durations]
+    budgets = [int(q) for q in quotas]
+    # 剩余的帧按小数部分从大到小逐个分配
+    order = sorted(range(len(quotas)), key=lambda i: quotas[i] - budgets[i], reverse=True)
+    for i in order[:frame_count - sum(budgets)]:
+        budgets[i] += 1
+    return budgets
+
+
+def thread_args(threads: int) -> tuple[list[str], list[str]]:
+    """
+    线程上限 → (输入侧参数, 输出侧参数)
+    输入侧：滤镜线程 + 解码线程；输出侧：编码线程。threads=0 表示交给 ffmpeg 自动决定
+    --threads 指定的上限（THREAD_CAPS）对每一项再取较小值
+    """
+    def _limit(role: str) -> int:
+        cap = THREAD_CAPS[role]
+        return min(threads, cap) if threads > 0 and cap > 0 else max(threads, cap, 0)
+
+    decode, filters, encode = _limit("decode"), _limit("filter"), _limit("encode")
+    in_args = (["-filter_threads", str(filters)] if filters else []) + (["-threads", str(decode)] if decode else [])
+    return in_args, (["-threads", str(encode)] if encode else [])
+
+
+def source_input_args(
+    input_path: Path,
+    source_start: float | None = None,
+    concat: bool = False,
+    keyframes_only: bool = False,
+) -> list[str]:
+    """
+    组装 ffmpeg 输入参数
+    source_start 秒：用 -ss 从这里开始读取源视频（段尾由调用方的 -frames:v 截断）。-copyts -start_at_zero
+                 保留跳读前的时间轴（同样从 0 起算），setpts 的取整与整段渲染完全相同（滤镜链要配合
+                 build_timelapse_vf 的 first_frame）；-noaccurate_seek 从该时刻之前的关键帧开始送帧，
+                 段首取到的帧（含关键帧跳读时更早的关键帧）与整段渲染相同，更早的帧由 fps 丢掉。
+                 不用 -to：不精确跳读时它从实际起读的关键帧算起，会把段尾提前截掉
+    concat=True：input_path 是 concat 列表文件，用 concat 分离器把多个文件当成一段连续视频读取
+    keyframes_only=True：解码器跳过所有非关键帧（-skip_frame nokey）
+    """
+    args = ["-skip_frame", "nokey"] if keyframes_only else []
+    if source_start is not None:
+        args += ["-copyts", "-start_at_zero", "-noaccurate_seek", "-ss", f"{source_start:.6f}"]
+    if concat:
+        args += ["-f", "concat", "-safe", "0"]
+    return args + ["-i", str(input_path)]
+
+
+def filter_sample_to_intermediate(
+    input_args: list[str],
+    intermediate: Path,
+    vf: str,
+    quiet: bool,
+    frame_count: int | None = None,
+    threads: int = 0,
+    on_progress=None,
+) -> None:
+    """
+    滤镜链采样：对源视频（或其中一段）跑一次 setpts/fps/scale，结果写入无损中间文件
+    frame_count：分段时限制输出帧数，保证各段帧数之和与整段渲染一致
+    on_progress：见 run_ffmpeg
+    """
+    in_threads, out_threads = thread_args(threads)
+    cmd = [FFMPEG, "-hide_banner"]
+    if quiet:
+        cmd += ["-loglevel", "error"]
+    cmd += ["-y"] + in_threads + input_args + [
+        "-vf", vf,
+        "-an", "-sn", "-dn",
+        "-map_metadata", "-1",
+        "-map_chapters", "-1",
+    ]
+    if frame_count is not None:
+        cmd += ["-frames:v", str(frame_count)]
+    cmd += out_threads + INTERMEDIATE_CODEC_ARGS + [str(intermediate)]
+    run_ffmpeg(cmd, on_progress)
+
+
+def filter_sample_multi(
+    input_path: Path,
+    outputs: list[tuple[str, Path]],
+    quiet: bool,
+    threads: int = 0,
+    on_progress=None,
+) -> None:
+    """
+    一次解码、多路输出：源视频只解码一次，经 split 分给各输出版本各自的 setpts/fps/scale，
+    分别写入无损中间文件
+    outputs=[(滤镜链, 中间文件), ...]；on_progress 见 run_ffmpeg（帧数按第一路输出计）
+    """
+    in_threads, out_threads = thread_args(threads)
+    in_threads = ["-filter_complex_threads" if a == "-filter_threads" else a for a in in_threads]
+    n = len(outputs)
+    graph = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    graph += [f"[s{i}]{vf}[o{i}]" for i, (vf, _) in enumerate(outputs)]
+
+    cmd = [FFMPEG, "-hide_banner"]
+    if quiet:
+        cmd += ["-loglevel", "error"]
+    cmd += ["-y"] + in_threads + ["-i", str(input_path), "-filter_complex", ";".join(graph)]
+    for i, (_, intermediate) in enumerate(outputs):
+        cmd += [
+            "-map", f"[o{i}]",
+            "-an", "-sn", "-dn",
+            "-map_metadata", "-1",
+            "-map_chapters", "-1",
+        ] + out_threads + INTERMEDIATE_CODEC_ARGS + [str(intermediate)]
+    run_ffmpeg(cmd, on_progress)
+
+
+def build_seek_index(input_path: Path, concat_sources: list[tuple[Path, float]] | None = None) -> dict:
+    """
+    为关键帧跳读准备索引（整段只建一次，各分段共用）
+    返回 {"width", "height", "rotation", "start_time", "keyframes", "sources"}
+
+    concat_sources=[(文件, 时长), ...]：合并模式下按顺序把各文件的关键帧平移到拼接后的时间轴上；
+    sources 为 [(文件, 在拼接时间轴上的起点), ...]，跳读时直接定位到对应文件。
+    各文件的关键帧时间相对于 start_time（音视频中较早的一路），第一个关键帧不一定正好在文件起点，
+    所以每个文件起点也作为一个断点放进 keyframes，保证跳读段不会跨越文件边界。
+    """
+    if concat_sources is None:
+        info = probe_video_stream(str(input_path))
+        info["keyframes"] = build_keyframe_index(str(input_path), info["start_time"])
+        info["sources"] = [(input_path, 0.0)]
+        return info
+
+    info = probe_video_stream(str(concat_sources[0][0]))
+    keyframes: list[float] = []
+    sources: list[tuple[Path, float]] = []
+    offset = 0.0
+    for path, dur in concat_sources:
+        start_time = probe_video_stream(str(path))["start_time"]
+        keyframes.append(offset)
+        keyframes.extend(offset + t for t in build_keyframe_index(str(path), start_time))
+        sources.append((path, offset))
+        offset += dur
+    info["keyframes"] = sorted(set(keyframes))
+    info["sources"] = sources
+    return info
+
+
+def seek_sample_to_intermediate(
+    intermediate: Path,
+    seek_index: dict,
+    speed: float,
+    out_fps: int,
+    first_frame: int,
+    frame_count: int,
+    scale_part: str | None,
+    quiet: bool,
+    log,
+    threads: int = 0,
+    on_progress=None,
+) -> dict:
+    """
+    关键帧索引跳读采样（输出帧 [first_frame, first_frame + frame_count)）：
+    1. 计算每个输出帧对应的源时间点，借助关键帧索引按 GOP 分组
+    2. 每组用 -ss 跳到所需时间点，只解码该 GOP 内需要的帧
+    3. 原始帧经管道写入无损中间文件
+
+    解码量与输出帧数成正比，而不是与源帧数成正比。
+    on_progress(info)：每跳读完一段回调一次，info 为 {"frame"}
+
+    Returns:
+        {"runs": 跳读次数}
+    """
+    step = speed / out_fps  # 相邻输出帧对应的源时间间隔
+    # 第 n 个输出帧在源时间轴上的位置。每段从该段首帧的位置跳读，再跑与滤镜链相同的 setpts+fps
+    # （fps 默认 round=near：取源时间早于 (n+0.5)*step 的最后一帧），选中的帧与整段滤镜链一致
+    sample_times = [n * step for n in range(first_frame, first_frame + frame_count)]
+    runs = plan_seek_runs(sample_times, seek_index["keyframes"])
+    log(f"[信息] 跳读采样：需采样 {frame_count} 帧 | 跳读 {len(runs)} 次")
+
+    in_threads, out_threads = thread_args(threads)
+    w, h = seek_index["width"], seek_index["height"]
+    frame_bytes = w * h + 2 * ((w + 1) // 2) * ((h + 1) // 2)  # yuv420p 单帧字节数
+
+    writer_cmd = [FFMPEG, "-hide_banner"]
+    if quiet:
+        writer_cmd += ["-loglevel", "error"]
+    writer_cmd += [
+        "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "yuv420p",
+        "-s", f"{w}x{h}",
+        "-framerate", str(out_fps),
+        "-i", "pipe:0",
+    ]
+    if scale_part:
+        writer_cmd += ["-vf", scale_part]
+    writer_cmd += out_threads + INTERMEDIATE_CODEC_ARGS + [str(intermediate)]
+
+    writer = spawn_process(writer_cmd, stdin=subprocess.PIPE)
+    last_frame = None
+    written = 0
+    try:
+        sources = seek_index["sources"]
+        source_starts = [start for _, start in sources]
+        report_every = max(1, len(runs) // 10)
+        for run_idx, (first, count) in enumerate(runs, start=1):
+            # 合并模式：找到该时间点所在的文件，换算成文件内的时间
+            src_path, src_start = sources[max(0, bisect.bisect_right(source_starts, sample_times[first]) - 1)]
+            # -copyts -start_at_zero：保留跳读前的时间轴（同样从 0 起算），setpts 的取整与整段滤镜链完全相同；
+            # fps 的输出网格从本段首帧 first_frame / out_fps 开始，与整段滤镜链的网格重合
+            tick0 = (sample_times[first] - src_start) / speed
+            cmd = [
+                FFMPEG, "-hide_banner", "-loglevel", "error", "-nostdin",
+            ] + in_threads + [
+                "-copyts", "-start_at_zero",
+                "-ss", f"{sample_times[first] - src_start:.6f}",
+                "-i", str(src_path),
+                "-an", "-sn", "-dn",
+                "-vf", f"setpts=PTS/{speed},fps={out_fps}:start_time={tick0:.9f}",
+                "-frames:v", str(count), "-pix_fmt", "yuv420p", "-f", "rawvideo", "pipe:1",
+            ]
+
+            proc = spawn_process(cmd, stdout=subprocess.PIPE)
+            got = 0
+            try:
+                while got < count:
+                    buf = proc.stdout.read(frame_bytes)
+                    if len(buf) < frame_bytes:
+                        break
+                    writer.stdin.write(buf)
+                    last_frame = buf
+                    got += 1
+            finally:
+                proc.stdout.close()
+                rc = proc.wait()
+            if rc != 0:
+                raise subprocess.CalledProcessError(rc, cmd)
+
+            # 源视频末尾不足时用最后一帧补齐，保证总帧数与滤镜链一致
+            if got < count:
+                if last_frame is None:
+                    raise RuntimeError("跳读采样未能解码出任何帧。")
+                for _ in range(count - got):
+                    writer.stdin.write(last_frame)
+
+            written += count
+            if on_progress is not None:
+                on_progress({"frame": written})
+            if run_idx % report_every == 0 or run_idx == len(runs):
+                log(f"[信息] 跳读采样进度：{run_idx}/{len(runs)}")
+
+        writer.stdin.close()
+        rc = writer.wait()
+        if rc != 0:
+            raise subprocess.CalledProcessError(rc, writer_cmd)
+    except BaseException:
+        writer.kill()
+        writer.wait()
+        raise
+
+    return {"runs": len(runs)}
+
+
+# ----------------- 编码 -----------------
+def build_x264_args(
+    profile: str,
+    level: str,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    preset: str = DEFAULT_PRESET,
+) -> list[str]:
+    """PR 风格的 libx264 VBR 编码参数（两遍共用）"""
+    return [
+        "-an",
+        "-map_metadata", "-1",
+        "-map_chapters", "-1",
+        "-c:v", "libx264",
+        "-preset", preset,
+        "-profile:v", profile,
+        "-level:v", level,
+        "-pix_fmt", "yuv420p",
+        "-b:v", target_bitrate,
+        "-maxrate", max_bitrate,
+        "-bufsize", bufsize,
+    ]
+
+
+def cleanup_passlog(passlog: str) -> None:
+    """删除 x264 两遍编码留下的统计文件"""
+    for suffix in ["", ".mbtree", "-0.log", "-0.log.mbtree", "-0.log.temp", "-0.log.mbtree.temp"]:
+        p = Path(passlog + suffix)
+        if p.exists():
+            try:
+                p.unlink()
+            except Exception:
+                pass
+
+
+def passlog_path(output_path: Path) -> str:
+    """x264 两遍编码统计文件的前缀（与输出同目录）"""
+    return str(output_path.with_suffix("")) + "_passlog"
+
+
+def encode_two_pass(
+    pass_input_args: list[str],
+    pass_args: list[str],
+    output_path: Path,
+    quiet: bool,
+    pass1_progress=None,
+    pass2_progress=None,
+    passes: int = 2,
+) -> tuple[float, float]:
+    """
+    两遍编码：Pass 1 只生成统计文件，Pass 2 输出 output_path
+    pass_args 需已包含 -passlogfile；*_progress 见 run_ffmpeg
+    passes=1：跳过 Pass 1，单遍 ABR 直接输出（-b:v 为平均码率目标，-maxrate/-bufsize 照常限制 VBV）
+
+    Returns:
+        (pass1 耗时, pass2 耗时)；单遍时 pass1 为 0
+    """
+    ffmpeg_prefix = [FFMPEG, "-hide_banner"]
+    if quiet:
+        ffmpeg_prefix += ["-loglevel", "error"]
+    null_sink = "NUL" if is_windows() else "/dev/null"
+
+    # Pass 1
+    t_pass1 = 0.0
+    if passes == 2:
+        t0 = now_perf()
+        cmd1 = ffmpeg_prefix + ["-y"] + pass_input_args + pass_args + [
+            "-pass", "1",
+            "-f", "null", null_sink
+        ]
+        run_ffmpeg(cmd1, pass1_progress)
+        t_pass1 = now_perf() - t0
+
+    # Pass 2
+    t0 = now_perf()
+    cmd2 = ffmpeg_prefix + ["-y"] + pass_input_args + pass_args + (["-pass", "2"] if passes == 2 else []) + [
+        "-movflags", "+faststart",
+        str(output_path)
+    ]
+    run_ffmpeg(cmd2, pass2_progress)
+    t_pass2 = now_perf() - t0
+
+    return t_pass1, t_pass2
+
+
+def render_segment(
+    input_path: Path,
+    output_path: Path,
+    intermediate: Path,
+    speed: float,
+    out_fps: int,
+    first_frame: int,
+    frame_count: int,
+    source_start: float | None,
+    vf: str,
+    scale_part: str | None,
+    used_sampler: str,
+    use_intermediate: bool,
+    seek_index: dict | None,
+    x264_args: list[str],
+    quiet: bool,
+    log,
+    threads: int = 0,
+    concat: bool = False,
+    on_progress=None,
+    sample_key: str | None = None,
+    passes: int = 2,
+    pad_end: bool = False,
+) -> dict:
+    """
+    渲染输出帧 [first_frame, first_frame + frame_count) 到 output_path：采样 + 两遍编码
+
+    source_start 为 None 表示整段渲染（不加 -ss/-frames，与单进程完全一致）；
+    否则从该源时刻开始读取（-copyts，见 source_input_args），并把输出帧数限制为 frame_count。
+    分段时 vf 须按本段构造（build_timelapse_vf 的 first_frame），并传 pad_end=True，保证恰好输出 frame_count 帧
+    threads：本段所有 ffmpeg 的解码/滤镜/编码线程上限（0 = 自动）
+    concat：input_path 是 concat 列表文件（合并模式）
+    on_progress(stage, fraction, info)：各阶段（sample/pass1/pass2）的完成比例
+    sample_key：采样缓存键（None = 不缓存）。缓存的采样结果不含缩放，缩放改在两遍编码里做，
+                这样只改分辨率/适配时也能复用
+    passes：编码遍数（2 = 两遍 VBR，1 = 单遍 ABR，见 encode_two_pass）
+    pad_end：恰好输出 frame_count 帧（多的截掉，源视频不够时重复最后一帧；vf 需同样带 pad_end）
+
+    Returns:
+        {"sample", "pass1", "pass2", "passlog", "sample_cached"}
+    """
+    keyframes_only = used_sampler == "keyframe"
+    # 只解码关键帧时最后一个关键帧之后靠补帧，总要限制帧数
+    frame_limit = None if source_start is None and not keyframes_only and not pad_end else frame_count
+    in_threads, out_threads = thread_args(threads)
+    passlog = passlog_path(output_path)
+    sample_scale = None if sample_key is not None else scale_part
+    sample_temp = sample_cache_temp(sample_key) if sample_key is not None else intermediate
+    sample_file = sample_temp
+    sample_cached = False
+
+    def _stage_progress(stage: str):
+        # 各阶段输出的都是 frame_count 帧，按帧数算完成比例
+        if on_progress is None:
+            return None
+        return lambda info: on_progress(stage, info.get("frame", 0) / frame_count, info)
+
+    try:
+        # 采样阶段：先把所需帧写入无损中间文件，两遍编码都读中间文件（源视频只解码一次）
+        t_sample = 0.0
+        if sample_key is not None and (used_sampler == "seek" or use_intermediate):
+            cached = sample_cache_lookup(sample_key)
+            if cached is not None:
+                sample_file = cached
+                sample_cached = True
+                log("[信息] 命中采样缓存：跳过采样，直接从缓存的采样结果编码")
+                if on_progress is not None:
+                    on_progress("sample", 1.0, {})
+
+        if sample_cached:
+            pass
+        elif used_sampler == "seek":
+            t0 = now_perf()
+            seek_sample_to_intermediate(
+                intermediate=sample_temp,
+                seek_index=seek_index,
+                speed=speed,
+                out_fps=out_fps,
+                first_frame=first_frame,
+                frame_count=frame_count,
+                scale_part=sample_scale,
+                quiet=quiet,
+                log=log,
+                threads=threads,
+                on_progress=_stage_progress("sample"),
+            )
+            t_sample = now_perf() - t0
+        elif use_intermediate:
+            t0 = now_perf()
+            filter_sample_to_intermediate(
+                input_args=source_input_args(input_path, source_start, concat, keyframes_only),
+                intermediate=sample_temp,
+                vf=build_timelapse_vf(speed, out_fps, sample_scale, keyframes_only, pad_end,
+                                      first_frame if source_start is not None else None),
+                quiet=quiet,
+                frame_count=frame_limit,
+                threads=threads,
+                on_progress=_stage_progress("sample"),
+            )
+            t_sample = now_perf() - t0
+
+        if sample_key is not None and not sample_cached and (used_sampler == "seek" or use_intermediate):
+            sample_file = sample_cache_commit(sample_key, sample_temp)
+
+        if used_sampler == "seek" or use_intermediate:
+            pass_input_args = in_threads + ["-i", str(sample_file)]
+            pass_args = x264_args
+            if sample_scale != scale_part:
+                pass_args = ["-vf", scale_part] + pass_args
+        else:
+            pass_input_args = in_threads + source_input_args(input_path, source_start, concat, keyframes_only)
+            pass_args = ["-vf", vf] + x264_args
+            if frame_limit is not None:
+                pass_args = pass_args + ["-frames:v", str(frame_limit)]
+        pass_args = pass_args + out_threads + ["-passlogfile", passlog]
+
+        if passes == 1 and on_progress is not None:
+            on_progress("pass1", 1.0, {})
+        t_pass1, t_pass2 = encode_two_pass(
+            pass_input_args, pass_args, output_path, quiet,
+            _stage_progress("pass1"), _stage_progress("pass2"), passes,
+        )
+
+        return {"sample": t_sample, "pass1": t_pass1, "pass2": t_pass2, "passlog": passlog,
+                "sample_cached": sample_cached}
+
+    finally:
+        # 已登记进采样缓存的文件保留，其余中间文件清理掉
+        for leftover in (intermediate, sample_temp):
+            if leftover.exists():
+                try:
+                    leftover.unlink()
+                except Exception:
+                    pass
+
+
+# ----------------- 截止时间规划 -----------------
+# --deadline：按本机实测的吞吐量估算各编码方案的总耗时，选出能按时完成、画质损失最小的方案。
+# 吞吐量记在缓存目录的 throughput.json，每次整机渲染完成后按实测值平滑更新：
+#   encode：各 preset 的编码速度（输出百万像素帧/秒），分 pass1 / pass2（单遍编码与 Pass 2 工作量相同，记在 pass2）
+#   sample：各采样方式的速度（源视频 百万像素·秒 / 秒）
+# 还没有记录时，先用源视频开头几秒做一次快速校准；没测过的 preset 按 X264_PRESET_SPEED 换算。
+# 校准失败（如源视频开头损坏）时按 FALLBACK_THROUGHPUT 的保守估计规划，不中断任务。
+# 候选方案从 --preset 开始逐级变快，每级先试两遍 VBR、再试单遍 ABR。
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+X264_PRESET_SPEED = {  # 相对 medium 的编码速度（经验值，只在没有实测记录时用于换算）
+    "ultrafast": 7.0, "superfast": 5.0, "veryfast": 3.5, "faster": 1.8, "fast": 1.4,
+    "medium": 1.0, "slow": 0.65, "slower": 0.35, "veryslow": 0.15,
+}
+FIRST_PASS_COST = 0.4          # 没有实测时，Pass 1（x264 快速第一遍）耗时按 Pass 2 的该比例估算
+THROUGHPUT_FILE = "throughput.json"
+THROUGHPUT_VERSION = 1
+THROUGHPUT_SMOOTHING = 0.5     # 新测量值的权重（指数平滑：机器负载变了也能较快跟上）
+CALIBRATE_FRAMES = 120         # 快速校准时解码/编码的帧数
+FALLBACK_THROUGHPUT = {        # 校准失败时的保守估计（约为普通四核机器 1080p 的速度），其余 preset 按 X264_PRESET_SPEED 换算
+    "encode": {"medium": {"pass2": 15.0}},
+    "sample": {"filter": {"rate": 10.0}},
+}
+_throughput_lock = threading.Lock()
+
+
+def load_throughput() -> dict:
+    """读取吞吐量记录；没有或读不了时返回空记录"""
+    try:
+        with open(cache_dir() / THROUGHPUT_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == THROUGHPUT_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"version": THROUGHPUT_VERSION, "encode": {}, "sample": {}}
+
+
+def record_throughput(section: str, key: str, values: dict[str, float]) -> None:
+    """按指数平滑更新一条吞吐量记录（写不进去时忽略，不影响处理；所以刚测的值不要指望能从文件读回来）"""
+    with _throughput_lock:
+        data = load_throughput()
+        entry = data.setdefault(section, {}).setdefault(key, {})
+        for field, value in values.items():
+            old = entry.get(field)
+            entry[field] = value if old is None else old + THROUGHPUT_SMOOTHING * (value - old)
+        try:
+            write_json_atomic(cache_dir() / THROUGHPUT_FILE, data)
+        except OSError:
+            pass
+
+
+def estimate_encode_rate(throughput: dict, preset: str, stage: str) -> float | None:
+    """
+    某 preset 某阶段（pass1/pass2）的编码速度（百万像素帧/秒）
+    有实测用实测，Pass 1 没测过时按 FIRST_PASS_COST 从 Pass 2 推算；
+    该 preset 没测过时，从最接近的已测 preset 按 X264_PRESET_SPEED 换算。都没有时返回 None
+    """
+    def _stage_rate(entry: dict) -> float | None:
+        if entry.get(stage):
+            return entry[stage]
+        if stage == "pass1" and entry.get("pass2"):
+            return entry["pass2"] / FIRST_PASS_COST
+        return None
+
+    measured = []
+    for p, entry in throughput.get("encode", {}).items():
+        rate = _stage_rate(entry) if p in X264_PRESET_SPEED else None
+        if rate:
+            measured.append((abs(X264_PRESETS.index(p) - X264_PRESETS.index(preset)), p, rate))
+    if not measured:
+        return None
+    _, p, rate = min(measured)
+    return rate * X264_PRESET_SPEED[preset] / X264_PRESET_SPEED[p]
+
+
+def calibrate_throughput(source: Path, scale_part: str | None, target_wh: tuple[int, int] | None, preset: str) -> dict:
+    """
+    快速校准：解码源视频开头 CALIBRATE_FRAMES 帧，再按 preset 编码同样的帧，把两者的速度记入吞吐量记录
+    返回本次测得的值（与吞吐量记录同结构），缓存目录写不进去时调用方也能直接用
+    """
+    info = probe_video_stream(str(source))
+    src_mpx = info["width"] * info["height"] / 1e6
+    out_mpx = target_wh[0] * target_wh[1] / 1e6 if target_wh else src_mpx
+    frames = CALIBRATE_FRAMES
+    null_sink = "NUL" if is_windows() else "/dev/null"
+    base = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", str(source),
+            "-map", "0:v:0", "-frames:v", str(frames), "-an"]
+
+    t0 = now_perf()
+    run_ffmpeg(base + ["-f", "null", null_sink])
+    t_decode = now_perf() - t0
+
+    t0 = now_perf()
+    run_ffmpeg(base + (["-vf", scale_part] if scale_part else []) + [
+        "-c:v", "libx264", "-preset", preset, "-pix_fmt", "yuv420p", "-f", "null", null_sink,
+    ])
+    # 扣掉解码时间（至少按总耗时的 10% 算，避免极快的 preset 测出离谱的速度）
+    t_encode = max(now_perf() - t0 - t_decode, (now_perf() - t0) * 0.1)
+
+    measured = {
+        "sample": {"filter": {"rate": frames / (info["fps"] or 30.0) * src_mpx / max(t_decode, 1e-3)}},
+        "encode": {preset: {"pass2": frames * out_mpx / t_encode}},
+    }
+    for section, entries in measured.items():
+        for key, values in entries.items():
+            record_throughput(section, key, values)
+    return measured
+
+
+def record_render_throughput(
+    source: Path,
+    target_wh: tuple[int, int] | None,
+    dur: float,
+    frame_count: int,
+    used_sampler: str,
+    use_intermediate: bool,
+    preset: str,
+    passes: int,
+    t_sample: float,
+    t_pass1: float,
+    t_pass2: float,
+) -> None:
+    """把一次整机渲染的实测速度记入吞吐量记录（不用中间文件时两遍编码含解码时间，不记编码速度）"""
+    try:
+        info = probe_video_stream(str(source))
+    except Exception:
+        return
+    src_mpx = info["width"] * info["height"] / 1e6
+    out_mpx = target_wh[0] * target_wh[1] / 1e6 if target_wh else src_mpx
+    if t_sample > 0:
+        record_throughput("sample", used_sampler, {"rate": dur * src_mpx / t_sample})
+    if (used_sampler == "seek" or use_intermediate) and t_pass2 > 0:
+        rates = {"pass2": frame_count * out_mpx / t_pass2}
+        if passes == 2 and t_pass1 > 0:
+            rates["pass1"] = frame_count * out_mpx / t_pass1
+        record_throughput("encode", preset, rates)
+
+
+def plan_deadline(
+    jobs: list[tuple[Path, float, int]],
+    deadline: float,
+    out_fps: int,
+    target_wh: tuple[int, int] | None,
+    scale_part: str | None,
+    sampler: str,
+    seek_speed: float,
+    use_intermediate: bool,
+    preset: str,
+    log=print,
+) -> tuple[str, int]:
+    """
+    --deadline：估算各编码方案处理完 jobs 的总耗时，选出能在 deadline 秒内完成的方案
+    jobs：[(源文件, 时长, 输出帧数), ...]；合并模式（concat）传首个文件，只用来读取分辨率
+    候选从 preset 开始逐级变快，每级先两遍 VBR、再单遍 ABR；都来不及时选最快的方案并警告
+    （并行处理时按整机吞吐量估算，即各任务分享同一份 CPU）
+    返回 (preset, passes)
+    """
+    throughput = load_throughput()
+    basis, calibrated = "本机历史记录", False
+    if estimate_encode_rate(throughput, preset, "pass2") is None or "filter" not in throughput["sample"]:
+        log(f"[信息] 还没有本机的编码速度记录，先做一次快速校准（{CALIBRATE_FRAMES} 帧）…")
+        t0 = now_perf()
+        try:
+            measured = calibrate_throughput(jobs[0][0], scale_part, target_wh, preset)
+            basis, calibrated = "刚才的快速校准", True
+        except Exception as e:
+            log(f"[警告] 快速校准失败（{e}），按保守的默认速度估算")
+            measured = FALLBACK_THROUGHPUT
+            basis = "默认估计"
+        # 直接用内存里的测量值：缓存目录只读或已满时吞吐量文件读不回刚写的记录
+        for section, entries in measured.items():
+            for key, values in entries.items():
+                throughput[section][key] = {**throughput[section].get(key, {}), **values}
+        # 校准也占用期限内的时间
+        deadline = max(deadline - (now_perf() - t0), 0.0)
+        if deadline <= 0:
+            log("[警告] 截止时间已被快速校准用完，改用最快的方案")
+
+    # 与编码方案无关的采样耗时，以及需要编码的总像素量
+    sample_once = 0.0      # 写中间文件：只解码一次
+    sample_per_pass = 0.0  # 不用中间文件：每一遍编码都要重新解码源视频
+    encode_mpx = 0.0
+    for source, dur, frames in jobs:
+        try:
+            info = probe_video_stream(str(source))
+        except Exception:
+            continue  # 读不了的文件由处理时报告具体错误
+        src_mpx = info["width"] * info["height"] / 1e6
+        used, _ = resolve_sampler(sampler, dur / (frames / out_fps), seek_speed, frames,
+                                  lambda: len(build_seek_index(Path(source))["keyframes"]))
+        rate = (throughput["sample"].get(used) or throughput["sample"]["filter"])["rate"]
+        if used == "seek" or use_intermediate:
+            sample_once += dur * src_mpx / rate
+        else:
+            sample_per_pass += dur * src_mpx / rate
+        encode_mpx += frames * (target_wh[0] * target_wh[1] / 1e6 if target_wh else src_mpx)
+
+    def _predict(p: str, passes: int) -> tuple[float, float]:
+        t_encode = encode_mpx / estimate_encode_rate(throughput, p, "pass2")
+        if passes == 2:
+            t_encode += encode_mpx / estimate_encode_rate(throughput, p, "pass1")
+        return sample_once + sample_per_pass * passes, t_encode
+
+    candidates = [(p, passes) for p in reversed(X264_PRESETS[:X264_PRESETS.index(preset) + 1]) for passes in (2, 1)]
+    chosen = candidates[-1]
+    for candidate in candidates:
+        if sum(_predict(*candidate)) <= deadline:
+            chosen = candidate
+            break
+    t_sample, t_encode = _predict(*chosen)
+    predicted = t_sample + t_encode
+
+    log(f"[信息] 截止时间：{format_hms(deadline)} | 速度依据：{basis}")
+    if chosen != candidates[0]:
+        log(f"[信息] 按 {preset} 两遍 VBR 预计 {format_hms(sum(_predict(*candidates[0])))}，超出期限")
+    label = "两遍 VBR" if chosen[1] == 2 else "单遍 ABR"
+    log(f"[信息] 编码方案：{label} | preset {chosen[0]} | 预计 {format_hms(predicted)}"
+        f"（采样 {format_hms(t_sample)} + 编码 {format_hms(t_encode)}）")
+    if chosen[1] == 2:
+        log("[信息] 码率：--b/--max/--buf 全部生效（两遍 VBR，平均码率准确）")
+    else:
+        log("[信息] 码率：--max/--buf 仍作为 VBV 上限生效；--b 只是单遍 ABR 的平均码率目标，实际平均码率会有偏差")
+    if predicted > deadline:
+        log(f"[警告] 最快的方案也预计需要 {format_hms(predicted)}，超出期限 {format_hms(predicted - deadline)}；"
+            f"可缩短目标时长、降低分辨率或改用 --sampler seek/keyframe")
+    emit_event("deadline_plan", deadline=deadline, preset=chosen[0], passes=chosen[1],
+               predicted=round(predicted, 2), calibrated=calibrated)
+    return chosen
+
+
+# ----------------- 断点续跑 -----------------
+# 批量/合并模式在文件夹里维护一份任务日志（JOURNAL_NAME），记录每一项的状态：
+#   planned（待处理）/ running（处理中）/ done（已完成）/ failed（失败）
+# 每次状态变化都整份重写：先写临时文件、fsync 后再改名，断电也不会留下半份日志。
+# 输出一律先写 _temp_out_ 临时名、完成后改名，所以“输出存在”就意味着它是完整的。
+# --resume：沿用参数一致的任务日志，跳过已完成的项，清理中断时留下的临时文件，其余继续处理。
+JOURNAL_NAME = "_humanlapse_journal.json"
+JOURNAL_VERSION = 1
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """先写临时文件并落盘，再原子替换，读者永远看不到写了一半的文件"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def journal_key(folder: Path, path: Path) -> str:
+    """任务日志里的键：相对批量文件夹的路径（换了盘符/挂载点也能续跑）"""
+    try:
+        return path.relative_to(folder).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def open_journal(folder: Path, mode: str, params: dict, keys: list[str], resume: bool):
+    """
+    打开（--resume 且模式/参数一致时沿用）或新建任务日志
+
+    params：决定输出内容的参数（只用 JSON 原生类型），与上次不一致时不沿用
+    返回 (previous, update)：
+        previous：上次记录的各项状态 {键: {"state", "output", ...}}（新任务时为空）
+        update(键, 状态, **附加字段)：线程安全地更新并落盘；写不进去时只警告一次，不影响处理
+    """
+    path = folder / JOURNAL_NAME
+    previous: dict[str, dict] = {}
+    if resume:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == JOURNAL_VERSION and data.get("mode") == mode and data.get("params") == params:
+                previous = data.get("items", {})
+                done = sum(1 for k in keys if previous.get(k, {}).get("state") == "done")
+                print(f"[信息] 断点续跑：任务日志中已完成 {done}/{len(keys)} 项")
+            else:
+                print("[警告] 任务日志的模式/参数与本次不一致，按新任务从头处理")
+        except FileNotFoundError:
+            print(f"[信息] 没有找到任务日志（{path.name}），按新任务处理")
+        except (OSError, ValueError) as e:
+            print(f"[警告] 任务日志无法读取（{e}），按新任务处理")
+
+    now = time.time()
+    items = {k: dict(previous.get(k) or {"state": "planned", "updated": now}) for k in keys}
+    data = {"version": JOURNAL_VERSION, "mode": mode, "params": params, "created": now, "items": items}
+    lock = threading.Lock()
+    broken = False
+
+    def _write():
+        nonlocal broken
+        if broken:
+            return
+        try:
+            write_json_atomic(path, data)
+        except OSError as e:
+            broken = True
+            print(f"[警告] 任务日志写入失败，本次无法断点续跑：{e}")
+
+    def update(key: str, state: str, **fields):
+        with lock:
+            entry = items.setdefault(key, {})
+            entry.update(fields, state=state, updated=time.time())
+            _write()
+
+    with lock:
+        _write()
+    return previous, update
+
+
+def cleanup_orphans(output_path: Path, keep: set[Path] | None = None) -> int:
+    """
+    删除生成 output_path 的任务中断后留下的临时文件：
+    临时输出、分段、采样中间文件、passlog、concat 列表、缓存链接的 .part
+    keep：需要保留的文件（例如续跑时可复用的已完成分段）
+
+    Returns:
+        删除的文件数
+    """
+    stem, name = glob.escape(output_path.stem), glob.escape(output_path.name)
+    patterns = [
+        f"_temp_out_{name}",
+        f"_temp_out_{stem}_passlog*",
+        f"_temp_seg_{stem}_*",
+        f"_temp_sample_{stem}*",
+        f"_concat_list_{stem}.txt",
+        f"{stem}_passlog*",
+        f"{name}.part",
+    ]
+    removed = 0
+    for pattern in patterns:
+        for p in output_path.parent.glob(pattern):
+            if keep and p in keep:
+                continue
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def load_chunk_manifest(chunk_dir: Path, key: str, chunk_files: list[Path]) -> dict[str, dict]:
+    """
+    读取分块临时目录的 manifest.json：key（输入内容 + 参数 + 分块方式）一致时返回仍然完好的
+    已完成块 {块序号: {"frames", "size"}}；目录里其它残留（未完成的块、中间文件、passlog）一律删除
+    """
+    chunk_dir.mkdir(exist_ok=True)
+    manifest_path = chunk_dir / "manifest.json"
+    done: dict[str, dict] = {}
+    matched = False
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        matched = manifest.get("key") == key
+        if matched:
+            for idx, info in manifest.get("chunks", {}).items():
+                i = int(idx)
+                if i < len(chunk_files) and chunk_files[i].exists() and chunk_files[i].stat().st_size == info.get("size"):
+                    done[idx] = info
+    except (OSError, ValueError):
+        pass
+
+    keep = {chunk_files[int(idx)] for idx in done}
+    if matched:
+        keep.add(manifest_path)
+    for p in chunk_dir.iterdir():
+        if p not in keep and p.is_file():
+            try:
+                p.unlink()
+            except OSError:
+                pass
+    return done
+
+
+# ----------------- 处理参数 -----------------
+@dataclass
+class TimelapseOptions:
+    """加速处理的参数（与命令行参数一一对应，默认值取自配置区）"""
+    target_seconds: float = DEFAULT_TARGET_SECONDS
+    out_fps: int = DEFAULT_FPS
+    target_bitrate: str = DEFAULT_TARGET_BITRATE
+    max_bitrate: str = DEFAULT_MAX_BITRATE
+    bufsize: str = DEFAULT_BUFSIZE
+    profile: str = DEFAULT_PROFILE
+    level: str = DEFAULT_LEVEL
+    preset: str = DEFAULT_PRESET
+    res: str = DEFAULT_RES
+    size: str | None = None
+    fit: str = DEFAULT_FIT
+    sampler: str = DEFAULT_SAMPLER
+    seek_speed: float = DEFAULT_SEEK_SPEED
+    use_intermediate: bool = DEFAULT_INTERMEDIATE
+    jobs: int = DEFAULT_JOBS
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS
+    deadline: float | None = None
+    skip_existing: bool = DEFAULT_SKIP_EXISTING
+    quiet: bool = DEFAULT_QUIET
+    log_spec: str | None = DEFAULT_LOG  # None = 不写日志
+
+    def kwargs(self, *omit: str) -> dict:
+        """展开成 timelapse_one / batch_process 等的关键字参数；omit 为目标函数不接受的字段"""
+        return {k: v for k, v in asdict(self).items() if k not in omit}
+
+
+def accepts_options(*omit: str):
+    """
+    处理函数的装饰器：除逐个关键字参数外也接受 options=TimelapseOptions(...)，
+    字段展开成同名参数，调用时显式给出的参数优先。omit 为被装饰函数没有的字段
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, options: TimelapseOptions | None = None, **kwargs):
+            if options is not None:
+                kwargs = {**options.kwargs(*omit), **kwargs}
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ----------------- 单文件处理（含细分统计+可写日志） -----------------
+def job_stats(
+    dur: float,
+    speed: float,
+    t_total: float,
+    sampler: str,
+    preset: str,
+    passes: int = 2,
+    segments: int = 1,
+    cached: bool = False,
+    probe: float = 0.0,
+    filterprep: float = 0.0,
+    index: float = 0.0,
+    sample: float = 0.0,
+    pass1: float = 0.0,
+    pass2: float = 0.0,
+    concat: float = 0.0,
+    cleanup: float = 0.0,
+    sample_cached: int = 0,
+    chunks_reused: int = 0,
+) -> dict:
+    """一个输出的统计（timelapse_one 与 timelapse_multi 共用；正常渲染与命中渲染缓存时字段一致）"""
+    return {
+        "skipped": False,
+        "cached": cached,
+        "dur": dur,
+        "speed": speed,
+        "probe": probe,
+        "filterprep": filterprep,
+        "index": index,
+        "sample": sample,
+        "pass1": pass1,
+        "pass2": pass2,
+        "concat": concat,
+        "cleanup": cleanup,
+        "total": t_total,
+        "realtime": dur / t_total if t_total > 0 else 0.0,
+        "sampler": sampler,
+        "segments": segments,
+        "sample_cached": sample_cached,
+        "chunks_reused": chunks_reused,
+        "preset": preset,
+        "passes": passes,
+    }
+
+
+def skipped_job_stats(dur: float, speed: float) -> dict:
+    """--skip-existing 跳过时的统计"""
+    return {
+        "skipped": True,
+        "reason": "output exists",
+        "dur": dur,
+        "speed": speed,
+        "total": 0.0,
+        "realtime": 0.0,
+    }
+
+
+@accepts_options()
+def timelapse_one(
+    input_path: Path,
+    target_seconds: float,
+    out_fps: int,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    profile: str,
+    level: str,
+    res: str,
+    size: str | None,
+    fit: str,
+    quiet: bool,
+    log_spec: str | None,
+    skip_existing: bool,
+    sampler: str = DEFAULT_SAMPLER,
+    seek_speed: float = DEFAULT_SEEK_SPEED,
+    use_intermediate: bool = DEFAULT_INTERMEDIATE,
+    jobs: int = DEFAULT_JOBS,
+    threads: int = 0,
+    concat_sources: list[tuple[Path, float]] | None = None,
+    output_path: Path | None = None,
+    on_progress=None,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    preset: str = DEFAULT_PRESET,
+    passes: int = 2,
+    deadline: float | None = None,
+    frame_budget: int | None = None,
+) -> tuple[Path, dict]:
+    """
+    单文件加速。参数可逐个给出，也可用 options=TimelapseOptions(...) 一次给出（见 accepts_options）
+    threads：本任务可用的线程上限（0 = 自动）；分段并行时平均分给同时渲染的各段
+    frame_budget：恰好输出这么多帧（多的截掉，不够时重复最后一帧）；给出时 target_seconds 应为 frame_budget / out_fps。
+                  并行合并的各部分用它保证帧数之和与整体目标一致
+    preset/passes：x264 preset 与编码遍数（2 = 两遍 VBR，1 = 单遍 ABR）
+    deadline：截止秒数；给出时按本机吞吐量重新选择 preset/passes（见 plan_deadline），preset 为最慢的候选
+    chunk_seconds：> 0 时按每块该输出秒数分块渲染（同时渲染 jobs 块）。完成的块保存在
+                   输出旁的 _temp_chunks_<输出名>/ 并记入 manifest.json，中断后再运行只重做缺失的块
+    concat_sources：合并模式，[(文件, 时长), ...]；此时 input_path 为 concat 列表文件，
+                    总时长直接取各文件时长之和，用 concat 分离器边读边处理，不生成合并后的临时文件
+    output_path：指定输出路径（默认按输入文件名自动生成）
+    on_progress(fraction, info)：整体进度回调（批量/合并汇总用）；为 None 时在控制台显示本任务的进度
+    返回 (output_path, stats)
+    stats: probe/filterprep/index/sample/pass1/pass2/concat/cleanup/total/realtime/speed/dur/sampler/segments/preset/passes
+    （index 仅在跳读采样时非 0；sample 在不使用中间文件时为 0；concat 仅在分段并行时非 0；
+      分段并行时 sample/pass1/pass2 为各段累计耗时；单遍编码时 pass1 为 0，编码耗时记在 pass2）
+    """
+    if not input_path.exists():
+        raise FileNotFoundError(f"找不到文件：{input_path}")
+
+    t_total0 = now_perf()
+    pauses0 = governor_pause_count()
+
+    # probe 阶段
+    t0 = now_perf()
+    if concat_sources is not None:
+        dur = sum(d for _, d in concat_sources)
+    else:
+        dur = probe_duration_seconds(str(input_path))
+    t_probe = now_perf() - t0
+    concat = concat_sources is not None
+
+    speed = dur / target_seconds  # 自动加速/减速
+
+    # 分辨率滤镜准备阶段
+    t0 = now_perf()
+    target_wh = resolve_target_size(res=res, size=size)
+    scale_part = build_scale_filter(target_wh, fit)  # 可能为 None
+    t_filterprep = now_perf() - t0
+
+    frame_count = output_frame_count(target_seconds, out_fps) if frame_budget is None else frame_budget
+    pad_end = frame_budget is not None
+
+    # 只解码关键帧：先数一下关键帧（只解复用，结果缓存），太稀疏时画面会大量重复
+    t0 = now_perf()
+    used_sampler, keyframe_count = resolve_sampler(
+        sampler, speed, seek_speed, frame_count,
+        lambda: len(build_seek_index(input_path, concat_sources)["keyframes"]),
+    )
+    t_index = 0.0
+    keyframe_note = None
+    if keyframe_count is not None:
+        t_index = now_perf() - t0
+        gop = dur / keyframe_count if keyframe_count else dur
+        if keyframe_count >= frame_count:
+            keyframe_note = f"[信息] 关键帧：{keyframe_count} 个（平均每 {gop:.2f}s 一个）"
+        elif used_sampler != "keyframe":
+            keyframe_note = (f"[信息] 关键帧太稀疏（{keyframe_count} 个，输出需要 {frame_count} 帧），"
+                             f"改用{'关键帧跳读' if used_sampler == 'seek' else '滤镜链'}")
+        else:
+            keyframe_note = (f"[警告] 关键帧太稀疏：平均每 {gop:.2f}s 一个关键帧，而每个输出帧对应 "
+                             f"{speed / out_fps:.2f}s 源视频，{frame_count} 帧中只有约 {keyframe_count} 帧是新画面，"
+                             f"其余为重复帧。可改用 --sampler seek 或 filter")
+
+    if output_path is None:
+        output_path = compute_output_path(input_path, target_seconds, target_wh, fit)
+
+    plan_lines: list[str] = []
+    if deadline is not None:
+        first_source = concat_sources[0][0] if concat else input_path
+        preset, passes = plan_deadline(
+            [(first_source, dur, frame_count)], deadline, out_fps, target_wh, scale_part,
+            used_sampler, seek_speed, use_intermediate, preset, log=plan_lines.append,
+        )
+
+    chunked = chunk_seconds > 0
+    segments = plan_chunks(frame_count, out_fps, chunk_seconds) if chunked else plan_segments(frame_count, jobs, out_fps)
+    chunked = chunked and len(segments) > 1
+
+    vf = build_timelapse_vf(speed, out_fps, scale_part, keyframes_only=used_sampler == "keyframe", pad_end=pad_end)
+    x264_args = build_x264_args(profile, level, target_bitrate, max_bitrate, bufsize, preset)
+
+    # 缓存键：输入内容指纹 + 影响结果的参数
+    #   渲染缓存：全部编码参数（中间文件与否不影响输出，不计入）
+    #   采样缓存：只与采样有关的参数，各段分别缓存（见 _sample_key）
+    render_key = None
+    fingerprints = None
+    use_sample_cache = SAMPLE_CACHE_ENABLED and (used_sampler == "seek" or use_intermediate)
+    if RENDER_CACHE_ENABLED or use_sample_cache or chunked:
+        t0 = now_perf()
+        sources = [p for p, _ in concat_sources] if concat else [input_path]
+        fingerprints = [file_fingerprint(str(p)) for p in sources]
+        t_probe += now_perf() - t0
+    if RENDER_CACHE_ENABLED:
+        render_key = render_cache_key(
+            "render", fingerprints,
+            vf=vf, frames=frame_count, out_fps=out_fps, x264=x264_args,
+            sampler=used_sampler, segments=segments, passes=passes,
+            **({"exact_segments": True} if len(segments) > 1 else {}),
+        )
+
+    def _sample_key(first: int, count: int, ranged: bool) -> str | None:
+        if not use_sample_cache:
+            return None
+        return render_cache_key(
+            "sample", fingerprints,
+            target=target_seconds, out_fps=out_fps, sampler=used_sampler,
+            first=first, count=count, ranged=ranged,
+            **({"padded": True} if pad_end else {}),
+            **({"exact_segments": True} if ranged else {}),
+        )
+
+    def _job_stats(t_total: float, **stages) -> dict:
+        return job_stats(dur, speed, t_total, used_sampler, preset, passes, segments=len(segments),
+                         probe=t_probe, filterprep=t_filterprep, index=t_index, **stages)
+
+    if skip_existing and output_path.exists():
+        if render_key is not None and render_output_is_stale(output_path, render_key):
+            # 输出是用别的输入内容或参数生成的（例如源文件被替换过）：重新渲染
+            print(f"[信息] 已存在的输出与当前输入/参数不一致，重新渲染：{output_path.name}")
+        else:
+            # 仍返回 stats，标记 skip
+            emit_event("job_end", input=str(input_path), output=str(output_path), skipped=True)
+            return output_path, skipped_job_stats(dur, speed)
+
+    log_path = derive_log_path(log_spec, output_path)
+    log, log_close = make_logger(log_path)
+
+    # 进度：各段按帧数、各阶段按 STAGE_WEIGHTS 分摊权重
+    job_progress = make_progress(
+        "job", "", on_update=on_progress, console=on_progress is None,
+        input=str(input_path), output=str(output_path),
+    )
+    stage_weights = STAGE_WEIGHTS["intermediate" if used_sampler == "seek" or use_intermediate else "direct"]
+
+    def _segment_progress(i: int):
+        seg_weight = segments[i][1] / frame_count
+
+        def _report(stage: str, fraction: float, info: dict):
+            job_progress((i, stage), seg_weight * stage_weights[stage], fraction,
+                         stage=stage, segment=i, **info)
+        return _report
+    work_output = partial_output_path(output_path)
+    chunk_dir = output_path.with_name(f"_temp_chunks_{output_path.stem}")
+    segment_files = []
+    if chunked:
+        segment_files = [chunk_dir / f"chunk_{i:04d}.mp4" for i in range(len(segments))]
+    elif len(segments) > 1:
+        segment_files = [
+            output_path.with_name(f"_temp_seg_{output_path.stem}_{i:03d}.mp4")
+            for i in range(len(segments))
+        ]
+
+    try:
+        log(f"[信息] 开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if log_path:
+            log(f"[信息] 日志文件：{log_path}")
+
+        if render_key is not None and render_cache_fetch(render_key, output_path):
+            t_total = now_perf() - t_total0
+            log(f"[信息] 命中渲染缓存：相同内容、相同参数已渲染过，直接复用（{format_hms(t_total)}）")
+            log(f"[完成] 输出：{output_path}")
+            stats = _job_stats(t_total, cached=True)
+            emit_event("job_end", input=str(input_path), output=str(output_path), **stats)
+            return output_path, stats
+
+        if concat:
+            log(f"[信息] 输入：{len(concat_sources)} 个文件（concat 直接读取，不生成合并文件）")
+        else:
+            log(f"[信息] 输入：{input_path}")
+        log(f"[信息] 输入时长：{dur:.2f}s")
+        log(f"[信息] 目标：{target_seconds:.2f}s | 加速倍率：{speed:.2f}x（>1加速，<1减速）")
+        if target_wh is None:
+            log(f"[信息] 分辨率：保持源分辨率")
+        else:
+            log(f"[信息] 分辨率：{target_wh[0]}x{target_wh[1]} | 适配：{fit} | 缩放：lanczos")
+        log(f"[信息] 导出：{out_fps}fps | {'VBR 2次' if passes == 2 else '单遍 ABR'} | preset {preset}"
+            f" | 目标 {target_bitrate} / 最大 {max_bitrate} | {profile}@{level}")
+        for line in plan_lines:
+            log(line)
+        sampler_label = {"seek": "关键帧跳读", "keyframe": "只解码关键帧"}.get(used_sampler, "滤镜链（逐帧解码）")
+        log(f"[信息] 采样：{sampler_label}"
+            f" | {'无损中间文件' if used_sampler == 'seek' or use_intermediate else '两遍各解码一次源视频'}")
+        if keyframe_note:
+            log(keyframe_note)
+        if chunked:
+            log(f"[信息] 分块渲染：{len(segments)} 块 | 共 {frame_count} 帧 | 每块 {segments[0][1]} 帧"
+                f" | 同时渲染 {min(jobs, len(segments))} 块 | 临时目录：{chunk_dir.name}")
+        elif len(segments) > 1:
+            log(f"[信息] 分段并行：{len(segments)} 段 | 共 {frame_count} 帧 | 每段约 {frame_count // len(segments)} 帧")
+        log(f"[信息] 输出：{output_path}")
+        emit_event("job_start", input=str(input_path), output=str(output_path), dur=dur, speed=speed,
+                   frames=frame_count, sampler=used_sampler, segments=len(segments))
+
+        # 关键帧索引：整段只建一次，各分段共用
+        seek_index = None
+        if used_sampler == "seek":
+            t0 = now_perf()
+            seek_index = build_seek_index(input_path, concat_sources)
+            t_index += now_perf() - t0
+            log(f"[信息] 关键帧索引：{len(seek_index['keyframes'])} 个关键帧")
+
+        t_concat = 0.0
+        if len(segments) == 1:
+            log(f"[信息] 渲染开始…（{'采样 → Pass 1 → Pass 2' if passes == 2 else '采样 → 单遍编码'}）")
+            results = [render_segment(
+                input_path=input_path,
+                output_path=work_output,
+                intermediate=output_path.with_name(f"_temp_sample_{output_path.stem}.mkv"),
+                speed=speed,
+                out_fps=out_fps,
+                first_frame=0,
+                frame_count=frame_count,
+                source_start=None,
+                vf=vf,
+                scale_part=scale_part,
+                used_sampler=used_sampler,
+                use_intermediate=use_intermediate,
+                seek_index=seek_index,
+                x264_args=x264_args,
+                quiet=quiet,
+                log=log,
+                threads=threads,
+                concat=concat,
+                on_progress=_segment_progress(0),
+                sample_key=_sample_key(0, frame_count, False),
+                passes=passes,
+                pad_end=pad_end,
+            )]
+            log("[信息] 渲染完成。")
+        else:
+            # 分段并行：按输出帧切分，每段读取源视频对应的时间段，独立采样并两遍编码
+            step = speed / out_fps
+            workers = min(jobs, len(segments))
+            seg_threads = max(1, threads // workers) if threads > 0 else 0
+            if not quiet and workers > 1:
+                log("[信息] 分段并行时各 ffmpeg 只输出错误信息，避免控制台输出交错")
+
+            # 分块：沿用参数一致的 manifest 中已完成的块，其余残留清空
+            chunk_done: dict[str, dict] = {}
+            manifest_lock = threading.Lock()
+            if chunked:
+                chunk_key = render_cache_key(
+                    "chunks", fingerprints,
+                    vf=vf, frames=frame_count, out_fps=out_fps, x264=x264_args,
+                    sampler=used_sampler, segments=segments, passes=passes, exact_segments=True,
+                )
+                chunk_done = load_chunk_manifest(chunk_dir, chunk_key, segment_files)
+                if chunk_done:
+                    log(f"[信息] 沿用上次已完成的 {len(chunk_done)}/{len(segments)} 块，只渲染缺失的块")
+
+            def _render(i: int) -> dict:
+                first, count = segments[i]
+                label = "分块" if chunked else "分段"
+                if str(i) in chunk_done:
+                    for stage in stage_weights:
+                        _segment_progress(i)(stage, 1.0, {})
+                    return {"sample": 0.0, "pass1": 0.0, "pass2": 0.0, "sample_cached": False,
+                            "passlog": passlog_path(segment_files[i]), "reused": True}
+                log(f"[信息] {label} {i + 1}/{len(segments)} 开始：输出帧 {first}-{first + count - 1}")
+                # 分块：先写临时名，完成后改名并记入 manifest（中断时不会留下不完整的块）
+                seg_output = partial_output_path(segment_files[i]) if chunked else segment_files[i]
+                result = render_segment(
+                    input_path=input_path,
+                    output_path=seg_output,
+                    intermediate=(chunk_dir / f"_temp_sample_{i:04d}.mkv") if chunked
+                    else output_path.with_name(f"_temp_sample_{output_path.stem}_{i:03d}.mkv"),
+                    speed=speed,
+                    out_fps=out_fps,
+                    first_frame=first,
+                    frame_count=count,
+                    source_start=first * step,
+                    vf=build_timelapse_vf(speed, out_fps, scale_part, used_sampler == "keyframe",
+                                          pad_end=True, first_frame=first),
+                    scale_part=scale_part,
+                    used_sampler=used_sampler,
+                    use_intermediate=use_intermediate,
+                    seek_index=seek_index,
+                    x264_args=x264_args,
+                    quiet=True,
+                    log=log,
+                    threads=seg_threads,
+                    concat=concat,
+                    on_progress=_segment_progress(i),
+                    sample_key=_sample_key(first, count, True),
+                    passes=passes,
+                    pad_end=True,  # 各段恰好 count 帧，拼接后总帧数与整段渲染一致
+                )
+                if chunked:
+                    os.replace(seg_output, segment_files[i])
+                    cleanup_passlog(result["passlog"])
+                    with manifest_lock:
+                        chunk_done[str(i)] = {"frames": count, "size": segment_files[i].stat().st_size}
+                        write_json_atomic(chunk_dir / "manifest.json", {"key": chunk_key, "chunks": chunk_done})
+                log(f"[信息] {label} {i + 1}/{len(segments)} 完成。")
+                return result
+
+            results = run_all_or_cancel(_render, list(range(len(segments))), workers)
+
+            # 各段编码参数一致，直接流复制拼接
+            t0 = now_perf()
+            merge_videos(segment_files, work_output, quiet, faststart=True)
+            t_concat = now_perf() - t0
+            got = probe_frame_count(str(work_output))
+            if got != frame_count:
+                raise RuntimeError(f"分段拼接后共 {got} 帧，应为 {frame_count} 帧")
+
+        # 完整写好后才改名为正式输出（若原输出是渲染缓存的硬链接，替换也不会改到缓存）
+        os.replace(work_output, output_path)
+        if chunked:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+        t_sample = sum(r["sample"] for r in results)
+        t_pass1 = sum(r["pass1"] for r in results)
+        t_pass2 = sum(r["pass2"] for r in results)
+        sample_cached = sum(r["sample_cached"] for r in results)
+        chunks_reused = sum(1 for r in results if r.get("reused"))
+
+        if render_key is not None:
+            render_cache_store(render_key, output_path)
+
+        # 记录本机吞吐量供 --deadline 规划：只记独占整机的单进程渲染（分段/并行时各进程互相抢 CPU），
+        # 中途被自适应暂停过的也不记
+        if len(segments) == 1 and threads == 0 and not sample_cached and governor_pause_count() == pauses0:
+            record_render_throughput(
+                concat_sources[0][0] if concat else input_path, target_wh, dur, frame_count,
+                used_sampler, use_intermediate, preset, passes, t_sample, t_pass1, t_pass2,
+            )
+
+        # cleanup
+        t0 = now_perf()
+        for r in results:
+            cleanup_passlog(r["passlog"])
+        for seg_file in segment_files:
+            if seg_file.exists():
+                try:
+                    seg_file.unlink()
+                except Exception:
+                    pass
+        t_cleanup = now_perf() - t0
+
+        t_total = now_perf() - t_total0
+        realtime = dur / t_total if t_total > 0 else 0.0
+
+        seg_note = "，各段累计" if len(segments) > 1 else ""
+        log(f"[统计] probe(读取时长): {format_hms(t_probe)}（{t_probe:.2f}s）")
+        log(f"[统计] filterprep(准备滤镜): {format_hms(t_filterprep)}（{t_filterprep:.2f}s）")
+        if used_sampler == "seek" or t_index > 0:
+            log(f"[统计] index(关键帧索引): {format_hms(t_index)}（{t_index:.2f}s）")
+        if used_sampler == "seek" or use_intermediate:
+            cached_note = f"，{sample_cached}/{len(results)} 段命中采样缓存" if sample_cached else ""
+            log(f"[统计] sample(采样{seg_note}{cached_note}): {format_hms(t_sample)}（{t_sample:.2f}s）")
+        if passes == 2:
+            log(f"[统计] pass1(第一遍{seg_note}): {format_hms(t_pass1)}（{t_pass1:.2f}s）")
+            log(f"[统计] pass2(第二遍{seg_note}): {format_hms(t_pass2)}（{t_pass2:.2f}s）")
+        else:
+            log(f"[统计] encode(单遍编码{seg_note}): {format_hms(t_pass2)}（{t_pass2:.2f}s）")
+        if chunks_reused:
+            log(f"[统计] 分块：沿用上次完成的 {chunks_reused}/{len(segments)} 块")
+        if len(segments) > 1:
+            log(f"[统计] concat(拼接分段): {format_hms(t_concat)}（{t_concat:.2f}s）")
+        log(f"[统计] cleanup(清理log): {format_hms(t_cleanup)}（{t_cleanup:.2f}s）")
+        log(f"[统计] total(总耗时): {format_hms(t_total)}（{t_total:.2f}s）")
+        log(f"[统计] 处理速度：{realtime:.2f}x realtime（输入时长/总耗时）")
+
+        log(f"[完成] 输出：{output_path}")
+
+        stats = _job_stats(t_total, sample=t_sample, pass1=t_pass1, pass2=t_pass2, concat=t_concat,
+                           cleanup=t_cleanup, sample_cached=sample_cached, chunks_reused=chunks_reused)
+        emit_event("job_end", input=str(input_path), output=str(output_path), **stats)
+        return output_path, stats
+
+    except Exception as e:
+        emit_event("job_failed", input=str(input_path), output=str(output_path), error=str(e))
+        raise
+
+    finally:
+        # 失败/取消时也不要留下分段、半成品输出和它们的 passlog（分块模式保留已完成的块，下次接着渲染）
+        for seg_file in ([] if chunked else segment_files) + [work_output]:
+            cleanup_passlog(passlog_path(seg_file))
+            if seg_file.exists():
+                try:
+                    seg_file.unlink()
+                except Exception:
+                    pass
+        log_close()
+
+
+# ----------------- 多版本输出 -----------------
+def timelapse_multi(
+    input_path: Path,
+    renditions: list[dict],
+    out_fps: int,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    profile: str,
+    level: str,
+    quiet: bool,
+    log_spec: str | None,
+    skip_existing: bool,
+    jobs: int = DEFAULT_JOBS,
+    preset: str = DEFAULT_PRESET,
+) -> list[tuple[Path, dict]]:
+    """
+    同一个源视频一次输出多个版本（不同时长/分辨率/适配）：
+    1. 源视频只解码一次，filter_complex split 到各版本的 setpts/fps/scale，各写一个无损中间文件
+    2. 各版本从自己的中间文件两遍编码（同时进行 jobs 个）
+
+    renditions：parse_rendition 的结果列表；输出文件名按 compute_output_path 生成
+    返回 [(output_path, stats), ...]，与 renditions 顺序一致；
+    stats 与 timelapse_one 相同，其中 sample 为各版本共用的那一次解码；
+    渲染缓存与 --skip-existing 的过期判断也与 timelapse_one 相同，按版本分别处理
+    """
+    if not input_path.exists():
+        raise FileNotFoundError(f"找不到文件：{input_path}")
+
+    t_total0 = now_perf()
+    t0 = now_perf()
+    dur = probe_duration_seconds(str(input_path))
+    t_probe = now_perf() - t0
+
+    t0 = now_perf()
+    items = []
+    for r in renditions:
+        target_wh = resolve_target_size(res=r["res"], size=r["size"])
+        scale_part = build_scale_filter(target_wh, r["fit"])
+        speed = dur / r["target_seconds"]
+        output_path = compute_output_path(input_path, r["target_seconds"], target_wh, r["fit"])
+        items.append({
+            "rendition": r,
+            "target_wh": target_wh,
+            "speed": speed,
+            "vf": build_timelapse_vf(speed, out_fps, scale_part),
+            "output": output_path,
+            "intermediate": output_path.with_name(f"_temp_sample_{output_path.stem}.mkv"),
+            "frames": output_frame_count(r["target_seconds"], out_fps),
+        })
+    t_filterprep = now_perf() - t0
+
+    outputs = [it["output"] for it in items]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("有两个输出版本的时长、分辨率、适配完全相同")
+
+    x264_args = build_x264_args(profile, level, target_bitrate, max_bitrate, bufsize, preset)
+
+    # 缓存键与 timelapse_one 的单段渲染一致（滤镜链采样、两遍编码）
+    for it in items:
+        it["render_key"] = None
+    if RENDER_CACHE_ENABLED:
+        t0 = now_perf()
+        fingerprints = [file_fingerprint(str(input_path))]
+        t_probe += now_perf() - t0
+        for it in items:
+            it["render_key"] = render_cache_key(
+                "render", fingerprints,
+                vf=it["vf"], frames=it["frames"], out_fps=out_fps, x264=x264_args,
+                sampler="filter", segments=[(0, it["frames"])], passes=2,
+            )
+
+    def _stats(it: dict, t_total: float, **stages) -> dict:
+        return job_stats(dur, it["speed"], t_total, "filter", preset, 2,
+                         probe=t_probe, filterprep=t_filterprep, **stages)
+
+    results: dict[int, tuple[Path, dict]] = {}
+    todo = []
+    for i, it in enumerate(items):
+        if skip_existing and it["output"].exists():
+            if it["render_key"] is not None and render_output_is_stale(it["output"], it["render_key"]):
+                print(f"[信息] 已存在的输出与当前输入/参数不一致，重新渲染：{it['output'].name}")
+            else:
+                results[i] = (it["output"], skipped_job_stats(dur, it["speed"]))
+                emit_event("job_end", input=str(input_path), output=str(it["output"]), skipped=True)
+                continue
+        if it["render_key"] is not None and render_cache_fetch(it["render_key"], it["output"]):
+            stats = _stats(it, now_perf() - t_total0, cached=True)
+            print(f"[信息] 命中渲染缓存：相同内容、相同参数已渲染过，直接复用 → {it['output'].name}")
+            results[i] = (it["output"], stats)
+            emit_event("job_end", input=str(input_path), output=str(it["output"]), **stats)
+            continue
+        todo.append(i)
+    if not todo:
+        return [results[i] for i in range(len(items))]
+
+    # 日志：公共信息写入每个版本的日志，控制台只打印一次
+    loggers = [make_logger(derive_log_path(log_spec, items[i]["output"]), echo=False) for i in todo]
+
+    def log(msg: str):
+        print(msg)
+        for _log, _ in loggers:
+            _log(msg)
+
+    workers = max(1, min(jobs, len(todo)))
+    cpu = available_cpus()
+    threads = max(1, cpu // workers) if workers > 1 else 0
+
+    # 进度：共用解码占一半，其余按版本平分给两遍编码
+    job_progress = make_progress("job", "", input=str(input_path), renditions=len(todo))
+    per_item = 0.5 / len(todo)
+
+    def _item_progress(i: int, stage: str, weight: float):
+        return lambda info: job_progress((i, stage), weight, info.get("frame", 0) / items[i]["frames"],
+                                         stage=stage, rendition=i, **info)
+
+    try:
+        log(f"[信息] 开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        log(f"[信息] 输入：{input_path}")
+        log(f"[信息] 输入时长：{dur:.2f}s")
+        log(f"[信息] 多版本输出：{len(todo)} 个版本，源视频只解码一次")
+        for i in todo:
+            it = items[i]
+            r = it["rendition"]
+            wh = "源分辨率" if it["target_wh"] is None else f"{it['target_wh'][0]}x{it['target_wh'][1]} {r['fit']}"
+            log(f"[信息]   {r['target_seconds']:g}s | {wh} | {it['speed']:.2f}x → {it['output'].name}")
+        log(f"[信息] 导出：{out_fps}fps | VBR 2次 | preset {preset} | 目标 {target_bitrate} / 最大 {max_bitrate} | {profile}@{level}")
+        emit_event("job_start", input=str(input_path), outputs=[str(items[i]["output"]) for i in todo], dur=dur)
+
+        # 1. 一次解码，多路采样
+        log("[信息] 采样开始…（一次解码，多路输出）")
+        t0 = now_perf()
+        first = todo[0]
+        filter_sample_multi(
+            input_path=input_path,
+            outputs=[(items[i]["vf"], items[i]["intermediate"]) for i in todo],
+            quiet=quiet,
+            on_progress=lambda info: job_progress("sample", 0.5, info.get("frame", 0) / items[first]["frames"],
+                                                  stage="sample", **info),
+        )
+        t_sample = now_perf() - t0
+        log("[信息] 采样完成。")
+
+        # 2. 各版本两遍编码
+        in_threads, out_threads = thread_args(threads)
+
+        def _encode(i: int) -> tuple[float, float]:
+            it = items[i]
+            pass_args = x264_args + out_threads + ["-passlogfile", passlog_path(it["output"])]
+            log(f"[信息] 编码开始：{it['output'].name}")
+            times = encode_two_pass(
+                in_threads + ["-i", str(it["intermediate"])], pass_args, partial_output_path(it["output"]),
+                True if workers > 1 else quiet,
+                _item_progress(i, "pass1", per_item * 0.4),
+                _item_progress(i, "pass2", per_item * 0.6),
+            )
+            os.replace(partial_output_path(it["output"]), it["output"])
+            if it["render_key"] is not None:
+                render_cache_store(it["render_key"], it["output"])
+            log(f"[信息] 编码完成：{it['output'].name}")
+            return times
+
+        with job_pool(workers) as pool:
+            pass_times = dict(zip(todo, pool.map(_encode, todo)))
+
+        for k, i in enumerate(todo):
+            it = items[i]
+            t0 = now_perf()
+            cleanup_passlog(passlog_path(it["output"]))
+            t_cleanup = now_perf() - t0
+            t_pass1, t_pass2 = pass_times[i]
+            t_total = now_perf() - t_total0
+            stats = _stats(it, t_total, sample=t_sample, pass1=t_pass1, pass2=t_pass2, cleanup=t_cleanup)
+            results[i] = (it["output"], stats)
+
+            _log = loggers[k][0]
+            for msg in [
+                f"\n[统计] ===== {it['output'].name} =====",
+                f"[统计] probe(读取时长): {format_hms(t_probe)}（{t_probe:.2f}s）",
+                f"[统计] filterprep(准备滤镜): {format_hms(t_filterprep)}（{t_filterprep:.2f}s）",
+                f"[统计] sample(采样，各版本共用): {format_hms(t_sample)}（{t_sample:.2f}s）",
+                f"[统计] pass1(第一遍): {format_hms(t_pass1)}（{t_pass1:.2f}s）",
+                f"[统计] pass2(第二遍): {format_hms(t_pass2)}（{t_pass2:.2f}s）",
+                f"[统计] cleanup(清理log): {format_hms(t_cleanup)}（{t_cleanup:.2f}s）",
+                f"[统计] total(总耗时): {format_hms(t_total)}（{t_total:.2f}s）",
+                f"[完成] 输出：{it['output']}",
+            ]:
+                print(msg)
+                _log(msg)
+            emit_event("job_end", input=str(input_path), output=str(it["output"]), **stats)
+
+        t_all = now_perf() - t_total0
+        log(f"\n[统计] 全部 {len(todo)} 个版本总耗时：{format_hms(t_all)}（{t_all:.2f}s）"
+            f" | 处理速度：{dur / t_all if t_all > 0 else 0.0:.2f}x realtime")
+        return [results[i] for i in range(len(items))]
+
+    except Exception as e:
+        emit_event("job_failed", input=str(input_path), error=str(e))
+        raise
+
+    finally:
+        for i in todo:
+            for leftover in (items[i]["intermediate"], partial_output_path(items[i]["output"])):
+                if leftover.exists():
+                    try:
+                        leftover.unlink()
+                    except Exception:
+                        pass
+        for _, _close in loggers:
+            _close()
+
+
+# ----------------- 合并模式 -----------------
+# 只合并模式 --merge-append 的输出格式：分片 MP4，每个 moof 的数据偏移都相对自身，追加新分段不必改动已有内容
+FRAGMENTED_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+MERGE_MANIFEST_SUFFIX = ".manifest.json"  # 记录合并文件由哪些输入组成（<输出名>.manifest.json）
+MERGE_MANIFEST_VERSION = 1
+
+
+def write_concat_list(files: list[Path], concat_list: Path) -> None:
+    """写出 FFmpeg concat 分离器的列表文件"""
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for video in files:
+            # FFmpeg concat 格式：file 'path'
+            # 路径中的单引号需要转义
+            safe_path = str(video.absolute()).replace("'", "'\\''")
+            f.write(f"file '{safe_path}'\n")
+
+
+def merge_videos(
+    files: list[Path],
+    output_path: Path,
+    quiet: bool,
+    faststart: bool = False,
+    fragmented: bool = False,
+) -> Path:
+    """
+    使用 FFmpeg concat 将多个视频拼接成一个文件
+    
+    Args:
+        files: 要合并的视频文件列表
+        output_path: 输出文件路径
+        quiet: 是否安静模式
+        faststart: 是否把 moov 移到文件头（便于网络播放）
+        fragmented: 输出分片 MP4（之后可以用 append_fragments 直接在末尾追加）
+    
+    Returns:
+        合并后的文件路径
+    """
+    if not files:
+        raise ValueError("没有文件可供合并")
+    
+    # 创建 concat 列表文件
+    concat_list = output_path.with_name(f"_concat_list_{output_path.stem}.txt")
+    try:
+        write_concat_list(files, concat_list)
+        
+        print(f"[信息] 正在合并 {len(files)} 个视频...")
+        
+        cmd = [FFMPEG, "-f", "concat", "-safe", "0", "-i", str(concat_list)]
+        if quiet:
+            cmd += ["-loglevel", "error"]
+        cmd += ["-c", "copy"]
+        if fragmented:
+            cmd += ["-movflags", FRAGMENTED_MOVFLAGS]
+        elif faststart:
+            cmd += ["-movflags", "+faststart"]
+        cmd += ["-y", str(output_path)]
+        
+        run_ffmpeg(cmd)
+        
+        print(f"[信息] 合并完成：{output_path}")
+        return output_path
+        
+    finally:
+        # 清理 concat 列表文件
+        if concat_list.exists():
+            try:
+                concat_list.unlink()
+            except Exception:
+                pass
+
+
+def append_fragments(output_path: Path, tail_path: Path) -> None:
+    """
+    把 tail_path（新增文件单独合并成的分片 MP4）的 moof/mdat 接到 output_path 末尾，不重写已有内容：
+    - 各轨 tfdt 整体后移“已有内容的时长”（与 concat 分离器按文件时长衔接一致），mfhd 序号接着往后编
+    - 旧的 mfra 随机访问索引随之失效，直接截掉（播放器会逐个读取 moof）
+    轨道、时间基或编码参数（stsd）对不上时抛 ValueError，由调用方改为整体重新合并；
+    写入中途出错会把 output_path 恢复原样
+    """
+    head = read_fmp4_layout(output_path)
+    tail = read_fmp4_layout(tail_path)
+    if head is None or tail is None:
+        raise ValueError("不是可追加的分片 MP4")
+    if ({k: (t["timescale"], t["stsd"]) for k, t in head["tracks"].items()}
+            != {k: (t["timescale"], t["stsd"]) for k, t in tail["tracks"].items()}):
+        raise ValueError("新文件的轨道或编码参数与已合并的内容不同")
+
+    # 已有内容的时长取各轨最晚的结束时间，再换算到各轨自己的时间基
+    seconds = max(t["end"] / t["timescale"] for t in head["tracks"].values())
+    shift = {k: round(seconds * t["timescale"]) for k, t in head["tracks"].items()}
+    copy_chunk = 64 * 1024 * 1024
+
+    append_at = head["fragments"][1]
+    with open(tail_path, "rb") as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as buf, \
+            open(output_path, "r+b") as dst:
+        dst.seek(append_at)
+        saved = dst.read()  # mfra 等尾部内容，出错时写回
+        try:
+            dst.seek(append_at)
+            dst.truncate()
+            box_start = tail["fragments"][0]
+            for _, _, box_end in _iter_boxes(buf, box_start, tail["fragments"][1]):
+                if box_start in tail["moofs"]:
+                    moof = bytearray(buf[box_start:box_end])
+                    for kind, pos, version in tail["moofs"][box_start]:
+                        fmt = ">I" if version != 1 else ">Q"
+                        at = pos - box_start
+                        value = struct.unpack_from(fmt, moof, at)[0]
+                        value += head["sequence"] if kind == "mfhd" else shift[kind]
+                        if fmt == ">I" and value >= 1 << 32:
+                            raise ValueError("时间戳超出 32 位 tfdt 的范围")
+                        struct.pack_into(fmt, moof, at, value)
+                    dst.write(moof)
+                else:
+                    for pos in range(box_start, box_end, copy_chunk):
+                        dst.write(buf[pos:min(box_end, pos + copy_chunk)])
+                box_start = box_end
+            dst.flush()
+            os.fsync(dst.fileno())
+        except BaseException:
+            dst.seek(append_at)
+            dst.truncate()
+            dst.write(saved)
+            dst.flush()
+            raise
+
+
+def load_merge_manifest(manifest_path: Path, output_path: Path, fragmented: bool) -> list[dict] | None:
+    """
+    读取只合并模式的清单（上次合并了哪些文件及其指纹）
+    合并文件不存在、大小/修改时间与清单记录的不一致（被改动过、追加到一半中断）、
+    或输出格式（分片/普通 MP4）与这次要求的不同时返回 None
+    """
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        st = output_path.stat()
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(manifest, dict) or manifest.get("version") != MERGE_MANIFEST_VERSION
+            or manifest.get("size") != st.st_size or manifest.get("mtime_ns") != st.st_mtime_ns
+            or manifest.get("fragmented", True) != fragmented):
+        return None
+    return manifest.get("files")
+
+
+def merge_only(
+    folder: Path,
+    pattern: str,
+    recurse: bool,
+    quiet: bool,
+    auto_yes: bool = False,
+    exclude: list[str] | None = None,
+    appendable: bool = DEFAULT_MERGE_APPEND,
+) -> Path | None:
+    """
+    只合并模式：收集所有视频 -> 拼接成一个文件（不做速度处理）
+    
+    旁边的 <输出名>.manifest.json 记录合并了哪些文件（路径 + 内容指纹），再次运行时全部没变则跳过；
+    否则先写临时文件、完成后改名替换。appendable=True 时输出为分片 MP4：
+    - 前面的文件都没变、只是末尾多了新文件 → 只把新文件原地追加到已发布的文件末尾
+      （不经过临时文件；追加被强行中断时文件损坏，清单对不上，下次运行整体重新合并）
+    - 前面的文件有修改/删除/重排，或追加失败 → 整体重新合并
+    
+    Returns:
+        输出文件路径，如果用户取消则返回 None
+    """
+    files = collect_files(folder, pattern, recurse, exclude)
+    if not files:
+        raise RuntimeError(f"[错误] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
+    
+    print(f"[信息] 只合并模式：找到 {len(files)} 个文件")
+    
+    # 确认文件顺序
+    confirmed_files = confirm_file_order(files, auto_yes)
+    if confirmed_files is None:
+        return None
+    
+    # 输出文件名
+    output_name = f"{folder.name}_merged.mp4"
+    output_path = folder / output_name
+    
+    t0 = now_perf()
+    manifest_path = output_path.with_name(output_path.name + MERGE_MANIFEST_SUFFIX)
+    entries = [{"path": journal_key(folder, f), "fingerprint": file_fingerprint(str(f))} for f in confirmed_files]
+    previous = load_merge_manifest(manifest_path, output_path, appendable)
+    if previous == entries:
+        print(f"[跳过] 合并结果已是最新（{len(entries)} 个文件均未变化）：{output_path}")
+        return output_path
+
+    # 新文件（或整体重新合并的结果）都先写到临时名
+    work_output = partial_output_path(output_path)
+    appended = False
+    try:
+        if appendable and previous and entries[:len(previous)] == previous:
+            new_files = confirmed_files[len(previous):]
+            print(f"[信息] 前 {len(previous)} 个文件与上次合并时相同，只追加新增的 {len(new_files)} 个")
+            merge_videos(new_files, work_output, quiet, fragmented=True)
+            try:
+                # 原地追加：只写新内容，不重写旧内容
+                append_fragments(output_path, work_output)
+                appended = True
+            except ValueError as e:
+                print(f"[警告] 无法直接追加（{e}），改为整体重新合并")
+        elif previous:
+            print("[信息] 合并的文件有变化，整体重新合并")
+        if not appended:
+            merge_videos(confirmed_files, work_output, quiet, fragmented=appendable)
+            os.replace(work_output, output_path)
+    finally:
+        if work_output.exists():
+            try:
+                work_output.unlink()
+            except Exception:
+                pass
+    st = output_path.stat()
+    write_json_atomic(manifest_path, {
+        "version": MERGE_MANIFEST_VERSION,
+        "files": entries,
+        "fragmented": appendable,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    })
+    final_output = output_path
+    t_total = now_perf() - t0
+    
+    print(f"\n[统计] 合并耗时：{format_hms(t_total)}（{t_total:.2f}s）")
+    print(f"[完成] 只合并模式输出：{final_output}")
+    
+    return final_output
+
+
+def duration_only(
+    folder: Path,
+    pattern: str,
+    recurse: bool,
+    probe_jobs: int = DEFAULT_PROBE_JOBS,
+    exclude: list[str] | None = None,
+) -> tuple[float, int]:
+    """
+    只输出总时长模式：统计所有视频的总时长（不做任何处理）
+    
+    Returns:
+        (总时长秒数, 文件数量)
+    """
+    print(f"[信息] 只输出总时长模式：边扫描边读取视频时长...\n")
+    
+    total_duration = 0.0
+    success_count = 0
+    fail_count = 0
+    
+    # 边扫描边并发读取；扫描完后按智能排序逐行输出，前面的读完就打印
+    for i, total, f, dur, error in probe_sorted(iter_files(folder, pattern, recurse, exclude), workers=probe_jobs):
+        print(f"  [{i + 1}/{total}] {f.name}")
+        if error is None:
+            total_duration += dur
+            success_count += 1
+            print(f"           时长: {format_hms(dur)} ({dur:.2f}s)")
+        else:
+            fail_count += 1
+            print(f"           [失败] {error}")
+    
+    if success_count + fail_count == 0:
+        print(f"[信息] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
+        return 0.0, 0
+    
+    print(f"\n========== 统计结果 ==========")
+    print(f"[统计] 成功读取：{success_count} 个")
+    if fail_count > 0:
+        print(f"[统计] 失败：{fail_count} 个")
     print(f"[统计] 总时长：{format_hms(total_duration)} ({total_duration:.2f}s)")
     
     # 计算平均时长
@@ -739,10 +4051,508 @@ def duration_only(
         avg_duration = total_duration / success_count
         print(f"[统计] 平均时长：{format_hms(avg_duration)} ({avg_duration:.2f}s)")
     
-    return total_duration, success_count
+    return total_duration, success_count
+
+
+def select_merge_files(
+    folder: Path,
+    pattern: str,
+    recurse: bool,
+    exclude: list[str] | None = None,
+    auto_yes: bool = False,
+) -> list[Path] | None:
+    """合并模式的输入：扫描、按智能排序并确认顺序（auto_yes 时不交互）。用户取消时返回 None"""
+    files = collect_files(folder, pattern, recurse, exclude)
+    if not files:
+        raise RuntimeError(f"[错误] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
+
+    print(f"[信息] 合并模式：找到 {len(files)} 个文件")
+    return confirm_file_order(files, auto_yes)
+
+
+@accepts_options("skip_existing")
+def merge_and_process(
+    folder: Path,
+    pattern: str,
+    recurse: bool,
+    target_seconds: float,
+    out_fps: int,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    profile: str,
+    level: str,
+    res: str,
+    size: str | None,
+    fit: str,
+    quiet: bool,
+    log_spec: str | None,
+    auto_yes: bool = False,
+    sampler: str = DEFAULT_SAMPLER,
+    seek_speed: float = DEFAULT_SEEK_SPEED,
+    use_intermediate: bool = DEFAULT_INTERMEDIATE,
+    jobs: int = DEFAULT_JOBS,
+    probe_jobs: int = DEFAULT_PROBE_JOBS,
+    merge_strategy: str = DEFAULT_MERGE_STRATEGY,
+    resume: bool = False,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    exclude: list[str] | None = None,
+    preset: str = DEFAULT_PRESET,
+    deadline: float | None = None,
+    files: list[Path] | None = None,
+    on_progress=None,
+) -> Path | None:
+    """
+    合并模式：收集所有视频 -> 按顺序作为一段连续视频加速处理（不生成合并后的临时文件）
+    merge_strategy="parallel" 时改为各文件按时长比例分配帧数、独立加速后无损拼接
+    files：已确认顺序的输入（见 select_merge_files）；给出时不再扫描与确认
+    on_progress(fraction, info)：整体进度回调；为 None 时在控制台显示进度
+    resume：按任务日志断点续跑（输出已完成则直接返回；parallel 时复用已完成的文件）
+    chunk_seconds：concat 方式下分块渲染（见 timelapse_one）
+    deadline：截止秒数，按全部输入统一选择 preset 与编码遍数（见 plan_deadline）
+    
+    Returns:
+        输出文件路径，如果用户取消则返回 None
+    """
+    # 确认文件顺序
+    confirmed_files = files if files is not None else select_merge_files(folder, pattern, recurse, exclude, auto_yes)
+    if confirmed_files is None:
+        return None
+    if not confirmed_files:
+        raise RuntimeError(f"[错误] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
+    
+    # 预先并发读取各文件时长：合并前就发现读不了的文件，并给出合并后的总时长
+    durations, failed = probe_durations(confirmed_files, workers=probe_jobs)
+    if failed:
+        lines = "\n".join(f"  - {p.name}：{msg}" for p, msg in failed[:20])
+        raise RuntimeError(f"有 {len(failed)} 个文件无法读取时长：\n{lines}")
+    total_dur = sum(durations.values())
+    print(f"[信息] 合并后总时长：{format_hms(total_dur)}（{total_dur:.2f}s）| 加速倍率约 {total_dur / target_seconds:.2f}x")
+    
+    # 输出文件名
+    time_str = f"{target_seconds:g}s".replace(".", "p")
+    output_name = f"{folder.name}_merged_timelapse_{time_str}.mp4"
+    output_path = folder / output_name
+    
+    # 任务日志：各输入文件（parallel 时逐个记录）+ 最终输出各一项
+    keys = [journal_key(folder, f) for f in confirmed_files]
+    previous, journal = open_journal(
+        folder, "merge",
+        {
+            "files": keys, "target": target_seconds, "fps": out_fps,
+            "b": target_bitrate, "max": max_bitrate, "buf": bufsize, "profile": profile, "level": level,
+            "res": res, "size": size, "fit": fit, "sampler": sampler, "seek_speed": seek_speed,
+            "strategy": merge_strategy, "preset": preset,
+        },
+        keys + [output_name],
+        resume,
+    )
+    if resume:
+        if previous.get(output_name, {}).get("state") == "done" and output_path.exists():
+            print(f"[跳过] 上次已完成：{output_path}")
+            return output_path
+        # 旧版本合并时生成的临时合并文件
+        for p in folder.glob("_temp_merged_*.mp4"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+    journal(output_name, "running", output=str(output_path))
+    
+    concat_list = output_path.with_name(f"_concat_list_{output_path.stem}.txt")
+    try:
+        if merge_strategy == "parallel":
+            passes = 2
+            if deadline is not None:
+                target_wh = resolve_target_size(res=res, size=size)
+                budgets = plan_frame_budgets([durations[f] for f in confirmed_files],
+                                             output_frame_count(target_seconds, out_fps))
+                preset, passes = plan_deadline(
+                    [(f, durations[f], n) for f, n in zip(confirmed_files, budgets) if n > 0],
+                    deadline, out_fps, target_wh, build_scale_filter(target_wh, fit),
+                    sampler, seek_speed, use_intermediate, preset,
+                )
+            final_output = parallel_merge_timelapse(
+                files=confirmed_files,
+                durations=durations,
+                output_path=output_path,
+                target_seconds=target_seconds,
+                out_fps=out_fps,
+                target_bitrate=target_bitrate,
+                max_bitrate=max_bitrate,
+                bufsize=bufsize,
+                profile=profile,
+                level=level,
+                res=res,
+                size=size,
+                fit=fit,
+                quiet=quiet,
+                log_spec=log_spec,
+                sampler=sampler,
+                seek_speed=seek_speed,
+                use_intermediate=use_intermediate,
+                jobs=jobs,
+                preset=preset,
+                passes=passes,
+                journal=lambda f, state, **kw: journal(journal_key(folder, f), state, **kw),
+                resume_states={f: previous.get(k, {}).get("state") for f, k in zip(confirmed_files, keys)}
+                if resume else None,
+                on_progress=on_progress,
+            )
+        else:
+            if resume:
+                removed = cleanup_orphans(output_path)
+                if removed:
+                    print(f"[信息] 已清理上次中断留下的 {removed} 个临时文件")
+            
+            # concat 列表直接作为加速处理的输入：边读边处理，不生成合并后的临时文件
+            write_concat_list(confirmed_files, concat_list)
+            
+            print(f"\n[信息] 开始处理 {len(confirmed_files)} 个视频（concat 直接读取）...")
+            final_output, stats = timelapse_one(
+                input_path=concat_list,
+                target_seconds=target_seconds,
+                out_fps=out_fps,
+                target_bitrate=target_bitrate,
+                max_bitrate=max_bitrate,
+                bufsize=bufsize,
+                profile=profile,
+                level=level,
+                res=res,
+                size=size,
+                fit=fit,
+                quiet=quiet,
+                log_spec=log_spec,
+                skip_existing=False,
+                sampler=sampler,
+                seek_speed=seek_speed,
+                use_intermediate=use_intermediate,
+                jobs=jobs,
+                concat_sources=[(f, durations[f]) for f in confirmed_files],
+                output_path=output_path,
+                chunk_seconds=chunk_seconds,
+                preset=preset,
+                deadline=deadline,
+                on_progress=on_progress,
+            )
+    except BaseException as e:
+        journal(output_name, "failed", error=str(e) or type(e).__name__)
+        raise
+    finally:
+        if concat_list.exists():
+            try:
+                concat_list.unlink()
+            except Exception:
+                pass
+    
+    journal(output_name, "done", output=str(final_output))
+    print(f"\n[完成] 合并模式输出：{final_output}")
+    return final_output
 
 
-def merge_and_process(
+def parallel_merge_timelapse(
+    files: list[Path],
+    durations: dict[Path, float],
+    output_path: Path,
+    target_seconds: float,
+    out_fps: int,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    profile: str,
+    level: str,
+    res: str,
+    size: str | None,
+    fit: str,
+    quiet: bool,
+    log_spec: str | None,
+    sampler: str = DEFAULT_SAMPLER,
+    seek_speed: float = DEFAULT_SEEK_SPEED,
+    use_intermediate: bool = DEFAULT_INTERMEDIATE,
+    jobs: int = DEFAULT_JOBS,
+    preset: str = DEFAULT_PRESET,
+    passes: int = 2,
+    journal=None,
+    resume_states: dict[Path, str] | None = None,
+    on_progress=None,
+) -> Path:
+    """
+    合并模式（parallel）：按时长比例给每个文件分配输出帧数，各文件用相同编码参数独立加速
+    （同时处理 jobs 个），最后流复制拼接。全程不读写合并后的源文件。
+    每个文件恰好输出分到的帧数（frame_budget），拼接后的总帧数与整体目标一致。
+    journal(文件, 状态, **字段)：记录各文件的处理状态；有任务日志时失败/中断会保留已完成的分段
+    resume_states：续跑时上次各文件的状态，done 且分段文件还在、帧数与分到的一致的直接复用
+    on_progress(fraction, info)：整体进度回调；为 None 时在控制台显示进度
+    """
+    frame_count = output_frame_count(target_seconds, out_fps)
+    budgets = plan_frame_budgets([durations[f] for f in files], frame_count)
+    parts = [(f, n) for f, n in zip(files, budgets) if n > 0]
+    part_files = [
+        output_path.with_name(f"_temp_seg_{output_path.stem}_{i:03d}.mp4")
+        for i in range(len(parts))
+    ]
+
+    workers = max(1, min(jobs, len(parts)))
+    cpu = available_cpus()
+    threads = max(1, cpu // workers) if workers > 1 else 0
+
+    # 续跑：已完成的分段直接复用，其余分段与最终输出的残留临时文件清理掉
+    reuse: set[int] = set()
+    if resume_states is not None:
+        reuse = {i for i, (f, n) in enumerate(parts)
+                 if resume_states.get(f) == "done" and part_files[i].exists()
+                 and probe_frame_count(str(part_files[i])) == n}
+        removed = cleanup_orphans(output_path, keep={part_files[i] for i in reuse})
+        for i in range(len(parts)):
+            if i not in reuse:
+                removed += cleanup_orphans(part_files[i])
+        if removed:
+            print(f"[信息] 已清理上次中断留下的 {removed} 个临时文件")
+
+    log_path = derive_log_path(log_spec, output_path)
+    log, log_close = make_logger(log_path)
+    # 整体进度：各文件按分到的帧数加权
+    merge_progress = make_progress("merge", "合并 ", on_update=on_progress, console=on_progress is None,
+                                   output=str(output_path))
+    t_total0 = now_perf()
+    succeeded = False
+    try:
+        log(f"[信息] 开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if log_path:
+            log(f"[信息] 日志文件：{log_path}")
+        log(f"[信息] 合并方式：各文件独立加速后拼接 | 共 {frame_count} 帧 | 同时处理 {workers} 个文件")
+        for f, n in zip(files, budgets):
+            if n > 0:
+                log(f"[信息]   {f.name}：{durations[f]:.2f}s → {n} 帧（{n / out_fps:.2f}s）")
+            else:
+                log(f"[警告]   {f.name}：{durations[f]:.2f}s 太短，分不到输出帧，已跳过")
+        log(f"[信息] 输出：{output_path}")
+
+        if reuse:
+            log(f"[信息] 断点续跑：复用上次已完成的 {len(reuse)}/{len(parts)} 个文件")
+
+        def _render(i: int) -> dict:
+            f, n = parts[i]
+            if i in reuse:
+                log(f"[跳过] 分段 {i + 1}/{len(parts)} 上次已完成：{f.name}")
+                merge_progress(i, n / frame_count, 1.0)
+                return {"total": 0.0}
+            log(f"[信息] 分段 {i + 1}/{len(parts)} 开始：{f.name}")
+            if journal is not None:
+                journal(f, "running", part=str(part_files[i]))
+
+            def _report(fraction: float, info: dict):
+                merge_progress(i, n / frame_count, fraction, stage=info.get("stage"), speed=info.get("speed"))
+
+            try:
+                _, stats = timelapse_one(
+                    input_path=f,
+                    target_seconds=n / out_fps,
+                    frame_budget=n,
+                    out_fps=out_fps,
+                    target_bitrate=target_bitrate,
+                    max_bitrate=max_bitrate,
+                    bufsize=bufsize,
+                    profile=profile,
+                    level=level,
+                    res=res,
+                    size=size,
+                    fit=fit,
+                    quiet=True if workers > 1 else quiet,
+                    log_spec=None,
+                    skip_existing=False,
+                    sampler=sampler,
+                    seek_speed=seek_speed,
+                    use_intermediate=use_intermediate,
+                    threads=threads,
+                    output_path=part_files[i],
+                    on_progress=_report,
+                    preset=preset,
+                    passes=passes,
+                )
+                got = probe_frame_count(str(part_files[i]))
+                if got != n:
+                    raise RuntimeError(f"分段 {i + 1}/{len(parts)} 输出 {got} 帧，应为 {n} 帧：{f.name}")
+            except BaseException as e:
+                if journal is not None:
+                    journal(f, "failed", error=str(e) or type(e).__name__)
+                raise
+            if journal is not None:
+                journal(f, "done", part=str(part_files[i]))
+            log(f"[信息] 分段 {i + 1}/{len(parts)} 完成。")
+            return stats
+
+        t0 = now_perf()
+        results = run_all_or_cancel(_render, list(range(len(parts))), workers)
+        t_render = now_perf() - t0
+
+        # 各段编码参数一致，直接流复制拼接（写好后再改名为正式输出）
+        t0 = now_perf()
+        merge_videos(part_files, partial_output_path(output_path), quiet, faststart=True)
+        got = probe_frame_count(str(partial_output_path(output_path)))
+        if got != frame_count:
+            raise RuntimeError(f"拼接后共 {got} 帧，应为 {frame_count} 帧")
+        os.replace(partial_output_path(output_path), output_path)
+        t_concat = now_perf() - t0
+        succeeded = True
+
+        t_total = now_perf() - t_total0
+        total_dur = sum(durations[f] for f, _ in parts)
+        realtime = total_dur / t_total if t_total > 0 else 0.0
+        t_parts = sum(r["total"] for r in results)
+        log(f"[统计] render(各文件加速): {format_hms(t_render)}（{t_render:.2f}s）| 各文件累计 {format_hms(t_parts)}（{t_parts:.2f}s）")
+        log(f"[统计] concat(拼接分段): {format_hms(t_concat)}（{t_concat:.2f}s）")
+        log(f"[统计] total(总耗时): {format_hms(t_total)}（{t_total:.2f}s）")
+        log(f"[统计] 处理速度：{realtime:.2f}x realtime（输入时长/总耗时）")
+        log(f"[完成] 输出：{output_path}")
+        return output_path
+
+    finally:
+        # 有任务日志时，失败/中断保留已完成的分段，供 --resume 复用
+        leftovers = [partial_output_path(output_path)]
+        if succeeded or journal is None:
+            leftovers += part_files
+        for part_file in leftovers:
+            if part_file.exists():
+                try:
+                    part_file.unlink()
+                except Exception:
+                    pass
+        log_close()
+
+
+# ----------------- 批量模式 -----------------
+TEMP_DIR_PREFIXES = ("_temp_chunks_", "_temp_live_")  # 分块渲染/实时模式的临时目录
+
+
+def is_candidate_file(f: Path) -> bool:
+    """批量/合并/监视模式共用的输入筛选：排除本工具的临时文件、任务日志和输出文件"""
+    if f.parent.name.startswith(TEMP_DIR_PREFIXES):
+        return False  # 分块渲染/实时模式的临时目录（递归时）
+    return is_candidate_name(f.name)
+
+
+def is_candidate_name(name: str) -> bool:
+    """is_candidate_file 中只看文件名的部分（扫描目录时不必先构造 Path）"""
+    # 排除临时文件
+    if name.startswith('_temp_merged_'):
+        return False
+    if name.startswith('_concat_list_'):
+        return False
+    if name.startswith('_temp_sample_'):
+        return False
+    if name.startswith('_temp_seg_'):
+        return False
+    if name.startswith('_temp_out_'):
+        return False
+    if name.startswith(JOURNAL_NAME):
+        return False  # 任务日志（及其写入中的临时文件）
+    # 排除已处理的输出文件
+    if '_timelapse_' in name and name.endswith('_PR.mp4'):
+        return False
+    if name.endswith('_merged.mp4'):
+        return False
+    if '_merged.mp4' + MERGE_MANIFEST_SUFFIX in name:
+        return False
+    if '_merged_timelapse_' in name:
+        return False  # 合并模式的输出（concat 直接读取时绝不能把输出文件当输入）
+    return True
+
+
+def split_patterns(pattern: str) -> list[str]:
+    """匹配规则可以用 ; 或 , 分隔多个，例如 "*.mp4;*.mkv" """
+    return [p.strip() for p in re.split(r"[;,]", pattern) if p.strip()]
+
+
+def compile_globs(patterns: list[str]):
+    """
+    把一组通配规则编译成 match(相对路径, 名字) -> bool（没有规则时返回 None）
+    含 / 的规则匹配相对路径（如 "raw/*"），否则只匹配名字；大小写规则随系统（与 glob 一致）
+    """
+    if not patterns:
+        return None
+
+    def _regex(group: list[str]):
+        if not group:
+            return None
+        return re.compile("|".join(fnmatch.translate(os.path.normcase(p)) for p in group))
+
+    name_re = _regex([p for p in patterns if "/" not in p])
+    rel_re = _regex([p for p in patterns if "/" in p])
+    fold = os.path.normcase if is_windows() else (lambda x: x)
+
+    def match(rel: str, name: str) -> bool:
+        return bool((name_re is not None and name_re.match(fold(name)))
+                    or (rel_re is not None and rel_re.match(fold(rel))))
+
+    return match
+
+
+def iter_files(folder: Path, pattern: str, recurse: bool, exclude: list[str] | None = None):
+    """
+    用 os.scandir 遍历文件夹，边扫描边产出候选文件（目录遍历顺序，需要时再用 smart_sort_files 排序）
+    - 直接用 DirEntry 自带的类型信息，不必对每个条目再 stat 一次
+    - pattern 可以是多个规则（见 split_patterns）；exclude 命中的文件跳过、命中的文件夹整个不进入
+    - 本工具的临时目录直接跳过，文件再经 is_candidate_file 过滤；读不了的文件夹静默跳过
+    """
+    wanted = compile_globs(split_patterns(pattern))
+    excluded = compile_globs([p.rstrip("/") for p in exclude or []])
+    if wanted is None:
+        return
+    stack = [(folder, "")]
+    while stack:
+        directory, prefix = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = entry.name
+                    rel = prefix + name
+                    try:
+                        # 与 rglob 一致：不进入符号链接指向的文件夹（避免成环）
+                        if entry.is_dir(follow_symlinks=False):
+                            if (recurse and not name.startswith(TEMP_DIR_PREFIXES)
+                                    and (excluded is None or not excluded(rel, name))):
+                                subdirs.append((directory / name, rel + "/"))
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    if (wanted(rel, name) and is_candidate_name(name)
+                            and (excluded is None or not excluded(rel, name))):
+                        yield directory / name
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))  # 深度优先，同级按目录列出的顺序
+
+
+def collect_files(folder: Path, pattern: str, recurse: bool, exclude: list[str] | None = None) -> list[Path]:
+    """扫描完整个文件夹后按 smart_sort_files 排序（合并等需要确定顺序的场景）"""
+    return smart_sort_files(list(iter_files(folder, pattern, recurse, exclude)))
+
+
+def plan_batch_groups(files: list[Path], output_of, durations: dict[Path, float]) -> list[list[int]]:
+    """
+    并行批量的调度计划：
+    - 输出路径相同的输入（如 a.mp4 与 a.mov）归为一组，组内按原顺序串行，避免同时写同一个文件
+    - 各组按总时长从长到短排列（最长的先开始，缩短整体完成时间）
+
+    Returns:
+        [[文件下标, ...], ...]
+    """
+    groups: dict[Path, list[int]] = {}
+    for i, f in enumerate(files):
+        groups.setdefault(output_of(f), []).append(i)
+    return sorted(
+        groups.values(),
+        key=lambda idxs: sum(durations.get(files[i], 0.0) for i in idxs),
+        reverse=True,
+    )
+
+
+@accepts_options()
+def batch_process(
     folder: Path,
     pattern: str,
     recurse: bool,
@@ -758,39 +4568,280 @@ def merge_and_process(
     fit: str,
     quiet: bool,
     log_spec: str | None,
-    auto_yes: bool = False,
-) -> Path | None:
+    skip_existing: bool,
+    sampler: str = DEFAULT_SAMPLER,
+    seek_speed: float = DEFAULT_SEEK_SPEED,
+    use_intermediate: bool = DEFAULT_INTERMEDIATE,
+    jobs: int = DEFAULT_JOBS,
+    probe_jobs: int = DEFAULT_PROBE_JOBS,
+    resume: bool = False,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    exclude: list[str] | None = None,
+    preset: str = DEFAULT_PRESET,
+    deadline: float | None = None,
+    on_progress=None,
+) -> tuple[list[Path], list[tuple[Path, str]]]:
     """
-    合并模式：收集所有视频 -> 拼接成一个 -> 加速处理
-    
-    Returns:
-        输出文件路径，如果用户取消则返回 None
+    批量模式：每个视频单独处理
+    jobs > 1 时同时处理多个文件：CPU 线程平均分给各任务，最长的输入最先开始
+    resume：按任务日志断点续跑，跳过上次已完成的文件，清理上次中断的文件留下的临时文件
+    deadline：整批的截止秒数，按全部待处理文件统一选择 preset 与编码遍数（见 plan_deadline）
+    on_progress(fraction, info)：整批进度回调（按时长加权）；为 None 时在控制台显示进度
     """
-    files = collect_files(folder, pattern, recurse)
+    # 边扫描边并发读取时长（大目录不必等遍历完才开始读）：整体进度按时长加权，并行时还用于调度
+    # 任务日志、截止时间规划和调度都需要全部时长，所以读完全部文件才开始处理
+    # 读不到时长的不计入进度，由 timelapse_one 报告具体错误
+    t_batch0 = now_perf()
+    files: list[Path] = []
+    durations: dict[Path, float] = {}
+    for _, _, f, dur, error in probe_sorted(iter_files(folder, pattern, recurse, exclude), workers=probe_jobs):
+        files.append(f)
+        if error is None:
+            durations[f] = dur
     if not files:
-        raise RuntimeError(f"[错误] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
-    
-    print(f"[信息] 合并模式：找到 {len(files)} 个文件")
-    
-    # 确认文件顺序
-    confirmed_files = confirm_file_order(files, auto_yes)
-    if confirmed_files is None:
-        return None
-    
-    # 输出文件名
-    time_str = f"{target_seconds:g}s".replace(".", "p")
-    output_name = f"{folder.name}_merged_timelapse_{time_str}.mp4"
-    output_path = folder / output_name
-    
-    # 1. 合并所有视频
-    temp_merged = None
+        print(f"[信息] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
+        return [], []
+
+    # 每个文件的处理结果：("ok", 输出) / ("skip", 输出) / ("fail", 错误信息)
+    results: dict[int, tuple[str, object]] = {}
+
+    print(f"[信息] 批量开始：{folder}")
+    print(f"[信息] 匹配：{pattern} | recurse={recurse} | 共 {len(files)} 个")
+    print(f"[信息] 参数：target={target_seconds}s fps={out_fps} res={res} size={size or '-'} fit={fit} VBR2 preset={preset} target={target_bitrate} max={max_bitrate}")
+    total_dur = sum(durations.values())
+    batch_progress = make_progress("batch", "批量 ", on_update=on_progress, console=on_progress is None,
+                                   folder=str(folder))
+    emit_event("batch_start", folder=str(folder), files=len(files), dur=total_dur)
+
+    # 任务日志：记录每个文件的状态，--resume 时据此续跑
+    target_wh = resolve_target_size(res=res, size=size)
+    keys = [journal_key(folder, f) for f in files]
+    previous, journal = open_journal(
+        folder, "batch",
+        {
+            "target": target_seconds, "fps": out_fps, "b": target_bitrate, "max": max_bitrate, "buf": bufsize,
+            "profile": profile, "level": level, "res": res, "size": size, "fit": fit,
+            "sampler": sampler, "seek_speed": seek_speed, "preset": preset,
+        },
+        keys,
+        resume,
+    )
+
+    # 截止时间：只算这次真正要处理的文件（续跑已完成的、--skip-existing 已有输出的不算）
+    passes = 2
+    if deadline is not None:
+        todo = []
+        for i, f in enumerate(files):
+            outp = compute_output_path(f, target_seconds, target_wh, fit)
+            done = resume and previous.get(keys[i], {}).get("state") == "done"
+            if f in durations and not ((done or skip_existing) and outp.exists()):
+                todo.append((f, durations[f], output_frame_count(target_seconds, out_fps)))
+        if todo:
+            preset, passes = plan_deadline(
+                todo, deadline, out_fps, target_wh, build_scale_filter(target_wh, fit),
+                sampler, seek_speed, use_intermediate, preset,
+            )
+
+    def _weight(i: int) -> float:
+        return durations.get(files[i], 0.0) / total_dur if total_dur > 0 else 0.0
+
+    def _process(i: int, job_quiet: bool, seg_jobs: int, threads: int):
+        inp = files[i]
+        print(f"\n===== [{i + 1}/{len(files)}] {inp} =====")
+        outp = compute_output_path(inp, target_seconds, target_wh, fit)
+        if resume:
+            state = previous.get(keys[i], {}).get("state")
+            if state == "done" and outp.exists():
+                results[i] = ("skip", outp)
+                print(f"[跳过] 上次已完成：{outp}")
+                batch_progress(i, _weight(i), 1.0, file=inp.name)
+                return
+            if state == "running":
+                removed = cleanup_orphans(outp)
+                if removed:
+                    print(f"[信息] 已清理上次中断留下的 {removed} 个临时文件")
+        journal(keys[i], "running", output=str(outp))
+
+        def _report(fraction: float, info: dict):
+            batch_progress(i, _weight(i), fraction, file=inp.name, stage=info.get("stage"), speed=info.get("speed"))
+
+        try:
+            outp, stats = timelapse_one(
+                input_path=inp,
+                target_seconds=target_seconds,
+                out_fps=out_fps,
+                target_bitrate=target_bitrate,
+                max_bitrate=max_bitrate,
+                bufsize=bufsize,
+                profile=profile,
+                level=level,
+                res=res,
+                size=size,
+                fit=fit,
+                quiet=job_quiet,
+                log_spec=log_spec,
+                skip_existing=skip_existing,
+                sampler=sampler,
+                seek_speed=seek_speed,
+                use_intermediate=use_intermediate,
+                jobs=seg_jobs,
+                threads=threads,
+                on_progress=_report,
+                chunk_seconds=chunk_seconds,
+                preset=preset,
+                passes=passes,
+            )
+            if stats.get("skipped"):
+                results[i] = ("skip", outp)
+                print(f"[跳过] 已存在输出：{outp}")
+            else:
+                results[i] = ("ok", outp)
+            journal(keys[i], "done", output=str(outp))
+        except Exception as e:
+            check_cancelled()  # 被取消时 ffmpeg 是被结束的，不算这个文件失败
+            msg = str(e)
+            results[i] = ("fail", msg)
+            journal(keys[i], "failed", error=msg)
+            print(f"[失败] {inp}\n       {msg}")
+        # 跳过/失败的文件也算处理完
+        batch_progress(i, _weight(i), 1.0, file=inp.name)
+
+    if jobs <= 1 or len(files) == 1:
+        for i in range(len(files)):
+            _process(i, quiet, jobs, 0)
+    else:
+        # 调度：最长的先开始，读不到时长的放最后
+        groups = plan_batch_groups(
+            files,
+            lambda f: compute_output_path(f, target_seconds, target_wh, fit),
+            durations,
+        )
+
+        workers = min(jobs, len(groups))
+        cpu = available_cpus()
+        threads = max(1, cpu // workers)
+        seg_jobs = max(1, jobs // workers)  # 文件数少于并行数时，多余的并行度用于分段
+        print(f"[信息] 并行：同时处理 {workers} 个文件 | 每个任务 {threads} 线程（共 {cpu} 核）| 按时长从长到短调度")
+        if not quiet:
+            print("[信息] 并行批量时各 ffmpeg 只输出错误信息，避免控制台输出交错")
+
+        def _run_group(idxs: list[int]):
+            for i in idxs:
+                _process(i, True, seg_jobs, threads)
+
+        with job_pool(workers) as pool:
+            for _ in pool.map(_run_group, groups):
+                pass
+
+    # 汇总按原始文件顺序，与串行模式一致
+    ok: list[Path] = []
+    fail: list[tuple[Path, str]] = []
+    skipped = 0
+    for i, inp in enumerate(files):
+        status, value = results[i]
+        if status == "ok":
+            ok.append(value)
+        elif status == "skip":
+            skipped += 1
+        else:
+            fail.append((inp, value))
+
+    t_batch = now_perf() - t_batch0
+    emit_event("batch_end", folder=str(folder), seconds=round(t_batch, 2), ok=len(ok), skipped=skipped, failed=len(fail))
+    print("\n========== 批量总结 ==========")
+    print(f"[统计] 总耗时：{format_hms(t_batch)}（{t_batch:.2f}s）")
+    print(f"[统计] 成功：{len(ok)} | 跳过：{skipped} | 失败：{len(fail)}")
+
+    if fail:
+        print("\n[失败列表]")
+        for p, msg in fail[:20]:
+            print(f"- {p}\n  {msg}")
+        if len(fail) > 20:
+            print(f"... 还有 {len(fail) - 20} 条失败未展开")
+
+    return ok, fail
+
+
+# ----------------- 监视模式 -----------------
+def recording_locked(path: Path) -> bool:
+    """旁边有同名 .lock 文件：部分录制软件写入期间会放一个，删掉才算录完"""
+    return path.with_name(path.name + ".lock").exists()
+
+
+def file_is_complete(path: Path) -> bool:
+    """
+    录制是否已经结束（在大小/修改时间已稳定、且没有 .lock 之后再检查）：
+    - 文件能打开读取（Windows 上仍被独占写入的文件打不开）
+    - ffprobe 能读出时长（MP4 写完才有 moov，录制中的文件读不出来）
+    """
     try:
-        temp_merged = merge_videos(confirmed_files, output_path, quiet, is_temp=True)
-        
-        # 2. 对合并后的视频进行加速处理
-        print(f"\n[信息] 开始处理合并后的视频...")
-        final_output, stats = timelapse_one(
-            input_path=temp_merged,
+        with open(path, "rb") as f:
+            f.read(1)
+        return probe_duration_seconds(str(path)) > 0
+    except Exception:
+        return False
+
+
+@accepts_options("skip_existing", "deadline")
+def watch_folder(
+    folder: Path,
+    pattern: str,
+    recurse: bool,
+    target_seconds: float,
+    out_fps: int,
+    target_bitrate: str,
+    max_bitrate: str,
+    bufsize: str,
+    profile: str,
+    level: str,
+    res: str,
+    size: str | None,
+    fit: str,
+    quiet: bool,
+    log_spec: str | None,
+    sampler: str = DEFAULT_SAMPLER,
+    seek_speed: float = DEFAULT_SEEK_SPEED,
+    use_intermediate: bool = DEFAULT_INTERMEDIATE,
+    jobs: int = DEFAULT_JOBS,
+    chunk_seconds: float = DEFAULT_CHUNK_SECONDS,
+    interval: float = DEFAULT_WATCH_INTERVAL,
+    settle: float = DEFAULT_WATCH_SETTLE,
+    exclude: list[str] | None = None,
+    preset: str = DEFAULT_PRESET,
+) -> tuple[int, int]:
+    """
+    监视模式：持续轮询文件夹，新录制的文件完整落盘后自动加速处理（Ctrl+C 停止）
+
+    - 文件筛选与批量模式相同（is_candidate_file），输出已存在的文件直接跳过
+    - 大小、修改时间与有无 .lock（recording_locked）连续 settle 秒不变、没有 .lock、
+      且 file_is_complete 通过，才视为录制结束
+    - 就绪的文件交给最多 jobs 个的工作线程处理（CPU 线程平均分配）；
+      稳定后仍读不出来的文件记一次警告，等它再变化时重新判断
+
+    Returns:
+        (成功数, 失败数)
+    """
+    workers = max(1, jobs)
+    cpu = available_cpus()
+    threads = max(1, cpu // workers) if workers > 1 else 0
+    target_wh = resolve_target_size(res=res, size=size)
+
+    seen: dict[Path, tuple[int, int, bool, float]] = {}  # 路径 -> (大小, 修改时间, 有无 .lock, 从何时起不再变化)
+    unreadable: dict[Path, tuple[int, int, bool]] = {}   # 稳定后仍读不出来的文件 -> 当时的 (大小, 修改时间, 有无 .lock)
+    handled: set[Path] = set()                     # 已排队/已处理/已跳过
+    running: dict = {}                             # Future -> 输入文件
+    counts = {"ok": 0, "fail": 0}
+
+    print(f"[信息] 监视模式：{folder} | 匹配：{pattern} | recurse={recurse}")
+    print(f"[信息] 每 {interval:g}s 检查一次，文件 {settle:g}s 内无变化且可读取后开始处理 | 同时处理 {workers} 个 | Ctrl+C 停止")
+    print(f"[信息] 参数：target={target_seconds}s fps={out_fps} res={res} size={size or '-'} fit={fit} VBR2 preset={preset} target={target_bitrate} max={max_bitrate}")
+    emit_event("watch_start", folder=str(folder), pattern=pattern, recurse=recurse)
+
+    def _process(inp: Path, outp: Path):
+        cleanup_orphans(outp)  # 上次被中断时留下的临时文件
+        print(f"\n===== [监视] 开始处理：{inp} =====")
+        timelapse_one(
+            input_path=inp,
             target_seconds=target_seconds,
             out_fps=out_fps,
             target_bitrate=target_bitrate,
@@ -801,88 +4852,170 @@ def merge_and_process(
             res=res,
             size=size,
             fit=fit,
-            quiet=quiet,
+            quiet=True if workers > 1 else quiet,
             log_spec=log_spec,
             skip_existing=False,
+            sampler=sampler,
+            seek_speed=seek_speed,
+            use_intermediate=use_intermediate,
+            jobs=1 if workers > 1 else jobs,
+            threads=threads,
+            # 多个任务同时进行时不在控制台刷进度行（进度事件照常输出）
+            on_progress=(lambda fraction, info: None) if workers > 1 else None,
+            chunk_seconds=chunk_seconds,
+            preset=preset,
         )
-        
-        # 重命名输出文件（因为 timelapse_one 会自动生成名字）
-        if final_output != output_path:
-            final_output.rename(output_path)
-            
-            # 同时重命名日志文件（如果存在）
-            if log_spec is not None:
-                temp_log = final_output.with_suffix(".log.txt")
-                if temp_log.exists():
-                    final_log = output_path.with_suffix(".log.txt")
-                    try:
-                        temp_log.rename(final_log)
-                        print(f"[信息] 日志文件已重命名：{final_log.name}")
-                    except Exception as e:
-                        print(f"[警告] 重命名日志文件失败：{e}")
-        
-        print(f"\n[完成] 合并模式输出：{output_path}")
-        return output_path
-        
-    finally:
-        # 清理临时合并文件及相关文件
-        if temp_merged:
-            # 清理临时视频文件
-            if temp_merged.exists():
-                try:
-                    temp_merged.unlink()
-                    print(f"[信息] 已清理临时文件：{temp_merged}")
-                except Exception as e:
-                    print(f"[警告] 清理临时视频文件失败：{e}")
-            
-            # 清理 passlog 文件（但保留日志文件）
-            temp_stem = temp_merged.stem  # 不含扩展名的文件名
-            temp_parent = temp_merged.parent
-            
-            # 只清理 passlog 文件，不清理 .log.txt
-            for temp_file in temp_parent.glob(f"{temp_stem}*_passlog*"):
+
+    def _collect():
+        """统计已结束的任务（被取消的排队任务留在 running 里）"""
+        for fut in [x for x in running if x.done() and not x.cancelled()]:
+            inp = running.pop(fut)
+            try:
+                fut.result()
+                counts["ok"] += 1
+            except Exception as e:
+                counts["fail"] += 1
+                print(f"[失败] {inp}\n       {e}")
+
+    pool = job_pool(workers)
+    try:
+        while True:
+            now = time.time()
+            files = collect_files(folder, pattern, recurse, exclude)
+            present = set(files)
+            for gone in [p for p in seen if p not in present]:
+                seen.pop(gone)
+            skipped = 0
+            for f in files:
+                if f in handled:
+                    continue
                 try:
-                    temp_file.unlink()
-                    print(f"[信息] 已清理临时文件：{temp_file.name}")
-                except Exception as e:
-                    print(f"[警告] 清理临时文件失败：{temp_file.name} - {e}")
+                    st = f.stat()
+                except OSError:
+                    continue  # 刚被移走/删除
+                # .lock 也算进签名：删掉 .lock 不会改变大小/修改时间，但要从那时起重新等 settle 秒
+                locked = recording_locked(f)
+                sig = (st.st_size, st.st_mtime_ns, locked)
+                prev = seen.get(f)
+                if prev is None or prev[:3] != sig:
+                    # 仍在写入或 .lock 有变化：从此刻起算稳定时间；新发现的文件从最后修改时刻起算
+                    # （启动时已有的旧文件不必再等 settle 秒）
+                    seen[f] = (*sig, now if prev is not None else min(now, st.st_mtime))
+                    continue
+                if locked or now - prev[3] < settle or unreadable.get(f) == sig:
+                    continue
 
+                outp = compute_output_path(f, target_seconds, target_wh, fit)
+                if outp.exists():
+                    handled.add(f)
+                    skipped += 1
+                    continue
+                if not file_is_complete(f):
+                    unreadable[f] = sig
+                    print(f"[警告] {f.name} 大小已不再变化但无法读取（仍被占用或文件损坏），等它再次变化后重试")
+                    continue
 
-# ----------------- 批量模式 -----------------
-def collect_files(folder: Path, pattern: str, recurse: bool) -> list[Path]:
-    if recurse:
-        files = list(folder.rglob(pattern))
-    else:
-        files = list(folder.glob(pattern))
-    # 只要文件
-    files = [p for p in files if p.is_file()]
-    
-    # 过滤掉临时文件和输出文件
-    filtered_files = []
-    for f in files:
-        name = f.name
-        # 排除临时文件
-        if name.startswith('_temp_merged_'):
-            continue
-        if name.startswith('_concat_list_'):
-            continue
-        # 排除已处理的输出文件
-        if '_timelapse_' in name and name.endswith('_PR.mp4'):
-            continue
-        if name.endswith('_merged.mp4'):
-            continue
-        # 保留
-        filtered_files.append(f)
-    
-    # 智能排序：优先识别文件名末尾的数字
-    files = smart_sort_files(filtered_files)
-    return files
+                handled.add(f)
+                seen.pop(f, None)
+                unreadable.pop(f, None)
+                print(f"[信息] 新文件就绪，加入队列：{f.name}")
+                emit_event("watch_queued", input=str(f), output=str(outp))
+                running[pool.submit(_process, f, outp)] = f
+            if skipped:
+                print(f"[跳过] {skipped} 个文件已有输出")
 
+            _collect()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print(f"\n[信息] 停止监视：取消排队中的任务，等待进行中的 {sum(1 for x in running if x.running())} 个任务结束…")
+        pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        _collect()  # 停止时才结束的任务也要计入
+        if running:
+            print(f"[信息] {len(running)} 个排队中的文件未处理，下次监视时重新排队")
+        print(f"[统计] 监视期间：成功 {counts['ok']} | 失败 {counts['fail']}")
+        emit_event("watch_end", folder=str(folder), ok=counts["ok"], failed=counts["fail"])
+    return counts["ok"], counts["fail"]
 
-def batch_process(
-    folder: Path,
-    pattern: str,
-    recurse: bool,
+
+# ----------------- 实时模式 -----------------
+# 录制期间边录边采样：按临时间隔取帧存成 JPEG，录完只需按最终时长挑帧、编码几千帧
+LIVE_KEEP_FACTOR = 4          # 最多保留 输出帧数 × 4 张采样帧（保证帧间隔始终不超过半个输出帧间隔）
+LIVE_JPEG_QUALITY = "2"       # 采样帧的 JPEG 质量（-q:v，2~31，越小越好）
+
+
+def start_live_sampler(part: Path, frames_dir: Path, step: float, scale_part: str | None, idle: float) -> subprocess.Popen:
+    """
+    对（可能仍在写入的）录制文件启动跟随采样：每 step 秒源时间取一帧，写成 frames_dir/00000001.jpg 起的 JPEG
+    - -follow 1：读到文件末尾时继续等新数据；idle 秒内没有新数据（录制结束）才退出
+    - -atomic_writing：先写临时名再改名，目录里出现的 JPEG 都是完整的
+    录制结束时必然以读超时收尾，ffmpeg 的输出写到 frames_dir/sampler.log，出错时再查看
+    """
+    frames_dir.mkdir(parents=True, exist_ok=True)
+    vf = ",".join([f"fps=fps={1 / step:.6f}:round=up"] + ([scale_part] if scale_part else []))
+    cmd = [
+        FFMPEG, "-hide_banner", "-nostdin", "-y",
+        "-follow", "1", "-rw_timeout", str(int(idle * 1_000_000)),
+        "-i", f"file:{part}",
+        "-map", "0:v:0", "-vf", vf,
+        "-an", "-sn", "-dn",
+        "-q:v", LIVE_JPEG_QUALITY,
+        "-atomic_writing", "1",
+        "-f", "image2", str(frames_dir / "%08d.jpg"),
+    ]
+    # 不登记到资源控制：自适应暂停时它会跟不上录制（优先级与 CPU 限定照常继承）
+    with open(frames_dir / "sampler.log", "ab") as log_file:
+        return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log_file)
+
+
+def make_frame_pool(limit: int, step: float):
+    """
+    录制期间保留的采样帧，按源时间排序。返回 (add, pick, status)：
+    - add(源时间, 文件)：每个间隔桶只留第一帧；总数超过 limit 时间隔翻倍，删掉多出的帧
+      → 帧间隔始终在 [录制时长/limit, 2×录制时长/limit] 之间，磁盘占用有上限
+    - pick(总时长, 帧数)：按最终时长为每个输出帧挑选“不晚于采样点的最后一帧”，与 seek 采样一致
+    - status()：(保留帧数, 当前间隔秒数)
+    """
+    kept: list[tuple[float, Path]] = []
+    spacing = step
+
+    def _drop(path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def add(t: float, path: Path) -> None:
+        nonlocal spacing
+        if kept and int(t // spacing) <= int(kept[-1][0] // spacing):
+            _drop(path)
+            return
+        kept.append((t, path))
+        if len(kept) <= limit:
+            return
+        spacing *= 2
+        survivors: list[tuple[float, Path]] = []
+        for item in kept:
+            if survivors and int(item[0] // spacing) <= int(survivors[-1][0] // spacing):
+                _drop(item[1])
+            else:
+                survivors.append(item)
+        kept[:] = survivors
+
+    def pick(duration: float, count: int) -> list[Path]:
+        times = [t for t, _ in kept]
+        interval = duration / count
+        return [kept[max(0, bisect.bisect_right(times, (n + 0.5) * interval) - 1)][1] for n in range(count)]
+
+    def status() -> tuple[int, float]:
+        return len(kept), spacing
+
+    return add, pick, status
+
+
+def live_timelapse(
+    source: Path,
     target_seconds: float,
     out_fps: int,
     target_bitrate: str,
@@ -895,64 +5028,323 @@ def batch_process(
     fit: str,
     quiet: bool,
     log_spec: str | None,
-    skip_existing: bool,
-) -> tuple[list[Path], list[tuple[Path, str]]]:
-    files = collect_files(folder, pattern, recurse)
-    if not files:
-        print(f"[信息] 没找到匹配文件：{folder} / {pattern}（recurse={recurse}）")
-        return [], []
+    pattern: str = DEFAULT_PATTERN,
+    recurse: bool = DEFAULT_RECURSE,
+    step: float = DEFAULT_LIVE_STEP,
+    idle: float = DEFAULT_LIVE_IDLE,
+    exclude: list[str] | None = None,
+    preset: str = DEFAULT_PRESET,
+) -> tuple[Path, dict]:
+    """
+    实时模式：跟随正在录制的文件（或分段录制的文件夹，按文件名顺序一段接一段）边录边采样，
+    录制结束后只把挑出的帧重新定时、两遍编码，结束后的等待时间与录制时长无关
 
-    ok: list[Path] = []
-    fail: list[tuple[Path, str]] = []
-    skipped = 0
+    - 录制期间每 step 秒源时间取一帧（已按 --res/--size 缩放），由 make_frame_pool 控制总数
+    - 录制结束：当前文件 idle 秒没有新数据且没有下一段，或按 Ctrl+C
+    - 中间帧存放在输出旁的 _temp_live_<输出名>/，完成后删除
 
-    t_batch0 = now_perf()
-    print(f"[信息] 批量开始：{folder}")
-    print(f"[信息] 匹配：{pattern} | recurse={recurse} | 共 {len(files)} 个")
-    print(f"[信息] 参数：target={target_seconds}s fps={out_fps} res={res} size={size or '-'} fit={fit} VBR2 target={target_bitrate} max={max_bitrate}")
+    Returns:
+        (输出路径, 统计信息)
+    """
+    folder_mode = source.is_dir()
+    target_wh = resolve_target_size(res=res, size=size)
+    scale_part = build_scale_filter(target_wh, fit)
+    output_path = compute_output_path(source / source.name if folder_mode else source, target_seconds, target_wh, fit)
+    work_dir = output_path.with_name(f"_temp_live_{output_path.stem}")
+    frame_count = output_frame_count(target_seconds, out_fps)
+    add_frame, pick_frames, pool_status = make_frame_pool(LIVE_KEEP_FACTOR * frame_count, step)
+
+    if work_dir.exists():
+        shutil.rmtree(work_dir, ignore_errors=True)  # 上次中断留下的采样帧（无法与本次的时间轴对应）
+    log_path = derive_log_path(log_spec, output_path)
+    log, log_close = make_logger(log_path)
+
+    done_parts: list[tuple[Path, float]] = []  # (文件, 时长)
+    recorded = 0.0                             # 已采样的录制总时长
+    interrupted = False
+    t_start = now_perf()
+    try:
+        log(f"[信息] 开始时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        if log_path:
+            log(f"[信息] 日志文件：{log_path}")
+        log(f"[信息] 实时模式：{source}" + (f" | 匹配：{pattern}（分段录制，按文件名顺序）" if folder_mode else ""))
+        log(f"[信息] 每 {step:g}s 取一帧，录制文件 {idle:g}s 无新数据视为录制结束 | Ctrl+C = 立即结束录制并出片")
+        log(f"[信息] 输出：{output_path}")
+        emit_event("live_start", input=str(source), output=str(output_path))
+
+        def _next_part() -> Path | None:
+            done = {p for p, _ in done_parts}
+            if folder_mode:
+                return next((f for f in collect_files(source, pattern, recurse, exclude) if f not in done), None)
+            return source if source.exists() and source not in done else None
+
+        def _absorb(part_dir: Path, offset: float, seen: int) -> int:
+            # ffmpeg 按序号依次写帧：第 j 帧（从 0 起）对应源时间 offset + j × step
+            while True:
+                path = part_dir / f"{seen + 1:08d}.jpg"
+                if not path.exists():
+                    return seen
+                add_frame(offset + seen * step, path)
+                seen += 1
+
+        last_print = now_perf()
+        part = _next_part()
+        if part is None:
+            log("[信息] 等待录制开始…")
+        while not interrupted:
+            if part is None:
+                if done_parts:
+                    break  # 当前段已无新数据，也没有下一段：录制结束
+                try:
+                    time.sleep(1)
+                except KeyboardInterrupt:
+                    interrupted = True
+                    break
+                part = _next_part()
+                continue
+
+            part_dir = work_dir / f"part_{len(done_parts):03d}"
+            log(f"[信息] 开始跟随：{part.name}")
+            proc = start_live_sampler(part, part_dir, step, scale_part, idle)
+            seen = 0
+            try:
+                while proc.poll() is None:
+                    time.sleep(1)
+                    seen = _absorb(part_dir, recorded, seen)
+                    now = now_perf()
+                    if PROGRESS_INTERVAL > 0 and now - last_print >= PROGRESS_INTERVAL:
+                        last_print = now
+                        kept, spacing = pool_status()
+                        print(f"[进度] 实时采样：已读到 {format_hms(recorded + seen * step)} | "
+                              f"保留 {kept} 帧（间隔 {spacing:g}s）", flush=True)
+                    emit_event("progress", scope="live", input=str(source), recorded=round(recorded + seen * step, 2))
+            except KeyboardInterrupt:
+                # 控制台的 Ctrl+C 同时发给了 ffmpeg，它会写完已解码的帧再退出；
+                # 被其它程序调用时 ffmpeg 收不到，补发一次，仍不退出就强制结束（已写好的帧不受影响）
+                interrupted = True
+                log("[信息] 收到 Ctrl+C：视为录制结束，等待采样收尾…")
+                if not is_windows():
+                    proc.send_signal(signal.SIGINT)
+                try:
+                    proc.wait(timeout=idle)
+                except subprocess.TimeoutExpired:
+                    proc.terminate()
+                    proc.wait()
+            seen = _absorb(part_dir, recorded, seen)
+            if seen == 0:
+                raise RuntimeError(f"{part.name} 没有采到任何帧（跟随读取需要 MKV/FLV/TS 或分片 MP4，"
+                                   f"详见 {part_dir / 'sampler.log'}）")
+
+            dur = seen * step
+            if not interrupted:
+                try:
+                    dur = probe_duration_seconds(str(part))
+                except Exception:
+                    pass  # 读不出时长（文件尾未写完整）就按采到的帧数估算
+            done_parts.append((part, dur))
+            recorded += dur
+            log(f"[信息] {part.name} 结束：{dur:.2f}s | 累计 {format_hms(recorded)}")
+            part = None if interrupted else _next_part()
+
+        if not done_parts:
+            raise RuntimeError("录制尚未开始就结束了，没有可用的画面")
 
-    for i, inp in enumerate(files, start=1):
-        print(f"\n===== [{i}/{len(files)}] {inp} =====")
+        # ---- 录制结束：挑帧 → 无损中间文件 → 两遍编码 ----
+        t_end = now_perf()
+        kept, spacing = pool_status()
+        speed = recorded / target_seconds
+        log(f"[信息] 录制结束：共 {format_hms(recorded)}（{len(done_parts)} 段）| 加速 {speed:.2f}x | "
+            f"从 {kept} 张采样帧（间隔 {spacing:g}s）中挑选 {frame_count} 帧")
+        job_progress = make_progress("job", "", input=str(source), output=str(output_path))
+        intermediate = work_dir / "live.mkv"
+        writer_cmd = [FFMPEG, "-hide_banner"]
+        if quiet:
+            writer_cmd += ["-loglevel", "error"]
+        writer_cmd += [
+            "-y",
+            "-f", "image2pipe",
+            "-framerate", str(out_fps),
+            "-c:v", "mjpeg",
+            "-i", "pipe:0",
+        ] + INTERMEDIATE_CODEC_ARGS + [str(intermediate)]
+        writer = spawn_process(writer_cmd, stdin=subprocess.PIPE)
         try:
-            outp, stats = timelapse_one(
-                input_path=inp,
-                target_seconds=target_seconds,
-                out_fps=out_fps,
-                target_bitrate=target_bitrate,
-                max_bitrate=max_bitrate,
-                bufsize=bufsize,
-                profile=profile,
-                level=level,
-                res=res,
-                size=size,
-                fit=fit,
-                quiet=quiet,
-                log_spec=log_spec,
-                skip_existing=skip_existing,
-            )
-            if stats.get("skipped"):
-                skipped += 1
-                print(f"[跳过] 已存在输出：{outp}")
-            else:
-                ok.append(outp)
-        except Exception as e:
-            msg = str(e)
-            fail.append((inp, msg))
-            print(f"[失败] {inp}\n       {msg}")
+            for n, path in enumerate(pick_frames(recorded, frame_count)):
+                writer.stdin.write(path.read_bytes())
+                job_progress("sample", 0.2, (n + 1) / frame_count, stage="sample")
+        finally:
+            writer.stdin.close()
+            rc = writer.wait()
+        if rc != 0:
+            raise subprocess.CalledProcessError(rc, writer_cmd)
+        t_sample = now_perf() - t_end
 
-    t_batch = now_perf() - t_batch0
-    print("\n========== 批量总结 ==========")
-    print(f"[统计] 总耗时：{format_hms(t_batch)}（{t_batch:.2f}s）")
-    print(f"[统计] 成功：{len(ok)} | 跳过：{skipped} | 失败：{len(fail)}")
+        x264_args = build_x264_args(profile, level, target_bitrate, max_bitrate, bufsize, preset)
+        pass_args = x264_args + ["-passlogfile", str(work_dir / "passlog")]
+        t_pass1, t_pass2 = encode_two_pass(
+            ["-i", str(intermediate)], pass_args, partial_output_path(output_path), quiet,
+            lambda info: job_progress("pass1", 0.3, info.get("frame", 0) / frame_count, stage="pass1", **info),
+            lambda info: job_progress("pass2", 0.5, info.get("frame", 0) / frame_count, stage="pass2", **info),
+        )
+        os.replace(partial_output_path(output_path), output_path)
 
-    if fail:
-        print("\n[失败列表]")
-        for p, msg in fail[:20]:
-            print(f"- {p}\n  {msg}")
-        if len(fail) > 20:
-            print(f"... 还有 {len(fail) - 20} 条失败未展开")
+        t_finish = now_perf() - t_end
+        stats = {
+            "dur": recorded,
+            "speed": speed,
+            "parts": len(done_parts),
+            "record": t_end - t_start,
+            "sample": t_sample,
+            "pass1": t_pass1,
+            "pass2": t_pass2,
+            "finish": t_finish,
+        }
+        log(f"[统计] record(跟随录制): {format_hms(t_end - t_start)}（{t_end - t_start:.2f}s）")
+        log(f"[统计] sample(挑帧写中间文件): {format_hms(t_sample)}（{t_sample:.2f}s）")
+        log(f"[统计] pass1(第一遍): {format_hms(t_pass1)}（{t_pass1:.2f}s）")
+        log(f"[统计] pass2(第二遍): {format_hms(t_pass2)}（{t_pass2:.2f}s）")
+        log(f"[统计] 录制结束后耗时：{format_hms(t_finish)}（{t_finish:.2f}s）")
+        log(f"[完成] 输出：{output_path}")
+        emit_event("live_end", input=str(source), output=str(output_path), **stats)
+        return output_path, stats
 
-    return ok, fail
+    except Exception as e:
+        emit_event("job_failed", input=str(source), error=str(e))
+        raise
+
+    finally:
+        if partial_output_path(output_path).exists():
+            try:
+                partial_output_path(output_path).unlink()
+            except Exception:
+                pass
+        shutil.rmtree(work_dir, ignore_errors=True)
+        log_close()
+
+
+# ----------------- 异步 API -----------------
+# 供其它 Python 服务内嵌调用：
+#   options = TimelapseOptions(target_seconds=60, res="1080p")
+#   output, stats = await timelapse_async(Path("rec.mp4"), options)
+# 处理本身仍是同步的引擎（采样管道、分段并行都依赖线程与阻塞管道），放在专用线程池里执行，
+# 同时最多运行 DEFAULT_ASYNC_JOBS 个（见 set_async_jobs），其余排队；同一个事件循环里可以同时 await 多个任务。
+# 任务被取消（task.cancel() / asyncio.wait_for 超时）时：还在排队的直接撤下；已开始的结束它启动的所有 ffmpeg，
+# 等引擎清理完临时文件后再抛出 CancelledError。
+# 命令行的单文件、合并、批量模式也经由这里执行（见 main）。
+_engine_executor: ThreadPoolExecutor | None = None
+_engine_executor_lock = threading.Lock()
+_async_jobs = DEFAULT_ASYNC_JOBS
+
+
+def set_async_jobs(jobs: int) -> None:
+    """异步 API 同时运行的处理任务数（之后提交的任务生效，已在运行的不受影响）"""
+    global _engine_executor, _async_jobs
+    with _engine_executor_lock:
+        _async_jobs = max(1, jobs)
+        if _engine_executor is not None:
+            _engine_executor.shutdown(wait=False)
+            _engine_executor = None
+
+
+def _get_engine_executor() -> ThreadPoolExecutor:
+    global _engine_executor
+    with _engine_executor_lock:
+        if _engine_executor is None:
+            _engine_executor = ThreadPoolExecutor(max_workers=_async_jobs, thread_name_prefix="engine")
+        return _engine_executor
+
+
+def _run_in_scope(scope: dict, fn, kwargs: dict):
+    _cancel_scope.set(scope)
+    return fn(**kwargs)
+
+
+async def run_engine(fn, **kwargs):
+    """在引擎线程池里运行同步的处理函数；被取消时结束它启动的 ffmpeg，等它收尾后再抛 CancelledError"""
+    scope = new_cancel_scope()
+    ctx = contextvars.copy_context()
+    job = _get_engine_executor().submit(ctx.run, _run_in_scope, scope, fn, kwargs)
+    future = asyncio.wrap_future(job)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if not job.cancel():  # 还在排队的直接撤下；已开始的要等它收尾
+            cancel_scope(scope)
+            try:
+                await future
+            except BaseException:
+                pass
+        raise
+
+
+async def probe_async(path: Path) -> dict:
+    """读取时长与首个视频流的画面信息：{"duration", "width", "height", "rotation", "start_time", "fps"}"""
+    def _probe() -> dict:
+        return {"duration": probe_duration_seconds(str(path)), **probe_video_stream(str(path))}
+    return await run_engine(_probe)
+
+
+async def timelapse_async(
+    input_path: Path,
+    options: TimelapseOptions | None = None,
+    output_path: Path | None = None,
+    on_progress=None,
+) -> tuple[Path, dict]:
+    """
+    单文件加速，返回 (输出路径, 统计)，同 timelapse_one
+    on_progress(fraction, info)：在工作线程里调用；需要回到事件循环时用 loop.call_soon_threadsafe
+    """
+    options = options or TimelapseOptions()
+    return await run_engine(
+        timelapse_one, input_path=Path(input_path), output_path=Path(output_path) if output_path else None,
+        on_progress=on_progress, options=options,
+    )
+
+
+async def merge_async(
+    folder: Path,
+    options: TimelapseOptions | None = None,
+    pattern: str = DEFAULT_PATTERN,
+    recurse: bool = DEFAULT_RECURSE,
+    exclude: list[str] | None = None,
+    merge_strategy: str = DEFAULT_MERGE_STRATEGY,
+    resume: bool = False,
+    files: list[Path] | None = None,
+    probe_jobs: int = DEFAULT_PROBE_JOBS,
+    on_progress=None,
+) -> Path:
+    """
+    合并模式（不做交互确认），返回输出路径
+    files：按此顺序合并（见 select_merge_files）；不给时扫描 folder 并按智能排序
+    on_progress(fraction, info)：整体进度，同 timelapse_async
+    """
+    options = options or TimelapseOptions()
+    return await run_engine(
+        merge_and_process, folder=Path(folder), pattern=pattern, recurse=recurse, exclude=exclude,
+        auto_yes=True, merge_strategy=merge_strategy, resume=resume, files=files, probe_jobs=probe_jobs,
+        on_progress=on_progress, options=options,
+    )
+
+
+async def batch_async(
+    folder: Path,
+    options: TimelapseOptions | None = None,
+    pattern: str = DEFAULT_PATTERN,
+    recurse: bool = DEFAULT_RECURSE,
+    exclude: list[str] | None = None,
+    resume: bool = False,
+    probe_jobs: int = DEFAULT_PROBE_JOBS,
+    on_progress=None,
+) -> tuple[list[Path], list[tuple[Path, str]]]:
+    """
+    批量模式，返回 (成功的输出列表, [(失败的输入, 错误信息), ...])
+    on_progress(fraction, info)：整批进度（按时长加权），同 timelapse_async
+    """
+    options = options or TimelapseOptions()
+    return await run_engine(
+        batch_process, folder=Path(folder), pattern=pattern, recurse=recurse, exclude=exclude,
+        resume=resume, probe_jobs=probe_jobs, on_progress=on_progress, options=options,
+    )
 
 
 # ----------------- CLI -----------------
@@ -966,10 +5358,27 @@ def main():
 
     # 批量
     parser.add_argument("--batch", help="批量处理文件夹路径（启用批量模式）")
-    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help='批量匹配规则（默认 "*.mp4"）')
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help='批量匹配规则，多个用 ; 分隔，如 "*.mp4;*.mkv"（默认 "*.mp4"）')
     parser.add_argument("--recurse", action="store_true", default=DEFAULT_RECURSE, help="批量模式：递归子目录")
+    parser.add_argument("--exclude", action="append", default=None, metavar="规则",
+                        help='批量模式：排除匹配的文件或文件夹（文件夹整个不进入），可重复指定。'
+                             '不含 / 时匹配名字，含 / 时匹配相对路径。例：--exclude "proxy" --exclude "*_old.mp4"')
     parser.add_argument("--merge", action="store_true", default=DEFAULT_MERGE, help="合并模式：拼接所有视频后再加速（需配合 --batch 使用）")
     parser.add_argument("--merge-only", action="store_true", default=DEFAULT_MERGE_ONLY, help="只合并模式：仅拼接视频，不做速度处理（需配合 --batch 使用）")
+    parser.add_argument("--merge-append", action="store_true", default=DEFAULT_MERGE_APPEND,
+                        help="只合并模式输出分片 MP4，再次运行时新增的文件直接追加到末尾（原地写入，追加中断会损坏文件直到下次整体重新合并）")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视模式：持续监视 --batch 文件夹，新录制的文件写完后自动加速处理（Ctrl+C 停止）")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help=f"监视模式：检查间隔（秒）。默认 {DEFAULT_WATCH_INTERVAL:g}")
+    parser.add_argument("--watch-settle", type=float, default=DEFAULT_WATCH_SETTLE,
+                        help=f"监视模式：文件大小/修改时间连续多少秒不变才开始处理。默认 {DEFAULT_WATCH_SETTLE:g}")
+    parser.add_argument("--live", action="store_true",
+                        help="实时模式：跟随正在录制的文件（或 --batch 分段录制文件夹）边录边采样，录制结束后几秒内出片")
+    parser.add_argument("--live-step", type=float, default=DEFAULT_LIVE_STEP,
+                        help=f"实时模式：录制期间每隔多少秒源时间取一帧（录得越久自动越稀疏）。默认 {DEFAULT_LIVE_STEP:g}")
+    parser.add_argument("--live-idle", type=float, default=DEFAULT_LIVE_IDLE,
+                        help=f"实时模式：录制文件连续多少秒没有新数据视为录制结束（Ctrl+C 可立即结束）。默认 {DEFAULT_LIVE_IDLE:g}")
     parser.add_argument("--duration-only", action="store_true", default=DEFAULT_DURATION_ONLY, help="只输出总时长模式：统计所有视频时长，不做任何处理（需配合 --batch 使用）")
 
     # 通用参数
@@ -982,11 +5391,64 @@ def main():
     parser.add_argument("--buf", dest="bufsize", default=DEFAULT_BUFSIZE, help="VBV bufsize，如 48000k")
     parser.add_argument("--profile", default=DEFAULT_PROFILE, help="H.264 profile，默认 high")
     parser.add_argument("--level", default=DEFAULT_LEVEL, help="H.264 level，默认 4.0")
+    parser.add_argument("--preset", default=DEFAULT_PRESET, choices=X264_PRESETS,
+                        help=f"x264 preset：越慢同码率画质越好、编码越久。配合 --deadline 时为最慢的候选。默认 {DEFAULT_PRESET}")
+    parser.add_argument("--deadline", default=DEFAULT_DEADLINE, metavar="时长",
+                        help="截止时间（格式同 -t，如 10:00）：按本机实测速度从 --preset 起逐级选更快的 preset、"
+                             "必要时改为单遍编码，开始前报告预计耗时与仍然生效的码率参数。批量/合并模式按整批计算")
 
     # 分辨率选项
     parser.add_argument("--res", default=DEFAULT_RES, help="快捷分辨率：source/1080p/720p/4k。默认 source")
     parser.add_argument("--size", default=None, help="自定义分辨率：例如 1920x1080（优先级高于 --res）")
     parser.add_argument("--fit", default=DEFAULT_FIT, help="适配模式：contain/pad/crop/stretch。默认 contain")
+    parser.add_argument("--rendition", action="append", default=None, metavar="时长[@分辨率][/适配]",
+                        help="单文件模式：一次解码同时输出多个版本，可重复指定。"
+                             "例：--rendition 30@1080p --rendition 60@1080p --rendition 15@720p/crop"
+                             "（省略的分辨率/适配取 --res/--size/--fit）")
+
+    # 采样引擎
+    parser.add_argument("--sampler", default=DEFAULT_SAMPLER, choices=["auto", "filter", "seek", "keyframe"],
+                        help="采样方式：auto（按倍率自动选择）/filter（滤镜链逐帧解码）/seek（关键帧索引跳读）"
+                             "/keyframe（只解码关键帧，适合 GOP 很长的录屏）。默认 auto")
+    parser.add_argument("--seek-speed", type=float, default=DEFAULT_SEEK_SPEED,
+                        help=f"auto 模式下加速倍率达到该值时启用关键帧跳读，0 = 不自动启用。默认 {DEFAULT_SEEK_SPEED:g}")
+    parser.add_argument("--no-intermediate", dest="use_intermediate", action="store_false", default=DEFAULT_INTERMEDIATE,
+                        help="不使用无损中间文件：两遍编码各自解码一次源视频（节省临时磁盘空间）")
+
+    # 探测缓存
+    parser.add_argument("--no-probe-cache", dest="probe_cache", action="store_false", default=DEFAULT_PROBE_CACHE,
+                        help="不使用 ffprobe 结果缓存（每次都重新读取）")
+    parser.add_argument("--no-render-cache", dest="render_cache", action="store_false", default=DEFAULT_RENDER_CACHE,
+                        help="不使用渲染缓存（同样的素材同样的参数也重新渲染）")
+    parser.add_argument("--sample-cache", dest="sample_cache", action="store_true", default=DEFAULT_SAMPLE_CACHE,
+                        help="缓存采样结果（源分辨率的无损中间文件），之后只改码率/分辨率再渲染时不必重新解码源视频")
+    parser.add_argument("--no-sample-cache", dest="sample_cache", action="store_false",
+                        help="不缓存采样结果（覆盖配置区的 DEFAULT_SAMPLE_CACHE）")
+    parser.add_argument("--probe-jobs", type=int, default=DEFAULT_PROBE_JOBS,
+                        help=f"同时进行的探测数（读取时长等），网络盘上可调大。默认 {DEFAULT_PROBE_JOBS}")
+
+    # 并行
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help="并行数。单文件/合并模式：把输出切成 N 段，各段在独立 ffmpeg 进程中并行渲染后无损拼接；"
+                             "批量模式：同时处理 N 个文件，CPU 线程平均分配，最长的先开始。默认 1")
+    parser.add_argument("--chunk-seconds", type=float, default=DEFAULT_CHUNK_SECONDS,
+                        help="分块渲染：每块输出秒数（按 GOP 对齐，同时渲染 --jobs 块）。完成的块保存在输出旁的临时目录，"
+                             "中断后用同样参数再运行只重做缺失的块。0 = 不分块。默认 0")
+    parser.add_argument("--merge-strategy", choices=["concat", "parallel"], default=DEFAULT_MERGE_STRATEGY,
+                        help="合并模式的处理方式：concat=整体加速；parallel=按时长比例分配帧数、各文件并行加速后拼接（配合 --jobs）。"
+                             f"默认 {DEFAULT_MERGE_STRATEGY}")
+
+    # 资源控制
+    parser.add_argument("--priority", choices=list(PRIORITY_NICE), default=DEFAULT_PRIORITY,
+                        help="ffmpeg/ffprobe 的优先级：normal / low（低于正常）/ idle（其它程序空闲时才运行）。"
+                             f"默认 {DEFAULT_PRIORITY}")
+    parser.add_argument("--cpus", default=DEFAULT_CPUS, metavar="CPU列表",
+                        help='只在这些 CPU 上运行，如 "0-5" 或 "2,3,6-7"，把其余核留给录制/绘画软件')
+    parser.add_argument("--threads", default=DEFAULT_THREADS, metavar="N|解码:滤镜:编码",
+                        help="每个 ffmpeg 的线程上限，如 4 或 2:1:4（0 = 该项自动）。默认自动")
+    parser.add_argument("--adaptive", nargs="?", type=float, const=0.5, default=DEFAULT_ADAPTIVE_LOAD, metavar="占用",
+                        help="自适应暂停（仅 Linux）：其它程序的 CPU 占用超过整机的该比例时暂停渲染，降到一半以下时继续。"
+                             "只写 --adaptive 为 0.5")
 
     # 日志输出
     parser.add_argument("--log", nargs="?", const="AUTO", default=DEFAULT_LOG,
@@ -995,9 +5457,19 @@ def main():
     # 安静模式
     parser.add_argument("--quiet", action="store_true", default=DEFAULT_QUIET, help="减少 ffmpeg 输出（只显示 error）")
 
+    # 进度
+    parser.add_argument("--progress-interval", type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help=f"控制台进度/预计剩余时间的刷新间隔（秒），0 = 不显示。默认 {DEFAULT_PROGRESS_INTERVAL:g}")
+    parser.add_argument("--progress-json", default=DEFAULT_PROGRESS_JSON,
+                        help="把进度事件以 JSON-lines 写入文件（追加）或文件描述符（fd:3），供看板实时读取")
+
     # 批量：跳过已存在
     parser.add_argument("--skip-existing", action="store_true", default=DEFAULT_SKIP_EXISTING, help="若输出文件已存在则跳过（批量很实用）")
     
+    # 断点续跑
+    parser.add_argument("--resume", action="store_true", default=DEFAULT_RESUME,
+                        help="批量/合并模式：按文件夹里的任务日志断点续跑，跳过已完成的项并清理中断留下的临时文件")
+
     # 自动确认（跳过交互）
     parser.add_argument("--yes", "-y", action="store_true", help="自动确认所有提示，跳过交互（适用于合并模式）")
 
@@ -1009,12 +5481,49 @@ def main():
 
     args = parser.parse_args()
 
+    if args.jobs < 1:
+        raise SystemExit("[错误] --jobs 需要是正整数")
+    if args.probe_jobs < 1:
+        raise SystemExit("[错误] --probe-jobs 需要是正整数")
+    if args.chunk_seconds < 0:
+        raise SystemExit("[错误] --chunk-seconds 不能为负数")
+    if args.live_step <= 0 or args.live_idle <= 0:
+        raise SystemExit("[错误] --live-step 与 --live-idle 需要是正数")
+    if not 0 <= args.adaptive < 1:
+        raise SystemExit("[错误] --adaptive 需要是 0~1 之间的比例，如 0.5")
+    try:
+        configure_governor(priority=args.priority, cpus=args.cpus, threads=args.threads, adaptive_load=args.adaptive)
+    except ValueError as e:
+        raise SystemExit(f"[错误] 资源控制参数不合法：{e}")
+
+    set_probe_cache_enabled(args.probe_cache)
+    set_render_cache_enabled(args.render_cache)
+    set_sample_cache_enabled(args.sample_cache)
+    set_progress_interval(args.progress_interval)
+    try:
+        open_progress_stream(args.progress_json)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"[错误] 无法打开进度事件流 {args.progress_json}：{e}")
+
     # 解析 target
     try:
         target_seconds = parse_duration(args.target)
     except Exception as e:
         raise SystemExit(f"[错误] target 参数不合法：{e}")
 
+    # 解析 deadline
+    deadline = None
+    if args.deadline is not None:
+        try:
+            deadline = parse_duration(args.deadline)
+        except Exception as e:
+            raise SystemExit(f"[错误] --deadline 参数不合法：{e}")
+        if deadline <= 0:
+            raise SystemExit("[错误] --deadline 需要是正的时长")
+        if args.watch or args.live or args.rendition or args.merge_only or args.duration_only:
+            raise SystemExit("[错误] --deadline 只能用于单文件、批量和合并模式"
+                             "（不支持 --watch、--live、--rendition、--merge-only、--duration-only）")
+
     # 解析 shutdown
     shutdown_delay = None
     if args.shutdown is not None:
@@ -1025,6 +5534,29 @@ def main():
         except Exception:
             raise SystemExit("[错误] --shutdown 需要是非负整数秒数，比如 --shutdown 或 --shutdown 120")
 
+    options = TimelapseOptions(
+        target_seconds=target_seconds,
+        out_fps=args.fps,
+        target_bitrate=args.target_bitrate,
+        max_bitrate=args.max_bitrate,
+        bufsize=args.bufsize,
+        profile=args.profile,
+        level=args.level,
+        preset=args.preset,
+        res=args.res,
+        size=args.size,
+        fit=args.fit,
+        sampler=args.sampler,
+        seek_speed=args.seek_speed,
+        use_intermediate=args.use_intermediate,
+        jobs=args.jobs,
+        chunk_seconds=args.chunk_seconds,
+        deadline=deadline,
+        skip_existing=args.skip_existing,
+        quiet=args.quiet,
+        log_spec=args.log,
+    )
+
     # 批量模式
     if args.batch:
         folder = Path(args.batch)
@@ -1032,9 +5564,58 @@ def main():
             raise SystemExit(f"[错误] batch 路径不是有效文件夹：{folder}")
 
         # 检查模式冲突
-        mode_count = sum([args.merge, args.merge_only, args.duration_only])
+        mode_count = sum([args.merge, args.merge_only, args.duration_only, args.watch, args.live])
         if mode_count > 1:
-            raise SystemExit("[错误] --merge、--merge-only、--duration-only 只能选择一个")
+            raise SystemExit("[错误] --merge、--merge-only、--duration-only、--watch、--live 只能选择一个")
+        if args.merge_append and not args.merge_only:
+            raise SystemExit("[错误] --merge-append 需配合 --merge-only 使用")
+
+        # 实时模式：跟随分段录制的文件夹，录制结束后出一个视频
+        if args.live:
+            try:
+                live_timelapse(
+                    source=folder,
+                    target_seconds=target_seconds,
+                    out_fps=args.fps,
+                    target_bitrate=args.target_bitrate,
+                    max_bitrate=args.max_bitrate,
+                    bufsize=args.bufsize,
+                    profile=args.profile,
+                    level=args.level,
+                    res=args.res,
+                    size=args.size,
+                    fit=args.fit,
+                    quiet=args.quiet,
+                    log_spec=args.log,
+                    pattern=args.pattern,
+                    recurse=args.recurse,
+                    exclude=args.exclude,
+                    step=args.live_step,
+                    idle=args.live_idle,
+                    preset=args.preset,
+                )
+            except Exception as e:
+                raise SystemExit(f"[错误] 实时模式失败：{e}")
+            if shutdown_delay is not None:
+                shutdown_windows(delay_seconds=shutdown_delay)
+            return
+
+        # 监视模式：常驻，新文件写完后自动处理
+        if args.watch:
+            if shutdown_delay is not None:
+                raise SystemExit("[错误] 监视模式不会自行结束，不能与 --shutdown 同时使用")
+            if args.watch_interval <= 0 or args.watch_settle < 0:
+                raise SystemExit("[错误] --watch-interval 需要是正数，--watch-settle 不能为负数")
+            watch_folder(
+                folder=folder,
+                pattern=args.pattern,
+                recurse=args.recurse,
+                exclude=args.exclude,
+                interval=args.watch_interval,
+                settle=args.watch_settle,
+                options=options,
+            )
+            return
 
         # 只输出总时长模式：统计所有视频时长
         if args.duration_only:
@@ -1043,6 +5624,8 @@ def main():
                     folder=folder,
                     pattern=args.pattern,
                     recurse=args.recurse,
+                    exclude=args.exclude,
+                    probe_jobs=args.probe_jobs,
                 )
             except Exception as e:
                 raise SystemExit(f"[错误] 只输出总时长模式失败：{e}")
@@ -1053,8 +5636,10 @@ def main():
                     folder=folder,
                     pattern=args.pattern,
                     recurse=args.recurse,
+                    exclude=args.exclude,
                     quiet=args.quiet,
                     auto_yes=args.yes,
+                    appendable=args.merge_append,
                 )
                 if result is None:
                     print("[信息] 操作已取消")
@@ -1064,35 +5649,55 @@ def main():
         # 合并模式：拼接所有视频后再加速
         elif args.merge:
             try:
-                result = merge_and_process(
-                    folder=folder,
-                    pattern=args.pattern,
-                    recurse=args.recurse,
-                    target_seconds=target_seconds,
-                    out_fps=args.fps,
-                    target_bitrate=args.target_bitrate,
-                    max_bitrate=args.max_bitrate,
-                    bufsize=args.bufsize,
-                    profile=args.profile,
-                    level=args.level,
-                    res=args.res,
-                    size=args.size,
-                    fit=args.fit,
-                    quiet=args.quiet,
-                    log_spec=args.log,
-                    auto_yes=args.yes,
-                )
-                if result is None:
+                # 确认顺序需要交互，在主线程完成后再交给引擎
+                files = select_merge_files(folder, args.pattern, args.recurse, args.exclude, args.yes)
+                if files is None:
                     print("[信息] 操作已取消")
                     return
+                asyncio.run(merge_async(
+                    folder,
+                    options,
+                    pattern=args.pattern,
+                    recurse=args.recurse,
+                    exclude=args.exclude,
+                    merge_strategy=args.merge_strategy,
+                    resume=args.resume,
+                    files=files,
+                    probe_jobs=args.probe_jobs,
+                ))
             except Exception as e:
                 raise SystemExit(f"[错误] 合并模式失败：{e}")
         else:
             # 普通批量模式：每个视频单独处理
-            _, _ = batch_process(
-                folder=folder,
+            asyncio.run(batch_async(
+                folder,
+                options,
                 pattern=args.pattern,
                 recurse=args.recurse,
+                exclude=args.exclude,
+                resume=args.resume,
+                probe_jobs=args.probe_jobs,
+            ))
+
+        if shutdown_delay is not None:
+            shutdown_windows(delay_seconds=shutdown_delay)
+        return
+
+    # 单文件模式
+    if args.resume:
+        raise SystemExit("[错误] --resume 需配合 --batch 使用（单文件模式请用 --skip-existing）")
+    if args.merge_append:
+        raise SystemExit("[错误] --merge-append 需配合 --batch 与 --merge-only 使用")
+    if not args.input_video:
+        raise SystemExit("[错误] 请输入 input_video（单文件模式）或使用 --batch（批量模式）")
+
+    inp = Path(args.input_video)
+    if args.live:
+        if args.rendition:
+            raise SystemExit("[错误] 实时模式不支持 --rendition")
+        try:
+            live_timelapse(
+                source=inp,
                 target_seconds=target_seconds,
                 out_fps=args.fps,
                 target_bitrate=args.target_bitrate,
@@ -1105,35 +5710,54 @@ def main():
                 fit=args.fit,
                 quiet=args.quiet,
                 log_spec=args.log,
-                skip_existing=args.skip_existing,
+                step=args.live_step,
+                idle=args.live_idle,
+                preset=args.preset,
             )
-
+        except Exception as e:
+            raise SystemExit(f"[错误] 实时模式失败：{e}")
         if shutdown_delay is not None:
             shutdown_windows(delay_seconds=shutdown_delay)
         return
-
-    # 单文件模式
-    if not args.input_video:
-        raise SystemExit("[错误] 请输入 input_video（单文件模式）或使用 --batch（批量模式）")
-
-    inp = Path(args.input_video)
+    if args.rendition:
+        # 多版本输出固定为滤镜链采样 + 中间文件 + 整段两遍编码；不适用的参数明确拒绝，不静默忽略
+        unsupported = [flag for flag, used in [
+            ("--sampler", args.sampler not in ("auto", "filter")),
+            ("--seek-speed", args.seek_speed != DEFAULT_SEEK_SPEED),
+            ("--no-intermediate", args.use_intermediate != DEFAULT_INTERMEDIATE),
+            ("--chunk-seconds", args.chunk_seconds != DEFAULT_CHUNK_SECONDS),
+            ("--sample-cache", args.sample_cache),
+        ] if used]
+        if unsupported:
+            raise SystemExit(f"[错误] --rendition 不支持 {'、'.join(unsupported)}"
+                             "（多版本输出固定用滤镜链采样、写中间文件、整段编码）")
+        try:
+            renditions = [parse_rendition(spec, args.size or args.res, args.fit) for spec in args.rendition]
+        except Exception as e:
+            raise SystemExit(f"[错误] --rendition 参数不合法：{e}")
     try:
-        outp, stats = timelapse_one(
-            input_path=inp,
-            target_seconds=target_seconds,
-            out_fps=args.fps,
-            target_bitrate=args.target_bitrate,
-            max_bitrate=args.max_bitrate,
-            bufsize=args.bufsize,
-            profile=args.profile,
-            level=args.level,
-            res=args.res,
-            size=args.size,
-            fit=args.fit,
-            quiet=args.quiet,
-            log_spec=args.log,
-            skip_existing=args.skip_existing,
-        )
+        if args.rendition:
+            for outp, stats in timelapse_multi(
+                input_path=inp,
+                renditions=renditions,
+                out_fps=args.fps,
+                target_bitrate=args.target_bitrate,
+                max_bitrate=args.max_bitrate,
+                bufsize=args.bufsize,
+                profile=args.profile,
+                level=args.level,
+                quiet=args.quiet,
+                log_spec=args.log,
+                skip_existing=args.skip_existing,
+                jobs=args.jobs,
+                preset=args.preset,
+            ):
+                if stats.get("skipped"):
+                    print(f"[跳过] 已存在输出：{outp}")
+            if shutdown_delay is not None:
+                shutdown_windows(delay_seconds=shutdown_delay)
+            return
+        outp, stats = asyncio.run(timelapse_async(inp, options))
         if stats.get("skipped"):
             print(f"[跳过] 已存在输出：{outp}")
         if shutdown_delay is not None:
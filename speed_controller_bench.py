@@ -0,0 +1,401 @@
+"""
+HumanLapse - 性能基准
+用 ffmpeg lavfi（testsrc2 / mandelbrot）生成可复现的合成素材，按 stats 的各阶段计时，
+结果保存为 JSON，可与基准结果对比并标出明显变慢的阶段。
+
+完全离线运行，只需要 ffmpeg/ffprobe（含 libx264）。
+
+用法示例：
+  python speed_controller_bench.py                                  # 默认场景，结果写到 bench_results.json
+  python speed_controller_bench.py --duration 3600 --size 1920x1080 # 1 小时 1080p 素材
+  python speed_controller_bench.py --out new.json --baseline old.json --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import speed_controller as sc
+import speed_controller_server as srv
+
+
+# 各场景记录的阶段（与 timelapse_one 的 stats 字段一致）
+STAGES = ["probe", "filterprep", "index", "sample", "pass1", "pass2", "concat", "cleanup", "total"]
+
+# 默认运行的场景
+DEFAULT_SCENARIOS = ["probe", "probe_mkv", "single", "seek", "jobs", "merge", "merge_only", "server"]
+
+# 对比时：变慢超过该比例、且绝对值超过 MIN_DELTA 秒才算回退（过滤计时抖动）
+DEFAULT_THRESHOLD = 0.15
+MIN_DELTA = 0.2
+
+SERVER_START_TIMEOUT = 30.0     # server 场景：等待任务服务启动的秒数
+SERVER_JOB_TIMEOUT = 600.0      # server 场景：等待单个任务结束的秒数
+
+
+# ----------------- 素材 -----------------
+def fixture_name(source: str, duration: float, size: str, fps: int, gop: int) -> str:
+    return f"{source}_{duration:g}s_{size}_{fps}fps_gop{gop}"
+
+
+def make_fixture(
+    path: Path,
+    source: str,
+    duration: float,
+    size: str,
+    fps: int,
+    gop: int,
+    start: float = 0.0,
+) -> Path:
+    """
+    生成一个合成素材（已存在则直接复用）
+    x264 单线程 + bitexact，同样的参数每次生成的文件逐字节一致
+    start：画面从第几秒开始（多段素材各段内容不重复）
+    """
+    if path.exists():
+        return path
+    if source == "testsrc2":
+        src = f"testsrc2=size={size}:rate={fps}:duration={start + duration:g}"
+    elif source == "mandelbrot":
+        src = f"mandelbrot=size={size}:rate={fps}"
+    else:
+        raise ValueError("source 只支持 testsrc2/mandelbrot")
+
+    tmp = path.with_name("_tmp_" + path.name)
+    cmd = [
+        sc.FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", src,
+        "-ss", f"{start:g}", "-t", f"{duration:g}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-threads", "1",
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0", "-bf", "0",
+        "-pix_fmt", "yuv420p",
+        "-map_metadata", "-1",
+        "-fflags", "+bitexact", "-flags:v", "+bitexact",
+        str(tmp),
+    ]
+    subprocess.check_call(cmd)
+    tmp.replace(path)
+    return path
+
+
+def remux_fixture(src: Path, path: Path) -> Path:
+    """把素材流复制成另一种容器（已存在则直接复用），例如 MKV：探测时走 ffprobe 而不是 MP4 原生解析"""
+    if path.exists():
+        return path
+    tmp = path.with_name("_tmp_" + path.name)
+    subprocess.check_call([
+        sc.FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", str(src), "-c", "copy", "-map_metadata", "-1", "-fflags", "+bitexact",
+        str(tmp),
+    ])
+    tmp.replace(path)
+    return path
+
+
+def prepare_fixtures(workdir: Path, args) -> dict:
+    """
+    生成单文件素材、同内容的 MKV 与多段素材文件夹
+    返回 {"single": 文件, "single_mkv": 文件, "parts_dir": 文件夹, "parts": [文件, ...]}
+    """
+    name = fixture_name(args.source, args.duration, args.size, args.fps, args.gop)
+    fixtures_dir = workdir / "fixtures"
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"[信息] 准备素材：{name}")
+    single = make_fixture(fixtures_dir / f"{name}.mp4", args.source, args.duration, args.size, args.fps, args.gop)
+    single_mkv = remux_fixture(single, fixtures_dir / f"{name}.mkv")
+
+    parts_dir = fixtures_dir / f"{name}_parts{args.parts}"
+    parts_dir.mkdir(exist_ok=True)
+    part_dur = args.duration / args.parts
+    parts = [
+        make_fixture(parts_dir / f"part_{i + 1}.mp4", args.source, part_dur, args.size, args.fps, args.gop,
+                     start=i * part_dur)
+        for i in range(args.parts)
+    ]
+    return {"single": single, "single_mkv": single_mkv, "parts_dir": parts_dir, "parts": parts}
+
+
+# ----------------- 场景 -----------------
+def _render(input_path: Path, output_path: Path, args, **kwargs) -> dict:
+    _, stats = sc.timelapse_one(
+        input_path=input_path,
+        target_seconds=args.target,
+        out_fps=args.out_fps,
+        target_bitrate=sc.DEFAULT_TARGET_BITRATE,
+        max_bitrate=sc.DEFAULT_MAX_BITRATE,
+        bufsize=sc.DEFAULT_BUFSIZE,
+        profile=sc.DEFAULT_PROFILE,
+        level=sc.DEFAULT_LEVEL,
+        res="source",
+        size=None,
+        fit=sc.DEFAULT_FIT,
+        quiet=True,
+        log_spec=None,
+        skip_existing=False,
+        output_path=output_path,
+        **kwargs,
+    )
+    return {key: stats.get(key, 0.0) for key in STAGES}
+
+
+def run_scenario(name: str, fixtures: dict, out_dir: Path, args) -> dict:
+    """运行一次场景，返回 {阶段: 秒}"""
+    single = fixtures["single"]
+    if name == "probe":
+        # 无缓存读取时长 + 画面信息（每个分段各一次）；MP4 大多走原生解析
+        t0 = sc.now_perf()
+        for f in [single] + fixtures["parts"]:
+            sc.probe_duration_seconds(str(f))
+            sc.probe_video_stream(str(f))
+        t = sc.now_perf() - t0
+        return {"probe": t, "total": t}
+    if name == "probe_mkv":
+        # 同样的读取走 ffprobe（MKV 没有原生解析）
+        t0 = sc.now_perf()
+        sc.probe_duration_seconds(str(fixtures["single_mkv"]))
+        sc.probe_video_stream(str(fixtures["single_mkv"]))
+        t = sc.now_perf() - t0
+        return {"probe": t, "total": t}
+    if name == "single":
+        return _render(single, out_dir / "single.mp4", args, sampler="filter")
+    if name == "seek":
+        return _render(single, out_dir / "seek.mp4", args, sampler="seek")
+    if name == "jobs":
+        return _render(single, out_dir / "jobs.mp4", args, sampler="filter", jobs=args.jobs)
+    if name == "merge":
+        concat_list = out_dir / "_concat_list_merge.txt"
+        sc.write_concat_list(fixtures["parts"], concat_list)
+        sources = [(f, sc.probe_duration_seconds(str(f))) for f in fixtures["parts"]]
+        try:
+            return _render(concat_list, out_dir / "merge.mp4", args, sampler="filter", concat_sources=sources)
+        finally:
+            concat_list.unlink()
+    if name == "merge_only":
+        t0 = sc.now_perf()
+        sc.merge_videos(fixtures["parts"], out_dir / "merge_only.mp4", quiet=True)
+        t = sc.now_perf() - t0
+        return {"concat": t, "total": t}
+    if name == "server":
+        return server_round_trip(single, out_dir, args)
+    raise ValueError(f"未知场景：{name}")
+
+
+def server_round_trip(single: Path, out_dir: Path, args) -> dict:
+    """
+    任务服务的本机往返检查：用临时队列文件与缓存目录在空闲端口（--port 0）上启动 serve，
+    提交一个任务并轮询到完成；再提交两个任务，分别取消排队中的和运行中的。
+    任一步不符合预期时抛 RuntimeError。返回 {"total": 从提交到第一个任务完成的秒数}
+    """
+    with tempfile.TemporaryDirectory(prefix="humanlapse_server_") as tmp:
+        env = dict(os.environ, HUMANLAPSE_CACHE_DIR=tmp, PYTHONIOENCODING="utf-8")
+        cmd = [sys.executable, "-u", str(Path(srv.__file__)), "serve", "--port", "0",
+               "--db", str(Path(tmp) / srv.QUEUE_FILE), "--root", str(single.parent), "--root", str(out_dir)]
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, encoding="utf-8", errors="replace")
+        lines: list[str] = []
+        started = threading.Event()
+        port = None
+
+        def _drain():
+            # 一直读完服务的输出，避免管道写满卡住服务
+            nonlocal port
+            for line in proc.stdout:
+                lines.append(line.rstrip())
+                m = re.search(r"http://[^\s:]+:(\d+)", line)
+                if m and port is None:
+                    port = int(m.group(1))
+                    started.set()
+            started.set()
+
+        threading.Thread(target=_drain, daemon=True).start()
+        try:
+            if not started.wait(SERVER_START_TIMEOUT) or port is None:
+                raise RuntimeError("任务服务没有启动：\n" + "\n".join(lines[-20:]))
+            server = f"http://127.0.0.1:{port}"
+
+            def _submit(name: str, target: float) -> int:
+                payload = {
+                    "input": str(single),
+                    "output": str(out_dir / name),
+                    "options": {"target_seconds": target, "out_fps": args.out_fps, "res": "source", "quiet": True},
+                }
+                return srv.call_server(server, "POST", "/jobs", payload)["id"]
+
+            def _wait(job_id: int, states: tuple[str, ...]) -> dict:
+                deadline = time.monotonic() + SERVER_JOB_TIMEOUT
+                while True:
+                    job = srv.call_server(server, "GET", f"/jobs/{job_id}")
+                    if job["state"] not in ("queued", "running") or time.monotonic() > deadline:
+                        break
+                    time.sleep(0.2)
+                if job["state"] not in states:
+                    raise RuntimeError(f"任务 #{job_id} 状态为 {job['state']}，应为 {'/'.join(states)}："
+                                       f"{job.get('error') or ''}")
+                return job
+
+            t0 = sc.now_perf()
+            _wait(_submit("server.mp4", args.target), ("done",))
+            t = sc.now_perf() - t0
+
+            # 目标时长与上一个不同，不会命中服务的渲染缓存；只有一个工作者，第二个还在排队
+            running_id = _submit("server_cancel_running.mp4", args.target * 2)
+            queued_id = _submit("server_cancel_queued.mp4", args.target * 2)
+            srv.call_server(server, "POST", f"/jobs/{queued_id}/cancel")
+            srv.call_server(server, "POST", f"/jobs/{running_id}/cancel")
+            for job_id in (queued_id, running_id):
+                _wait(job_id, ("cancelled",))
+            leftovers = [p.name for p in out_dir.glob("*server_cancel_*")]
+            if leftovers:
+                raise RuntimeError(f"被取消的任务留下了文件：{', '.join(leftovers)}")
+            return {"total": t}
+        finally:
+            if os.name == "nt":
+                proc.terminate()
+            else:
+                proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+
+
+def summarize(runs: list[dict]) -> dict:
+    """多次运行取中位数"""
+    keys = [k for k in STAGES if any(k in r for r in runs)]
+    return {k: statistics.median(r.get(k, 0.0) for r in runs) for k in keys}
+
+
+# ----------------- 对比 -----------------
+def compare(current: dict, baseline: dict, threshold: float) -> list[tuple[str, str, float, float]]:
+    """
+    对比两份结果的中位数，打印对照表
+    返回回退列表 [(场景, 阶段, 基准秒数, 当前秒数), ...]
+    """
+    regressions = []
+    print("\n========== 与基准对比（中位数）==========")
+    print(f"{'场景':<12}{'阶段':<12}{'基准':>10}{'当前':>10}{'变化':>10}")
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        for stage, cur_t in result["median"].items():
+            base_t = base["median"].get(stage)
+            if base_t is None:
+                continue
+            change = (cur_t - base_t) / base_t if base_t > 0 else 0.0
+            flag = ""
+            if cur_t > base_t * (1 + threshold) and cur_t - base_t > MIN_DELTA:
+                regressions.append((scenario, stage, base_t, cur_t))
+                flag = "  ← 回退"
+            print(f"{scenario:<12}{stage:<12}{base_t:>9.2f}s{cur_t:>9.2f}s{change * 100:>+9.1f}%{flag}")
+    return regressions
+
+
+def environment_info() -> dict:
+    try:
+        ffmpeg_version = sc.run_capture([sc.FFMPEG, "-version"]).splitlines()[0]
+    except Exception:
+        ffmpeg_version = "unknown"
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HumanLapse 性能基准：合成素材 + 分阶段计时 + 基准对比")
+    parser.add_argument("--workdir", default="bench_work", help="素材与输出目录（素材会复用）。默认 bench_work")
+    parser.add_argument("--source", default="testsrc2", choices=["testsrc2", "mandelbrot"], help="合成画面。默认 testsrc2")
+    parser.add_argument("--duration", type=float, default=600.0, help="素材时长（秒）。默认 600")
+    parser.add_argument("--size", default="640x360", help="素材分辨率。默认 640x360")
+    parser.add_argument("--fps", type=int, default=30, help="素材帧率。默认 30")
+    parser.add_argument("--gop", type=int, default=60, help="素材关键帧间隔（帧）。默认 60")
+    parser.add_argument("--parts", type=int, default=4, help="多段素材的分段数（merge 场景）。默认 4")
+    parser.add_argument("-t", "--target", type=float, default=10.0, help="输出时长（秒）。默认 10")
+    parser.add_argument("--out-fps", type=int, default=sc.DEFAULT_FPS, help=f"输出帧率。默认 {sc.DEFAULT_FPS}")
+    parser.add_argument("--jobs", type=int, default=max(2, os.cpu_count() or 1), help="jobs 场景的分段数。默认 CPU 核数")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"要运行的场景，逗号分隔。可选：{','.join(DEFAULT_SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景运行次数（取中位数）。默认 3")
+    parser.add_argument("--out", default="bench_results.json", help="结果 JSON 路径。默认 bench_results.json")
+    parser.add_argument("--baseline", default=None, help="基准结果 JSON，给出则对比并标出回退")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"变慢超过该比例视为回退。默认 {DEFAULT_THRESHOLD:g}")
+    parser.add_argument("--fail-on-regression", action="store_true", help="有回退时以返回码 1 退出（CI 用）")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in DEFAULT_SCENARIOS]
+    if unknown:
+        raise SystemExit(f"[错误] 未知场景：{', '.join(unknown)}")
+    if args.repeat < 1 or args.parts < 1:
+        raise SystemExit("[错误] --repeat 与 --parts 需要是正整数")
+
+    # 计时要可复现：不用探测/渲染/采样缓存，也不打印进度行
+    sc.set_probe_cache_enabled(False)
+    sc.set_render_cache_enabled(False)
+    sc.set_sample_cache_enabled(False)
+    sc.set_progress_interval(0)
+
+    workdir = Path(args.workdir)
+    out_dir = workdir / "out"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        fixtures = prepare_fixtures(workdir, args)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise SystemExit(f"[错误] 生成素材失败（需要带 libx264 的 ffmpeg）：{e}")
+
+    result = {
+        "env": environment_info(),
+        "params": {
+            "source": args.source, "duration": args.duration, "size": args.size, "fps": args.fps,
+            "gop": args.gop, "parts": args.parts, "target": args.target, "out_fps": args.out_fps,
+            "jobs": args.jobs, "repeat": args.repeat,
+        },
+        "scenarios": {},
+    }
+
+    for name in scenarios:
+        runs = []
+        for r in range(args.repeat):
+            print(f"[信息] 场景 {name}：第 {r + 1}/{args.repeat} 次…")
+            runs.append(run_scenario(name, fixtures, out_dir, args))
+        median = summarize(runs)
+        result["scenarios"][name] = {"runs": runs, "median": median}
+        print(f"[统计] {name}：" + " | ".join(f"{k} {v:.2f}s" for k, v in median.items()))
+
+    out_path = Path(args.out)
+    out_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n[完成] 结果：{out_path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("params") != result["params"]:
+            print("[警告] 基准与本次的素材/参数不同，对比仅供参考")
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n[警告] 有 {len(regressions)} 个阶段明显变慢（> {args.threshold * 100:.0f}%）")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\n[信息] 没有明显回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,14 @@ HumanLapse - 拖放式入口
 - 适配模式：contain
 """
 
+import asyncio
 import sys
 import os
+import subprocess
 from pathlib import Path
 
-# 导入主程序
-from speed_controller import main as speed_main
+# 导入主程序（异步 API）
+import speed_controller as sc
 
 
 def show_usage():
@@ -77,16 +79,6 @@ def drag_entry():
         print("\n开始处理...\n")
         print("=" * 70 + "\n")
         
-        # 设置参数
-        sys.argv = [
-            "speed_controller.py",
-            str(target_path),
-            "-t", "30",
-            "--fps", "60",
-            "--res", "source",
-            "--fit", "contain"
-        ]
-        
     elif target_path.is_dir():
         # ========== 文件夹模式 ==========
         print("=" * 70)
@@ -103,17 +95,6 @@ def drag_entry():
         print("\n开始处理...\n")
         print("=" * 70 + "\n")
         
-        # 设置参数
-        sys.argv = [
-            "speed_controller.py",
-            "--batch", str(target_path),
-            "--merge",
-            "-t", "30",
-            "--fps", "60",
-            "--res", "source",
-            "--fit", "contain",
-            "--yes"  # 自动确认，跳过交互
-        ]
     else:
         print("=" * 70)
         print(f"❌ 错误：不支持的路径类型")
@@ -122,20 +103,36 @@ def drag_entry():
         input("\n按任意键退出...")
         return
     
-    # 调用主程序
+    # 处理设置：目标30秒、60fps、保持原分辨率、contain；其余取主程序配置区的默认值
+    options = sc.TimelapseOptions(
+        target_seconds=30,
+        out_fps=60,
+        res="source",
+        fit="contain",
+    )
+    if target_path.is_file():
+        job = sc.timelapse_async(target_path, options)
+    else:
+        job = sc.merge_async(target_path, options)  # 自动确认，跳过交互
+    
+    # 调用主程序（控制台会定时显示整体进度与预计剩余时间）
     try:
-        speed_main()
+        sc.configure_governor()
+        # 进度事件流：拖放时没法加参数，用环境变量指定（文件路径或 fd:N）
+        sc.open_progress_stream(os.environ.get("HUMANLAPSE_PROGRESS_JSON"))
+        asyncio.run(job)
         print("\n" + "=" * 70)
         print("✅ 处理完成！")
         print("=" * 70)
     except KeyboardInterrupt:
+        job.close()
         print("\n" + "=" * 70)
         print("⚠️  用户中断操作")
         print("=" * 70)
-    except SystemExit as e:
-        # 捕获 SystemExit（主程序的错误退出）
+    except (OSError, subprocess.CalledProcessError) as e:
+        # ffmpeg 执行失败 / 找不到 ffmpeg / 磁盘写入失败
         print("\n" + "=" * 70)
-        print(f"❌ 处理失败（错误码：{e.code}）")
+        print(f"❌ 处理失败：{e}")
         print("=" * 70)
         print("\n💡 可能的原因：")
         print("  - 磁盘空间不足")
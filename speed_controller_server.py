@@ -0,0 +1,685 @@
+"""
+HumanLapse - 本地渲染任务服务
+多人/多台机器共用一台渲染机时，把任务交给常驻服务排队，由固定数量的工作者依次处理，
+避免每个人各自启动 ffmpeg 互相争抢 CPU。
+
+- 任务队列保存在 SQLite 文件里，服务重启后未完成的任务继续处理（处理到一半的重新排队）
+- 按优先级（大的先）+ 提交顺序分配给工作者
+- 提供本地 HTTP 接口（JSON）：提交 / 查询 / 取消；本文件同时也是客户端
+- 接口没有鉴权：输出与日志只能写到输入所在的文件夹或 --root 指定的文件夹里；
+  指定了 --root 时输入也必须在其中
+
+用法示例：
+  python speed_controller_server.py serve --workers 1 --priority low
+  python speed_controller_server.py serve --host 0.0.0.0 --root D:\\rec --root E:\\out
+  python speed_controller_server.py submit D:\\rec\\a.mp4 -t 60 --res 1080p --wait
+  python speed_controller_server.py submit D:\\rec\\day1 --merge --priority 10
+  python speed_controller_server.py status
+  python speed_controller_server.py cancel 3
+
+HTTP 接口：
+  POST /jobs                 提交，body 见 build_job；返回任务
+  GET  /jobs[?state=queued]  任务列表（最近 100 个）
+  GET  /jobs/<id>            单个任务（运行中的单文件任务带 progress）
+  POST /jobs/<id>/cancel     取消：排队中的直接取消，运行中的结束其 ffmpeg
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+import typing
+import urllib.error
+import urllib.request
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import speed_controller as sc
+
+
+# 默认只监听本机。改为 "0.0.0.0" 可让局域网内其它机器提交（接口没有鉴权，只在可信网络里这样用，
+# 并用 --root 限定可以读写的文件夹）
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 1             # 同时处理的任务数。每个任务自己还可以用 --jobs 分段并行
+DEFAULT_POLL_INTERVAL = 2.0     # 客户端 --wait 时查询状态的间隔（秒）
+
+QUEUE_FILE = "jobs.sqlite3"     # 默认保存在缓存目录里
+JOB_KINDS = ["timelapse", "merge", "batch"]
+MERGE_STRATEGIES = ["concat", "parallel"]
+SAMPLERS = ["auto", "filter", "seek", "keyframe"]
+LIST_LIMIT = 100
+
+OPTION_FIELDS = {f.name for f in fields(sc.TimelapseOptions)}
+DURATION_FIELDS = {"target_seconds", "deadline"}
+TYPE_NAMES = {str: "字符串", int: "整数", float: "数字", bool: "true/false", type(None): "null"}
+
+
+# ----------------- 任务队列 -----------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, priority DESC, id);
+"""
+
+
+def open_queue(path: Path) -> dict:
+    """
+    打开（或新建）任务队列
+    上次服务退出时还在运行的任务改回排队（输出只在完成时才改名，重跑不会留下半截文件）
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    requeued = conn.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'").rowcount
+    return {"conn": conn, "lock": threading.Lock(), "path": path, "requeued": requeued}
+
+
+def _job_from_row(row) -> dict:
+    params = json.loads(row["params"])
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "state": row["state"],
+        "priority": row["priority"],
+        "input": params["input"],
+        "output": params.get("output"),
+        "params": params,
+        "submitted": row["submitted"],
+        "started": row["started"],
+        "finished": row["finished"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+    }
+
+
+def add_job(queue: dict, kind: str, params: dict, priority: int = 0) -> dict:
+    with queue["lock"]:
+        cur = queue["conn"].execute(
+            "INSERT INTO jobs (kind, params, priority, submitted) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(params, ensure_ascii=False), priority, time.time()),
+        )
+        row = queue["conn"].execute("SELECT * FROM jobs WHERE id = ?", (cur.lastrowid,)).fetchone()
+    return _job_from_row(row)
+
+
+def get_job(queue: dict, job_id: int) -> dict | None:
+    with queue["lock"]:
+        row = queue["conn"].execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_from_row(row) if row else None
+
+
+def list_jobs(queue: dict, state: str | None = None, limit: int = LIST_LIMIT) -> list[dict]:
+    """最近提交的任务（新的在前）"""
+    sql = "SELECT * FROM jobs"
+    args = []
+    if state:
+        sql += " WHERE state = ?"
+        args.append(state)
+    sql += " ORDER BY id DESC LIMIT ?"
+    args.append(limit)
+    with queue["lock"]:
+        rows = queue["conn"].execute(sql, args).fetchall()
+    return [_job_from_row(r) for r in rows]
+
+
+def claim_job(queue: dict) -> dict | None:
+    """取出优先级最高、最早提交的排队任务并标记为运行中；没有则返回 None"""
+    with queue["lock"]:
+        conn = queue["conn"]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET state = 'running', started = ? WHERE id = ?", (time.time(), row["id"]))
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return _job_from_row(row) if row else None
+
+
+def finish_job(queue: dict, job_id: int, state: str, result=None, error: str | None = None) -> None:
+    with queue["lock"]:
+        queue["conn"].execute(
+            "UPDATE jobs SET state = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+            (state, time.time(), json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+             error, job_id),
+        )
+
+
+def requeue_job(queue: dict, job_id: int) -> None:
+    with queue["lock"]:
+        queue["conn"].execute("UPDATE jobs SET state = 'queued', started = NULL WHERE id = ?", (job_id,))
+
+
+def cancel_queued_job(queue: dict, job_id: int) -> bool:
+    """取消还在排队的任务；任务已开始/已结束时返回 False"""
+    with queue["lock"]:
+        cur = queue["conn"].execute(
+            "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+            (time.time(), job_id),
+        )
+    return cur.rowcount > 0
+
+
+# ----------------- 任务参数 -----------------
+def _is_type(value, t) -> bool:
+    """JSON 值是否符合字段类型（true/false 不算数字，整数可以当 float 用）"""
+    if t is type(None):
+        return value is None
+    if t is bool:
+        return isinstance(value, bool)
+    if t is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if t is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, t)
+
+
+def check_options(options: dict) -> None:
+    """按 TimelapseOptions 的字段类型与取值范围检查 options；不合法时抛 ValueError"""
+    for f in fields(sc.TimelapseOptions):
+        if f.name not in options:
+            continue
+        allowed = typing.get_args(f.type) or (f.type,)
+        if not any(_is_type(options[f.name], t) for t in allowed):
+            raise ValueError(f"options.{f.name} 需要是{'或'.join(TYPE_NAMES[t] for t in allowed)}")
+
+    if options.get("target_seconds", 1) <= 0:
+        raise ValueError("target_seconds 需要大于 0")
+    if options.get("deadline") is not None and options["deadline"] <= 0:
+        raise ValueError("deadline 需要是正的时长")
+    if options.get("out_fps", 1) <= 0:
+        raise ValueError("out_fps 需要大于 0")
+    if options.get("jobs", 1) < 1:
+        raise ValueError("jobs 至少为 1")
+    for key in ("seek_speed", "chunk_seconds"):
+        if options.get(key, 0) < 0:
+            raise ValueError(f"{key} 不能为负数")
+    if options.get("preset", sc.DEFAULT_PRESET) not in sc.X264_PRESETS:
+        raise ValueError(f"preset 只支持 {'/'.join(sc.X264_PRESETS)}")
+    if options.get("sampler", sc.DEFAULT_SAMPLER) not in SAMPLERS:
+        raise ValueError(f"sampler 只支持 {'/'.join(SAMPLERS)}")
+    sc.resolve_target_size(res=options.get("res", sc.DEFAULT_RES), size=options.get("size"))
+    sc.build_scale_filter((2, 2), options.get("fit", sc.DEFAULT_FIT))
+
+
+def _inside(path: Path, folders: list[Path]) -> bool:
+    return any(path == d or d in path.parents for d in folders)
+
+
+def build_job(payload: dict, roots: list[Path] | None = None) -> tuple[str, dict, int]:
+    """
+    校验提交的任务，返回 (kind, params, priority)；不合法时抛 ValueError
+    payload：
+      kind      timelapse（默认）/ merge / batch
+      input     源文件（timelapse）或文件夹（merge/batch），服务端路径
+      output    输出路径（仅 timelapse，可省略）
+      priority  整数，大的先处理（默认 0）
+      options   TimelapseOptions 的字段（类型须一致）；target_seconds / deadline 也可写成 "1:30"
+      pattern / recurse / exclude          merge、batch 的选片参数
+      merge_strategy / resume              merge 专用；batch 也支持 resume
+    roots：服务允许读写的文件夹（serve --root）。output 与 options.log_spec 只能在输入所在文件夹或 roots 里；
+           roots 非空时 input 也必须在 roots 里
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("请求体需要是 JSON 对象")
+    kind = payload.get("kind") or "timelapse"
+    if kind not in JOB_KINDS:
+        raise ValueError(f"kind 只支持 {'/'.join(JOB_KINDS)}")
+    if not payload.get("input"):
+        raise ValueError("缺少 input")
+    inp = Path(payload["input"]).expanduser().resolve()
+    if kind == "timelapse" and not inp.is_file():
+        raise ValueError(f"输入文件不存在：{inp}")
+    if kind != "timelapse" and not inp.is_dir():
+        raise ValueError(f"输入文件夹不存在：{inp}")
+    roots = [Path(r).expanduser().resolve() for r in roots or []]
+    if roots and not _inside(inp, roots):
+        raise ValueError(f"输入不在服务允许的文件夹里：{inp}")
+    writable = [inp if inp.is_dir() else inp.parent] + roots
+    try:
+        priority = int(payload.get("priority") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("priority 需要是整数")
+
+    options = dict(payload.get("options") or {})
+    unknown = sorted(set(options) - OPTION_FIELDS)
+    if unknown:
+        raise ValueError(f"未知的 options 字段：{', '.join(unknown)}")
+    for key in DURATION_FIELDS & set(options):
+        if isinstance(options[key], str):
+            options[key] = sc.parse_duration(options[key])
+    check_options(options)
+    log_spec = options.get("log_spec")
+    if log_spec not in (None, "AUTO"):
+        log_path = Path(log_spec).expanduser().resolve()
+        if not _inside(log_path, writable):
+            raise ValueError(f"日志只能写到输入所在文件夹或服务允许的文件夹里：{log_path}")
+        # 以分隔符结尾表示目录（见 derive_log_path），解析成绝对路径后保留
+        options["log_spec"] = str(log_path) + (log_spec[-1] if log_spec[-1] in "/\\" else "")
+
+    params = {"input": str(inp), "options": options}
+    if kind == "timelapse":
+        if payload.get("output"):
+            if not isinstance(payload["output"], str):
+                raise ValueError("output 需要是字符串")
+            output = Path(payload["output"]).expanduser().resolve()
+            if not _inside(output.parent, writable):
+                raise ValueError(f"输出只能写到输入所在文件夹或服务允许的文件夹里：{output}")
+            params["output"] = str(output)
+    else:
+        params["pattern"] = payload.get("pattern") or sc.DEFAULT_PATTERN
+        params["recurse"] = bool(payload.get("recurse", sc.DEFAULT_RECURSE))
+        params["exclude"] = payload.get("exclude")
+        params["resume"] = bool(payload.get("resume", False))
+        if kind == "merge":
+            params["merge_strategy"] = payload.get("merge_strategy") or sc.DEFAULT_MERGE_STRATEGY
+            if params["merge_strategy"] not in MERGE_STRATEGIES:
+                raise ValueError(f"merge_strategy 只支持 {'/'.join(MERGE_STRATEGIES)}")
+    return kind, params, priority
+
+
+async def run_job(job: dict, on_progress=None) -> dict:
+    """用异步 API 执行一个任务，返回可写入 JSON 的结果"""
+    params = job["params"]
+    options = sc.TimelapseOptions(**params["options"])
+    if job["kind"] == "timelapse":
+        output, stats = await sc.timelapse_async(
+            Path(params["input"]), options,
+            output_path=Path(params["output"]) if params.get("output") else None,
+            on_progress=on_progress,
+        )
+        return {"output": str(output), "stats": stats}
+    if job["kind"] == "merge":
+        output = await sc.merge_async(
+            Path(params["input"]), options, pattern=params["pattern"], recurse=params["recurse"],
+            exclude=params["exclude"], merge_strategy=params["merge_strategy"], resume=params["resume"],
+            on_progress=on_progress,
+        )
+        return {"output": str(output) if output else None}
+    ok, fail = await sc.batch_async(
+        Path(params["input"]), options, pattern=params["pattern"], recurse=params["recurse"],
+        exclude=params["exclude"], resume=params["resume"], on_progress=on_progress,
+    )
+    return {"outputs": [str(p) for p in ok], "failed": [{"input": str(p), "error": err} for p, err in fail]}
+
+
+# ----------------- HTTP 接口 -----------------
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """self.server.ctx：{"queue", "notify", "cancel", "progress", "roots"}，由 serve 设置"""
+
+    def _reply(self, status: int, body) -> None:
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_view(self, job: dict) -> dict:
+        job = dict(job)
+        job["progress"] = self.server.ctx["progress"].get(job["id"])
+        return job
+
+    def _job_id(self, part: str) -> int | None:
+        try:
+            return int(part)
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        queue = self.server.ctx["queue"]
+        if parts == ["jobs"]:
+            state = parse_qs(url.query).get("state", [None])[0]
+            return self._reply(200, [self._job_view(j) for j in list_jobs(queue, state)])
+        if len(parts) == 2 and parts[0] == "jobs":
+            job_id = self._job_id(parts[1])
+            job = get_job(queue, job_id) if job_id is not None else None
+            if job is None:
+                return self._reply(404, {"error": f"没有任务 {parts[1]}"})
+            return self._reply(200, self._job_view(job))
+        return self._reply(404, {"error": "未知的接口"})
+
+    def do_POST(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        ctx = self.server.ctx
+        if parts == ["jobs"]:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                kind, params, priority = build_job(payload, ctx["roots"])
+            except (ValueError, TypeError) as e:
+                return self._reply(400, {"error": str(e)})
+            job = add_job(ctx["queue"], kind, params, priority)
+            ctx["notify"]()
+            return self._reply(201, self._job_view(job))
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            job_id = self._job_id(parts[1])
+            job = get_job(ctx["queue"], job_id) if job_id is not None else None
+            if job is None:
+                return self._reply(404, {"error": f"没有任务 {parts[1]}"})
+            if not ctx["cancel"](job_id):
+                job = get_job(ctx["queue"], job_id)
+                return self._reply(409, {"error": f"任务 {job_id} 已结束（{job['state']}）"})
+            return self._reply(202, self._job_view(get_job(ctx["queue"], job_id)))
+        return self._reply(404, {"error": "未知的接口"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+# ----------------- 服务 -----------------
+async def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    workers: int = DEFAULT_WORKERS,
+    db_path: Path | None = None,
+    log=print,
+    roots: list[Path] | None = None,
+) -> None:
+    """
+    常驻运行：HTTP 接口在后台线程里，任务在事件循环里由 workers 个工作者处理
+    port 为 0 时由系统分配空闲端口，实际端口见启动日志
+    roots：允许读写的文件夹（见 build_job）
+    """
+    sc.set_async_jobs(workers)  # 引擎线程池与工作者一样多，领到的任务都能马上开始
+    queue = open_queue(db_path or sc.cache_dir() / QUEUE_FILE)
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    running: dict[int, asyncio.Task] = {}
+    progress: dict[int, float] = {}
+    user_cancelled: set[int] = set()
+
+    def _notify():
+        loop.call_soon_threadsafe(wake.set)
+
+    async def _cancel_on_loop(job_id: int) -> bool:
+        # running / user_cancelled 只在事件循环里读写，与工作者的领取、收尾不会交错
+        if cancel_queued_job(queue, job_id):
+            log(f"[信息] 任务 #{job_id} 已取消（未开始）")
+            return True
+        job = get_job(queue, job_id)
+        if job is None or job["state"] != "running":
+            return False
+        if job_id not in user_cancelled:
+            user_cancelled.add(job_id)
+            task = running.get(job_id)
+            if task is not None:
+                task.cancel()
+            # 已领取但还没开始执行：工作者开始前看到 user_cancelled，直接按已取消结束
+        return True
+
+    def _cancel(job_id: int) -> bool:
+        """HTTP 线程调用：取消的判断与操作交给事件循环执行"""
+        return asyncio.run_coroutine_threadsafe(_cancel_on_loop(job_id), loop).result()
+
+    async def _worker():
+        while True:
+            wake.clear()
+            job = claim_job(queue)
+            if job is None:
+                await wake.wait()
+                continue
+            job_id = job["id"]
+            log(f"[信息] 任务 #{job_id} 开始（{job['kind']}，优先级 {job['priority']}）：{job['input']}")
+
+            def _progress(fraction, info, job_id=job_id):
+                progress[job_id] = round(fraction, 4)
+
+            running[job_id] = asyncio.create_task(run_job(job, on_progress=_progress))
+            if job_id in user_cancelled:
+                running[job_id].cancel()
+            try:
+                result = await running[job_id]
+            except asyncio.CancelledError:
+                if job_id not in user_cancelled:
+                    # 服务正在退出：任务回到队列，下次启动继续
+                    requeue_job(queue, job_id)
+                    log(f"[信息] 任务 #{job_id} 未完成，已放回队列（下次启动时重新处理）")
+                    raise
+                finish_job(queue, job_id, "cancelled")
+                log(f"[信息] 任务 #{job_id} 已取消")
+            except Exception as e:
+                finish_job(queue, job_id, "failed", error=str(e) or type(e).__name__)
+                log(f"[失败] 任务 #{job_id}：{e}")
+            else:
+                finish_job(queue, job_id, "done", result=result)
+                log(f"[完成] 任务 #{job_id}：{result.get('output') or result}")
+            finally:
+                running.pop(job_id, None)
+                progress.pop(job_id, None)
+                user_cancelled.discard(job_id)
+
+    httpd = ThreadingHTTPServer((host, port), JobRequestHandler)
+    httpd.daemon_threads = True
+    httpd.ctx = {"queue": queue, "notify": _notify, "cancel": _cancel, "progress": progress, "roots": roots or []}
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    log(f"[信息] 任务服务已启动：http://{host}:{httpd.server_address[1]}（工作者 {workers} 个）")
+    log(f"[信息] 任务队列：{queue['path']}")
+    if roots:
+        log(f"[信息] 允许读写的文件夹：{'；'.join(str(r) for r in roots)}")
+    elif host not in ("127.0.0.1", "localhost", "::1"):
+        log("[警告] 接口没有鉴权且对外监听：任何人都能提交任务读取本机的视频，建议用 --root 限定文件夹")
+    if queue["requeued"]:
+        log(f"[信息] 上次退出时未完成的 {queue['requeued']} 个任务已重新排队")
+    try:
+        await asyncio.gather(*(_worker() for _ in range(workers)))
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        queue["conn"].close()
+
+
+# ----------------- 客户端 -----------------
+def call_server(server: str, method: str, path: str, payload=None):
+    """调用任务服务接口，返回解析后的 JSON；出错时抛 RuntimeError（带服务端的错误信息）"""
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(server.rstrip("/") + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        try:
+            msg = json.loads(e.read()).get("error")
+        except ValueError:
+            msg = None
+        raise RuntimeError(msg or f"HTTP {e.code}")
+    except urllib.error.URLError as e:
+        raise RuntimeError(f"无法连接任务服务 {server}：{e.reason}")
+
+
+def format_job(job: dict) -> str:
+    state = job["state"]
+    if state == "running" and job.get("progress") is not None:
+        state += f" {job['progress'] * 100:.0f}%"
+    line = f"#{job['id']:<4} {state:<13} {job['kind']:<9} 优先级 {job['priority']:<3} {job['input']}"
+    result = job.get("result") or {}
+    if result.get("output"):
+        line += f" → {result['output']}"
+    elif result.get("outputs") is not None:
+        line += f" → 成功 {len(result['outputs'])} 个，失败 {len(result['failed'])} 个"
+    if job.get("error"):
+        line += f"\n      错误：{job['error']}"
+    return line
+
+
+def wait_job(server: str, job_id: int, interval: float = DEFAULT_POLL_INTERVAL) -> dict:
+    """等待任务结束，期间显示状态变化/进度"""
+    last = None
+    while True:
+        job = call_server(server, "GET", f"/jobs/{job_id}")
+        shown = (job["state"], job.get("progress"))
+        if shown != last:
+            print(f"[进度] {format_job(job)}")
+            last = shown
+        if job["state"] not in ("queued", "running"):
+            return job
+        time.sleep(interval)
+
+
+def submit_payload(args) -> dict:
+    """把 submit 的命令行参数转成提交内容；没指定的参数不发送（由服务端按配置区默认值处理）"""
+    kind = "merge" if args.merge else "batch" if args.batch else "timelapse"
+    options = {
+        "target_seconds": args.target,
+        "out_fps": args.fps,
+        "res": args.res,
+        "size": args.size,
+        "fit": args.fit,
+        "preset": args.preset,
+        "target_bitrate": args.target_bitrate,
+        "jobs": args.jobs,
+        "deadline": args.deadline,
+        "skip_existing": args.skip_existing or None,
+        "quiet": args.quiet or None,
+        "log_spec": args.log,
+    }
+    payload = {
+        "kind": kind,
+        # 服务与客户端在同一台机器（或共享盘路径一致）时，相对路径按客户端当前目录解析
+        "input": str(Path(args.input).expanduser().resolve()),
+        "priority": args.priority,
+        "options": {k: v for k, v in options.items() if v is not None},
+    }
+    if args.output:
+        payload["output"] = str(Path(args.output).expanduser().resolve())
+    if kind != "timelapse":
+        payload.update(pattern=args.pattern, recurse=args.recurse, exclude=args.exclude, resume=args.resume)
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HumanLapse 本地渲染任务服务（serve）与客户端（submit/status/cancel）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="启动任务服务（常驻，Ctrl+C 退出；运行中的任务下次启动时重新处理）")
+    p.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址（默认 {DEFAULT_HOST}，仅本机）")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"端口（默认 {DEFAULT_PORT}）")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"同时处理的任务数（默认 {DEFAULT_WORKERS}）")
+    p.add_argument("--db", default=None, help=f"任务队列文件（默认在缓存目录里的 {QUEUE_FILE}）")
+    p.add_argument("--root", action="append", default=None,
+                   help="只允许读写这些文件夹里的文件（可多次指定）。不指定时输出/日志只能写在输入所在文件夹")
+    p.add_argument("--priority", choices=list(sc.PRIORITY_NICE), default=sc.DEFAULT_PRIORITY,
+                   help="ffmpeg 的进程优先级（同主程序 --priority）")
+    p.add_argument("--cpus", default=sc.DEFAULT_CPUS, help="只用这些 CPU（同主程序 --cpus）")
+    p.add_argument("--threads", default=sc.DEFAULT_THREADS, help="每个 ffmpeg 的线程上限（同主程序 --threads）")
+    p.add_argument("--adaptive", type=float, nargs="?", const=0.5, default=sc.DEFAULT_ADAPTIVE_LOAD,
+                   help="其它程序占用 CPU 时自动暂停渲染（同主程序 --adaptive）")
+
+    server_help = f"任务服务地址（默认 http://{DEFAULT_HOST}:{DEFAULT_PORT}）"
+    default_server = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+    p = sub.add_parser("submit", help="提交任务")
+    p.add_argument("input", help="视频文件；配合 --merge / --batch 时为文件夹")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--merge", action="store_true", help="合并模式：拼接文件夹里的视频后加速")
+    mode.add_argument("--batch", action="store_true", help="批量模式：文件夹里的视频逐个加速")
+    p.add_argument("-o", "--output", default=None, help="输出路径（仅单文件）")
+    p.add_argument("-t", "--target", default=None, help="目标时长，如 30 / 1:30")
+    p.add_argument("--fps", type=int, default=None)
+    p.add_argument("--res", default=None, help="source / 1080p / 720p / 4k")
+    p.add_argument("--size", default=None, help="自定义分辨率，如 1920x1080")
+    p.add_argument("--fit", default=None, help="contain / pad / crop / stretch")
+    p.add_argument("--preset", choices=sc.X264_PRESETS, default=None)
+    p.add_argument("--target-bitrate", default=None)
+    p.add_argument("--jobs", type=int, default=None, help="单个任务内的分段并行数")
+    p.add_argument("--deadline", default=None, help="截止时间（从任务开始处理时算起），如 10:00")
+    p.add_argument("--skip-existing", action="store_true")
+    p.add_argument("--quiet", action="store_true")
+    p.add_argument("--log", nargs="?", const="AUTO", default=None, help="写日志文件（同主程序 --log）")
+    p.add_argument("--pattern", default=sc.DEFAULT_PATTERN)
+    p.add_argument("--recurse", action="store_true")
+    p.add_argument("--exclude", action="append", default=None)
+    p.add_argument("--resume", action="store_true")
+    p.add_argument("--priority", type=int, default=0, help="队列优先级，大的先处理（默认 0）")
+    p.add_argument("--wait", action="store_true", help="等待任务结束并显示进度")
+    p.add_argument("--server", default=default_server, help=server_help)
+
+    p = sub.add_parser("status", help="查看任务（不带 ID 时列出最近的任务）")
+    p.add_argument("job_id", type=int, nargs="?")
+    p.add_argument("--state", choices=["queued", "running", "done", "failed", "cancelled"], default=None)
+    p.add_argument("--json", action="store_true", help="输出原始 JSON")
+    p.add_argument("--server", default=default_server, help=server_help)
+
+    p = sub.add_parser("cancel", help="取消任务")
+    p.add_argument("job_id", type=int)
+    p.add_argument("--server", default=default_server, help=server_help)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.workers < 1:
+            raise SystemExit("[错误] --workers 至少为 1")
+        if not 0 <= args.adaptive < 1:
+            raise SystemExit("[错误] --adaptive 需要在 0 到 1 之间（如 0.5 = 其它程序占用超过一半 CPU 时暂停）")
+        try:
+            sc.configure_governor(priority=args.priority, cpus=args.cpus, threads=args.threads,
+                                  adaptive_load=args.adaptive)
+        except ValueError as e:
+            raise SystemExit(f"[错误] 资源控制参数不合法：{e}")
+        roots = [Path(r).expanduser().resolve() for r in args.root or []]
+        for root in roots:
+            if not root.is_dir():
+                raise SystemExit(f"[错误] --root 文件夹不存在：{root}")
+        try:
+            asyncio.run(serve(args.host, args.port, args.workers, Path(args.db) if args.db else None, roots=roots))
+        except OSError as e:
+            raise SystemExit(f"[错误] 无法启动任务服务：{e}")
+        except KeyboardInterrupt:
+            print("[信息] 任务服务已退出")
+        return
+
+    try:
+        if args.command == "submit":
+            job = call_server(args.server, "POST", "/jobs", submit_payload(args))
+            print(f"[信息] 已提交：{format_job(job)}")
+            if args.wait:
+                job = wait_job(args.server, job["id"])
+                if job["state"] != "done":
+                    sys.exit(1)
+        elif args.command == "status":
+            if args.job_id is not None:
+                jobs = [call_server(args.server, "GET", f"/jobs/{args.job_id}")]
+            else:
+                jobs = call_server(args.server, "GET", "/jobs" + (f"?state={args.state}" if args.state else ""))
+            if args.json:
+                print(json.dumps(jobs if args.job_id is None else jobs[0], ensure_ascii=False, indent=2))
+            else:
+                for job in jobs:
+                    print(format_job(job))
+                if not jobs:
+                    print("[信息] 没有任务")
+        elif args.command == "cancel":
+            job = call_server(args.server, "POST", f"/jobs/{args.job_id}/cancel")
+            print(f"[信息] 已请求取消：{format_job(job)}")
+    except RuntimeError as e:
+        raise SystemExit(f"[错误] {e}")
+
+
+if __name__ == "__main__":
+    main()
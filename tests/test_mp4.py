@@ -0,0 +1,286 @@
+"""MP4/MOV 原生解析与分片追加：用 struct.pack 拼出的最小 box 结构测试，不需要 ffmpeg"""
+
+import struct
+
+import pytest
+
+import speed_controller as sc
+
+IDENTITY = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+# ----------------- box 构造 -----------------
+def box(box_type: bytes, *children: bytes) -> bytes:
+    body = b"".join(children)
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+
+def box64(box_type: bytes, *children: bytes) -> bytes:
+    """64 位大小的 box（size 字段为 1，真实大小放在 largesize）"""
+    body = b"".join(children)
+    return struct.pack(">I4sQ", 1, box_type, 16 + len(body)) + body
+
+
+def full_box(box_type: bytes, version: int, flags: int, *children: bytes) -> bytes:
+    return box(box_type, bytes([version]) + flags.to_bytes(3, "big"), *children)
+
+
+def time_header(box_type: bytes, timescale: int, duration: int, version: int = 0) -> bytes:
+    """mvhd/mdhd：只填到 timescale、duration 为止"""
+    if version == 1:
+        return full_box(box_type, 1, 0, struct.pack(">QQIQ", 0, 0, timescale, duration))
+    return full_box(box_type, 0, 0, struct.pack(">IIII", 0, 0, timescale, duration))
+
+
+def tkhd(track_id: int, matrix=IDENTITY, version: int = 0) -> bytes:
+    if version == 1:
+        head = struct.pack(">QQIIQ", 0, 0, track_id, 0, 0)
+    else:
+        head = struct.pack(">IIIII", 0, 0, track_id, 0, 0)
+    return full_box(b"tkhd", version, 7, head, bytes(16), struct.pack(">9i", *matrix), struct.pack(">II", 0, 0))
+
+
+def hdlr(handler: bytes) -> bytes:
+    return full_box(b"hdlr", 0, 0, bytes(4), handler, bytes(12), b"\0")
+
+
+def visual_entry(width: int, height: int, codec: bytes = b"avc1", extra: bytes = b"") -> bytes:
+    """视觉样本条目：固定 78 字节（宽高在第 24 字节起），之后是子 box"""
+    fixed = bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", width, height) + bytes(50)
+    return box(codec, fixed, extra)
+
+
+def stsd(*entries: bytes) -> bytes:
+    return full_box(b"stsd", 0, 0, struct.pack(">I", len(entries)), *entries)
+
+
+def stts(*runs: tuple[int, int]) -> bytes:
+    return full_box(b"stts", 0, 0, struct.pack(">I", len(runs)), *(struct.pack(">II", *r) for r in runs))
+
+
+def ctts(first_offset: int) -> bytes:
+    return full_box(b"ctts", 0, 0, struct.pack(">III", 1, 1, first_offset))
+
+
+def elst(*edits: tuple[int, int], rate=(1, 0), version: int = 0) -> bytes:
+    fmt = ">Qqhh" if version == 1 else ">Iihh"
+    return box(b"edts", full_box(b"elst", version, 0, struct.pack(">I", len(edits)),
+                                 *(struct.pack(fmt, duration, media, *rate) for duration, media in edits)))
+
+
+def trak(track_id: int, handler: bytes, timescale: int, *, entry: bytes = b"", edits: bytes = b"",
+         matrix=IDENTITY, samples=(), first_cto=None, version: int = 0, wrap=box) -> bytes:
+    stbl = [stsd(entry)] if entry else [stsd()]
+    if samples:
+        stbl.append(stts(*samples))
+    if first_cto is not None:
+        stbl.append(ctts(first_cto))
+    mdia = wrap(b"mdia", time_header(b"mdhd", timescale, 0, version), hdlr(handler),
+                box(b"minf", box(b"stbl", *stbl)))
+    return wrap(b"trak", tkhd(track_id, matrix, version), edits, mdia)
+
+
+def write_mp4(tmp_path, *boxes: bytes, name: str = "a.mp4"):
+    path = tmp_path / name
+    path.write_bytes(box(b"ftyp", b"isom", bytes(4)) + b"".join(boxes))
+    return str(path)
+
+
+def video_trak(**kwargs) -> bytes:
+    kwargs.setdefault("entry", visual_entry(1920, 1080))
+    kwargs.setdefault("samples", [(300, 1001)])
+    return trak(1, b"vide", 30000, **kwargs)
+
+
+# ----------------- 普通 MP4 -----------------
+@pytest.mark.parametrize("version", [0, 1])
+def test_read_mp4_info_header_versions(tmp_path, version):
+    path = write_mp4(tmp_path, box(b"moov", time_header(b"mvhd", 1000, 10010, version), video_trak(version=version)))
+    info = sc.read_mp4_info(path)
+    assert info["duration"] == pytest.approx(10.01)
+    assert (info["width"], info["height"], info["rotation"]) == (1920, 1080, 0)
+    assert info["fps"] == pytest.approx(30000 / 1001)
+    assert info["start_time"] == 0
+
+
+def test_read_mp4_info_64bit_box_sizes(tmp_path):
+    moov = box64(b"moov", time_header(b"mvhd", 1000, 4000), video_trak(wrap=box64))
+    info = sc.read_mp4_info(write_mp4(tmp_path, moov))
+    assert info["duration"] == pytest.approx(4.0)
+    assert (info["width"], info["height"]) == (1920, 1080)
+
+
+def test_read_mp4_info_skips_truncated_and_non_mp4(tmp_path):
+    assert sc.read_mp4_info(write_mp4(tmp_path, box(b"mdat", bytes(16)))) is None
+    moov = box(b"moov", time_header(b"mvhd", 1000, 4000), video_trak())
+    assert sc.read_mp4_info(write_mp4(tmp_path, moov[:-10])) is None
+    assert sc.read_mp4_info(write_mp4(tmp_path, moov, name="a.mkv")) is None
+
+
+@pytest.mark.parametrize("matrix, rotation, size", [
+    ((0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000), -90, (1080, 1920)),
+    ((0, -0x10000, 0, 0x10000, 0, 0, 0, 0, 0x40000000), 90, (1080, 1920)),
+    ((-0x10000, 0, 0, 0, -0x10000, 0, 0, 0, 0x40000000), -180, (1920, 1080)),
+])
+def test_read_mp4_info_rotation(tmp_path, matrix, rotation, size):
+    path = write_mp4(tmp_path, box(b"moov", time_header(b"mvhd", 1000, 4000), video_trak(matrix=matrix)))
+    info = sc.read_mp4_info(path)
+    assert info["rotation"] == rotation
+    assert (info["width"], info["height"]) == size
+
+
+def test_start_time_from_edit_list_and_ctts(tmp_path):
+    # 视频：B 帧重排，首帧显示时间 2002 被编辑起点 1001 裁掉一半 → 1001/30000
+    # 音频：0.5 秒空编辑 + AAC 预滚 1024（早于首个样本，被裁掉）→ 0.5
+    video = video_trak(edits=elst((4000, 1001)), first_cto=2002)
+    audio = trak(2, b"soun", 48000, edits=elst((500, -1), (4000, 1024)))
+    info = sc.read_mp4_info(write_mp4(tmp_path, box(b"moov", time_header(b"mvhd", 1000, 4500), video, audio)))
+    assert info["start_time"] == pytest.approx(1001 / 30000)
+    assert info["duration"] == pytest.approx(4.5)  # 最早的一轨没有空编辑，不扣
+
+
+def test_empty_edit_delays_every_track(tmp_path):
+    video = video_trak(edits=elst((250, -1), (4000, 0), version=1))
+    audio = trak(2, b"soun", 48000, edits=elst((500, -1), (4000, 0)))
+    info = sc.read_mp4_info(write_mp4(tmp_path, box(b"moov", time_header(b"mvhd", 1000, 4500), video, audio)))
+    assert info["start_time"] == pytest.approx(0.25)
+    assert info["duration"] == pytest.approx(4.25)  # 扣掉两轨中较短的空编辑
+
+
+@pytest.mark.parametrize("edits", [
+    elst((2000, 0), (2000, 3000)),
+    elst((4000, 0), rate=(2, 0)),
+])
+def test_unreadable_edit_list_falls_back(tmp_path, edits):
+    moov = box(b"moov", time_header(b"mvhd", 1000, 4000), video_trak(edits=edits))
+    with pytest.raises(ValueError):
+        sc._track_start_time(moov, *sc._find_box(moov, 8, len(moov), b"trak"), 1000)
+    info = sc.read_mp4_info(write_mp4(tmp_path, moov))
+    assert info["start_time"] is None  # 调用方改用 ffprobe
+    assert info["width"] == 1920
+
+
+# ----------------- 分片 MP4 -----------------
+def tfhd(track_id: int, flags: int = 0x20000, default_duration: int | None = None) -> bytes:
+    fields = [struct.pack(">I", track_id)]
+    if flags & 0x1:
+        fields.append(struct.pack(">Q", 0))
+    if flags & 0x2:
+        fields.append(struct.pack(">I", 1))
+    if flags & 0x8:
+        fields.append(struct.pack(">I", default_duration))
+    return full_box(b"tfhd", 0, flags, *fields)
+
+
+def trun(count: int, durations=None) -> bytes:
+    """durations 为 None 时不带逐样本时长（用默认时长）；带的话同时带上样本大小"""
+    if durations is None:
+        return full_box(b"trun", 0, 0x1, struct.pack(">Ii", count, 0))
+    samples = b"".join(struct.pack(">II", d, 100) for d in durations)
+    return full_box(b"trun", 0, 0x1 | 0x100 | 0x200, struct.pack(">Ii", len(durations), 0), samples)
+
+
+def tfdt(base: int, version: int = 0) -> bytes:
+    return full_box(b"tfdt", version, 0, struct.pack(">Q" if version == 1 else ">I", base))
+
+
+def moof(sequence: int, *trafs: bytes) -> bytes:
+    return box(b"moof", full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)), *trafs)
+
+
+def traf(track_id: int, base: int, run: bytes, flags: int = 0x20000, default_duration=None, version=0) -> bytes:
+    return box(b"traf", tfhd(track_id, flags, default_duration), tfdt(base, version), run)
+
+
+def fmp4_moov(trex_duration: int = 512, codec: bytes = b"avc1") -> bytes:
+    video = trak(1, b"vide", 15360, entry=visual_entry(320, 240, codec, box(b"btrt", bytes(12))))
+    mvex = box(b"mvex", full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, trex_duration, 0, 0)))
+    return box(b"moov", time_header(b"mvhd", 1000, 0), video, mvex)
+
+
+def write_fmp4(path, *fragments: bytes, moov: bytes | None = None, mfra: bool = True):
+    data = box(b"ftyp", b"iso5", bytes(4)) + (moov or fmp4_moov()) + b"".join(fragments)
+    if mfra:
+        data += box(b"mfra", full_box(b"mfro", 0, 0, struct.pack(">I", 16)))
+    path.write_bytes(data)
+    return path
+
+
+def test_fmp4_layout_default_durations(tmp_path):
+    first = moof(1, traf(1, 0, trun(30)))  # trex 默认时长 512
+    second = moof(2, traf(1, 30 * 512, trun(30), flags=0x20000 | 0x2 | 0x8, default_duration=256))
+    mdat = box(b"mdat", bytes(64))
+    path = write_fmp4(tmp_path / "a.mp4", first, mdat, second, mdat)
+    layout = sc.read_fmp4_layout(path)
+    assert layout["tracks"][1]["timescale"] == 15360
+    assert layout["tracks"][1]["end"] == 30 * 512 + 30 * 256
+    assert layout["sequence"] == 2
+
+    start = len(box(b"ftyp", b"iso5", bytes(4))) + len(fmp4_moov())
+    assert layout["fragments"] == (start, start + len(first) + len(second) + 2 * len(mdat))
+    assert sorted(layout["moofs"]) == [start, start + len(first) + len(mdat)]
+
+
+def test_fmp4_layout_sample_durations_and_64bit_tfdt(tmp_path):
+    path = write_fmp4(tmp_path / "a.mp4", moof(7, traf(1, 1 << 33, trun(3, [100, 200, 300]), version=1)),
+                      box(b"mdat", bytes(8)))
+    layout = sc.read_fmp4_layout(path)
+    assert layout["tracks"][1]["end"] == (1 << 33) + 600
+    assert layout["sequence"] == 7
+    [(kind, _, _), (track, _, version)] = next(iter(layout["moofs"].values()))
+    assert (kind, track, version) == ("mfhd", 1, 1)
+
+
+def test_fmp4_layout_rejects_absolute_offsets_and_plain_mp4(tmp_path):
+    path = write_fmp4(tmp_path / "a.mp4", moof(1, traf(1, 0, trun(30), flags=0x1)), box(b"mdat", bytes(8)))
+    assert sc.read_fmp4_layout(path) is None
+    plain = write_mp4(tmp_path, box(b"moov", time_header(b"mvhd", 1000, 4000), video_trak()))
+    assert sc.read_fmp4_layout(plain) is None
+
+
+def _fields(path):
+    """各 moof 的 (mfhd 序号, 轨道 1 的 tfdt)"""
+    data = path.read_bytes()
+    layout = sc.read_fmp4_layout(path)
+    result = []
+    for start in sorted(layout["moofs"]):
+        values = {}
+        for kind, pos, version in layout["moofs"][start]:
+            values[kind] = struct.unpack_from(">Q" if version == 1 else ">I", data, pos)[0]
+        result.append((values["mfhd"], values[1]))
+    return result
+
+
+def test_append_fragments_rewrites_sequence_and_tfdt(tmp_path):
+    mdat = box(b"mdat", b"head" * 4)
+    head = write_fmp4(tmp_path / "head.mp4", moof(1, traf(1, 0, trun(30))), mdat,
+                      moof(2, traf(1, 30 * 512, trun(30))), mdat)
+    tail_mdat = box(b"mdat", b"tail" * 4)
+    tail = write_fmp4(tmp_path / "tail.mp4", moof(1, traf(1, 0, trun(3, [512, 512, 512]))), tail_mdat,
+                      moof(2, traf(1, 1536, trun(3, [512, 512, 512]))), tail_mdat)
+    head_fragments_end = sc.read_fmp4_layout(head)["fragments"][1]
+
+    sc.append_fragments(head, tail)
+
+    assert _fields(head) == [(1, 0), (2, 15360), (3, 30720), (4, 30720 + 1536)]
+    data = head.read_bytes()
+    assert b"mfra" not in data  # 旧的随机访问索引被截掉
+    assert data.endswith(tail_mdat) and data[:head_fragments_end].endswith(mdat)
+    assert sc.read_fmp4_layout(head)["tracks"][1]["end"] == 30720 + 3072
+
+
+def test_append_fragments_rejects_mismatch_and_restores(tmp_path):
+    head = write_fmp4(tmp_path / "head.mp4", moof(1, traf(1, 0, trun(30))), box(b"mdat", bytes(8)))
+    before = head.read_bytes()
+
+    # 编码参数不同（btrt 不算）
+    other = write_fmp4(tmp_path / "hevc.mp4", moof(1, traf(1, 0, trun(3))), box(b"mdat", bytes(8)),
+                       moov=fmp4_moov(codec=b"hvc1"))
+    with pytest.raises(ValueError, match="编码参数"):
+        sc.append_fragments(head, other)
+
+    # 平移后超出 32 位 tfdt：报错并把已写的部分撤回
+    overflow = write_fmp4(tmp_path / "big.mp4", moof(1, traf(1, (1 << 32) - 100, trun(3))), box(b"mdat", bytes(8)))
+    with pytest.raises(ValueError, match="32 位"):
+        sc.append_fragments(head, overflow)
+    assert head.read_bytes() == before
@@ -0,0 +1,106 @@
+"""帧数分配、分段/分块规划与实时模式帧池（纯函数，不需要 ffmpeg）"""
+
+import pytest
+
+import speed_controller as sc
+
+
+# ----------------- plan_frame_budgets -----------------
+@pytest.mark.parametrize("durations, frame_count, expected", [
+    ([10.0, 10.0, 10.0], 10, [4, 3, 3]),
+    ([1.0, 2.0, 7.0], 10, [1, 2, 7]),
+    ([0.4, 0.4, 9.2], 10, [1, 0, 9]),  # 小数部分相同时先给前面的文件
+    ([5.0], 7, [7]),
+    ([3.0, 0.0, 3.0], 5, [3, 0, 2]),
+])
+def test_plan_frame_budgets(durations, frame_count, expected):
+    assert sc.plan_frame_budgets(durations, frame_count) == expected
+
+
+def test_plan_frame_budgets_sum_matches_frame_count():
+    durations = [0.7 + (i * 37 % 11) for i in range(23)]
+    for frame_count in (1, 23, 900, 1801):
+        budgets = sc.plan_frame_budgets(durations, frame_count)
+        assert sum(budgets) == frame_count
+        for d, b in zip(durations, budgets):
+            assert abs(b - d / sum(durations) * frame_count) < 1
+
+
+def test_plan_frame_budgets_rejects_zero_duration():
+    with pytest.raises(ValueError):
+        sc.plan_frame_budgets([0.0, 0.0], 10)
+
+
+# ----------------- plan_chunks / plan_segments -----------------
+def test_plan_chunks_aligns_to_gop():
+    gop = sc.CHUNK_GOP_FRAMES
+    chunks = sc.plan_chunks(1800, 30, 20)  # 600 帧 → 取 GOP 的整数倍
+    assert [count for _, count in chunks[:-1]] == [2 * gop] * (len(chunks) - 1)
+    assert chunks[0][0] == 0
+    assert all(a[0] + a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert sum(count for _, count in chunks) == 1800
+
+
+def test_plan_chunks_shorter_than_gop_and_single_chunk():
+    assert sc.plan_chunks(100, 30, 1) == [(0, 30), (30, 30), (60, 30), (90, 10)]
+    assert sc.plan_chunks(100, 30, 60) == [(0, 100)]
+    assert sc.plan_chunks(5, 30, 0.01) == [(i, 1) for i in range(5)]
+
+
+def test_plan_segments_splits_evenly_with_one_second_minimum():
+    assert sc.plan_segments(100, 3, 30) == [(0, 34), (34, 33), (67, 33)]
+    assert sc.plan_segments(45, 4, 30) == [(0, 45)]
+    assert sc.plan_segments(60, 8, 30) == [(0, 30), (30, 30)]
+
+
+def test_plan_seek_runs_breaks_at_keyframes():
+    times = [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    assert sc.plan_seek_runs(times, [0.0, 2.5, 2.7]) == [(0, 3), (3, 3)]
+    assert sc.plan_seek_runs(times, [0.0]) == [(0, 6)]
+    assert sc.plan_seek_runs([], [0.0]) == []
+
+
+# ----------------- make_frame_pool -----------------
+def _frames(tmp_path, times):
+    paths = []
+    for t in times:
+        path = tmp_path / f"{t:08.3f}.jpg"
+        path.write_bytes(b"")
+        paths.append(path)
+    return paths
+
+
+def test_frame_pool_keeps_one_frame_per_bucket(tmp_path):
+    add, pick, status = sc.make_frame_pool(limit=100, step=1.0)
+    times = [0.0, 0.3, 1.1, 1.9, 2.0, 4.5]
+    for t, path in zip(times, _frames(tmp_path, times)):
+        add(t, path)
+    assert status() == (4, 1.0)
+    kept = sorted(p.name for p in tmp_path.iterdir())
+    assert kept == ["0000.000.jpg", "0001.100.jpg", "0002.000.jpg", "0004.500.jpg"]
+
+
+def test_frame_pool_doubles_spacing_over_limit(tmp_path):
+    add, pick, status = sc.make_frame_pool(limit=8, step=0.5)
+    times = [i * 0.5 for i in range(40)]
+    for t, path in zip(times, _frames(tmp_path, times)):
+        add(t, path)
+        kept, spacing = status()
+        assert kept <= 8
+        # 帧间隔始终在 [录制时长/limit, 2×录制时长/limit] 之间
+        assert spacing <= max(0.5, 2 * (t + 0.5) / 8)
+    kept, spacing = status()
+    assert spacing == 4.0
+    assert kept == len(list(tmp_path.iterdir())) == 5
+
+
+def test_frame_pool_pick_matches_seek_rule(tmp_path):
+    add, pick, status = sc.make_frame_pool(limit=100, step=1.0)
+    times = [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    paths = _frames(tmp_path, times)
+    for t, path in zip(times, paths):
+        add(t, path)
+    # 每个输出帧取不晚于区间中点 (n + 0.5) × 间隔 的最后一帧
+    assert pick(6.0, 3) == [paths[1], paths[3], paths[5]]
+    assert pick(6.0, 4) == [paths[0], paths[2], paths[3], paths[5]]
+    assert pick(0.5, 2) == [paths[0], paths[0]]
@@ -0,0 +1,237 @@
+"""任务服务：参数校验、队列顺序、重启续跑与取消（引擎用桩函数代替，不需要 ffmpeg）"""
+
+import asyncio
+import re
+import threading
+import time
+
+import pytest
+
+import speed_controller as sc
+import speed_controller_server as srv
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "rec" / "a.mp4"
+    path.parent.mkdir()
+    path.write_bytes(b"\0" * 16)
+    return path
+
+
+def wait_until(check, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.02)
+    raise AssertionError("等待超时")
+
+
+# ----------------- build_job -----------------
+def test_build_job_accepts_valid_options(video):
+    kind, params, priority = srv.build_job({
+        "input": str(video),
+        "output": str(video.with_name("out.mp4")),
+        "priority": "3",
+        "options": {"target_seconds": "1:30", "out_fps": 30, "seek_speed": 50, "quiet": True, "size": None},
+    })
+    assert kind == "timelapse"
+    assert priority == 3
+    assert params["output"] == str(video.with_name("out.mp4"))
+    assert params["options"]["target_seconds"] == 90
+    # 整数可以当 float 字段的值
+    assert sc.TimelapseOptions(**params["options"]).seek_speed == 50
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"out_fps": 0}, "out_fps"),
+    ({"out_fps": 29.97}, "out_fps"),
+    ({"jobs": "4"}, "jobs"),
+    ({"jobs": 0}, "jobs"),
+    ({"quiet": "no"}, "quiet"),
+    ({"use_intermediate": 1}, "use_intermediate"),
+    ({"target_seconds": True}, "target_seconds"),
+    ({"target_seconds": 0}, "target_seconds"),
+    ({"deadline": -5}, "deadline"),
+    ({"preset": "turbo"}, "preset"),
+    ({"sampler": "magic"}, "sampler"),
+    ({"res": "8k"}, "res"),
+    ({"fit": "zoom"}, "fit"),
+    ({"size": 1080}, "size"),
+    ({"bogus": 1}, "bogus"),
+])
+def test_build_job_rejects_bad_options(video, options, message):
+    with pytest.raises(ValueError, match=message):
+        srv.build_job({"input": str(video), "options": options})
+
+
+def test_build_job_restricts_output_and_log(video, tmp_path):
+    elsewhere = tmp_path / "elsewhere"
+    elsewhere.mkdir()
+    with pytest.raises(ValueError, match="输出"):
+        srv.build_job({"input": str(video), "output": str(elsewhere / "x.mp4")})
+    with pytest.raises(ValueError, match="日志"):
+        srv.build_job({"input": str(video), "options": {"log_spec": str(elsewhere) + "/"}})
+    with pytest.raises(ValueError, match="输出"):
+        srv.build_job({"input": str(video), "output": str(video.parent / ".." / "x.mp4")})
+
+    # 输入所在文件夹、--root 指定的文件夹可以写；目录形式的 log_spec 保留结尾的分隔符
+    _, params, _ = srv.build_job({"input": str(video), "options": {"log_spec": "AUTO"}})
+    assert params["options"]["log_spec"] == "AUTO"
+    _, params, _ = srv.build_job(
+        {"input": str(video), "output": str(elsewhere / "x.mp4"), "options": {"log_spec": str(elsewhere) + "/"}},
+        roots=[tmp_path],
+    )
+    assert params["output"] == str(elsewhere / "x.mp4")
+    assert params["options"]["log_spec"] == str(elsewhere) + "/"
+
+    # 指定了 roots 时输入也必须在其中
+    with pytest.raises(ValueError, match="输入"):
+        srv.build_job({"input": str(video)}, roots=[elsewhere])
+
+
+def test_build_job_checks_kind_and_input(video):
+    with pytest.raises(ValueError, match="kind"):
+        srv.build_job({"kind": "render", "input": str(video)})
+    with pytest.raises(ValueError, match="文件夹"):
+        srv.build_job({"kind": "batch", "input": str(video)})
+    kind, params, _ = srv.build_job({"kind": "merge", "input": str(video.parent), "merge_strategy": "parallel"})
+    assert (kind, params["merge_strategy"], params["pattern"]) == ("merge", "parallel", sc.DEFAULT_PATTERN)
+
+
+# ----------------- 队列 -----------------
+def test_claim_job_orders_by_priority_then_submission(tmp_path):
+    queue = srv.open_queue(tmp_path / "jobs.sqlite3")
+    ids = [srv.add_job(queue, "timelapse", {"input": f"{i}.mp4"}, priority)["id"]
+           for i, priority in enumerate([0, 5, 5, 1])]
+    claimed = []
+    while (job := srv.claim_job(queue)) is not None:
+        assert job["state"] == "running" and job["started"] is not None
+        claimed.append(job["id"])
+    assert claimed == [ids[1], ids[2], ids[3], ids[0]]
+    queue["conn"].close()
+
+
+def test_running_jobs_are_requeued_on_restart(tmp_path):
+    db = tmp_path / "jobs.sqlite3"
+    queue = srv.open_queue(db)
+    first = srv.add_job(queue, "timelapse", {"input": "a.mp4"})
+    srv.add_job(queue, "timelapse", {"input": "b.mp4"})
+    assert srv.claim_job(queue)["id"] == first["id"]
+    queue["conn"].close()
+
+    queue = srv.open_queue(db)
+    assert queue["requeued"] == 1
+    job = srv.get_job(queue, first["id"])
+    assert job["state"] == "queued" and job["started"] is None
+    assert srv.claim_job(queue)["id"] == first["id"]
+    queue["conn"].close()
+
+
+def test_cancel_queued_job_only_while_queued(tmp_path):
+    queue = srv.open_queue(tmp_path / "jobs.sqlite3")
+    a = srv.add_job(queue, "timelapse", {"input": "a.mp4"})
+    b = srv.add_job(queue, "timelapse", {"input": "b.mp4"})
+    srv.claim_job(queue)
+    assert not srv.cancel_queued_job(queue, a["id"])
+    assert srv.cancel_queued_job(queue, b["id"])
+    assert srv.get_job(queue, b["id"])["state"] == "cancelled"
+    assert srv.claim_job(queue) is None
+    queue["conn"].close()
+
+
+# ----------------- 服务（HTTP + 工作者） -----------------
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """在后台线程里运行 serve（端口由系统分配），sc.timelapse_async 换成等待 release 的桩函数"""
+    monkeypatch.setenv("HUMANLAPSE_CACHE_DIR", str(tmp_path / "cache"))
+    started, release = [], threading.Event()
+
+    async def fake_timelapse(input_path, options=None, output_path=None, on_progress=None):
+        started.append(input_path.name)
+        if on_progress is not None:
+            on_progress(0.5, {})
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        return input_path.with_name(input_path.stem + "_out.mp4"), {"total": 0.0}
+
+    monkeypatch.setattr(sc, "timelapse_async", fake_timelapse)
+    lines = []
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(srv.serve("127.0.0.1", 0, 1, tmp_path / "jobs.sqlite3", log=lines.append))
+
+    def _run():
+        try:
+            loop.run_until_complete(task)
+        except BaseException:
+            pass
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    port = wait_until(lambda: next((m.group(1) for m in map(re.compile(r":(\d+)（").search, lines) if m), None))
+
+    def stop():
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(10)
+
+    ctx = {"url": f"http://127.0.0.1:{port}", "started": started, "release": release, "lines": lines,
+           "stop": stop, "db": tmp_path / "jobs.sqlite3"}
+    yield ctx
+    release.set()
+    stop()
+    loop.close()
+
+
+def _submit(server, video, **payload):
+    return srv.call_server(server["url"], "POST", "/jobs", {"input": str(video), **payload})
+
+
+def _state(server, job_id):
+    return srv.call_server(server["url"], "GET", f"/jobs/{job_id}")["state"]
+
+
+def test_server_rejects_bad_options_with_400(server, video):
+    with pytest.raises(RuntimeError, match="out_fps"):
+        _submit(server, video, options={"out_fps": 0})
+    with pytest.raises(RuntimeError, match="输出"):
+        _submit(server, video, output="/tmp/elsewhere/x.mp4")
+    assert srv.call_server(server["url"], "GET", "/jobs") == []
+
+
+def test_server_runs_and_reports_progress(server, video):
+    job = _submit(server, video, options={"out_fps": 30})
+    wait_until(lambda: _state(server, job["id"]) == "running")
+    assert wait_until(lambda: srv.call_server(server["url"], "GET", f"/jobs/{job['id']}")["progress"]) == 0.5
+    server["release"].set()
+    wait_until(lambda: _state(server, job["id"]) == "done")
+    result = srv.call_server(server["url"], "GET", f"/jobs/{job['id']}")["result"]
+    assert result["output"] == str(video.with_name("a_out.mp4"))
+
+
+def test_server_cancels_queued_and_running_jobs(server, video):
+    running = _submit(server, video)
+    queued = _submit(server, video)
+    wait_until(lambda: _state(server, running["id"]) == "running")
+
+    assert srv.call_server(server["url"], "POST", f"/jobs/{queued['id']}/cancel")["state"] == "cancelled"
+    srv.call_server(server["url"], "POST", f"/jobs/{running['id']}/cancel")
+    wait_until(lambda: _state(server, running["id"]) == "cancelled")
+    with pytest.raises(RuntimeError, match="已结束"):
+        srv.call_server(server["url"], "POST", f"/jobs/{running['id']}/cancel")
+
+    # 被取消的排队任务不会再被领取
+    server["release"].set()
+    time.sleep(0.2)
+    assert server["started"] == ["a.mp4"]
+
+
+def test_server_requeues_running_job_on_shutdown(server, video):
+    job = _submit(server, video)
+    wait_until(lambda: _state(server, job["id"]) == "running")
+    server["stop"]()
+    queue = srv.open_queue(server["db"])
+    assert queue["requeued"] == 0  # 退出时已放回队列，不是靠重启时的修复
+    assert srv.get_job(queue, job["id"])["state"] == "queued"
+    queue["conn"].close()